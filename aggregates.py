@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+
+from filters import FILTER_COLUMNS, FilterIndex
+
+# Dimensiones del cubo: las cuatro de los dropdowns más moneda y rating
+CUBE_DIMENSIONS = ['Empresa', 'Sector', 'Plazo', 'Nombre Entidad Acreedora', 'Tipo Moneda', 'Rating']
+
+# Máximo de valores distintos de la tasa para guardar histogramas exactos; sobre este número
+# se agrupan en intervalos por cuantiles globales y los cuartiles pasan a ser aproximados
+SKETCH_MAX_BINS = 2048
+
+# Sumas que guarda cada celda del cubo
+CELL_SUMS = ['rate_sum', 'rate_count', 'total_sum', 'rate_total_sum', 'rows']
+
+
+class RateSketch:
+    # Histogramas de 'Tasa Nominal' por celda del cubo (cuántas veces aparece cada valor de la
+    # tasa), guardados en forma dispersa. Son mergeables: la suma de los histogramas de varias
+    # celdas es el histograma de su unión, así que los cuartiles de cualquier selección se
+    # calculan sin recorrer filas
+
+    def __init__(self, rates, cell_ids, n_cells, max_bins=SKETCH_MAX_BINS):
+        rates = np.asarray(rates, dtype=float)
+        valid = ~np.isnan(rates)
+        rates, cell_ids = rates[valid], np.asarray(cell_ids, dtype=np.int64)[valid]
+        values = np.unique(rates)
+        if len(values) > max_bins:
+            edges = np.unique(np.quantile(rates, np.linspace(0, 1, max_bins + 1)))
+            bins = np.clip(np.searchsorted(edges, rates, side='right') - 1, 0, len(edges) - 2)
+            # Cada intervalo se representa por el promedio de sus valores
+            sizes = np.bincount(bins, minlength=len(edges) - 1)
+            values = np.bincount(bins, weights=rates, minlength=len(edges) - 1) / np.maximum(sizes, 1)
+        else:
+            bins = np.searchsorted(values, rates)
+        self.values = values
+        n_bins = max(len(values), 1)
+        # Pares (celda, valor) con su conteo, ordenados por celda; offsets delimita cada celda
+        keys, counts = np.unique(cell_ids * n_bins + bins, return_counts=True)
+        self.bins = keys % n_bins
+        self.counts = counts
+        self.offsets = np.searchsorted(keys // n_bins, np.arange(n_cells + 1))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.bins.nbytes + self.counts.nbytes + self.offsets.nbytes
+
+    def merge(self, cell_ids, groups, n_groups):
+        # Histograma sumado por grupo (filas) de las celdas indicadas; groups[i] es el grupo de
+        # cell_ids[i]
+        starts, ends = self.offsets[cell_ids], self.offsets[cell_ids + 1]
+        lengths = ends - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        flat = np.repeat(groups, lengths) * len(self.values) + self.bins[positions]
+        counts = np.bincount(flat, weights=self.counts[positions], minlength=n_groups * len(self.values))
+        return counts.reshape(n_groups, len(self.values))
+
+
+def box_stats(counts, values):
+    # Estadísticos del gráfico de caja a partir de un histograma, con los mismos criterios de
+    # Plotly: cuartiles por interpolación lineal, bigotes en el último dato dentro de 1.5 × IQR
+    # y como atípicos los valores fuera de los bigotes
+    present = counts > 0
+    counts, values = counts[present], values[present]
+    cumulative = np.cumsum(counts)
+    n = int(cumulative[-1])
+
+    def at(rank):
+        return values[np.searchsorted(cumulative, rank, side='right')]
+
+    def interp(p):
+        position = p * n - 0.5
+        if position < 0:
+            return values[0]
+        if position > n - 1:
+            return values[-1]
+        fraction = position % 1
+        return fraction * at(np.ceil(position)) + (1 - fraction) * at(np.floor(position))
+
+    q1, median, q3 = interp(0.25), interp(0.5), interp(0.75)
+    last = len(values) - 1
+    lowerfence = min(q1, values[min(np.searchsorted(values, 2.5 * q1 - 1.5 * q3, side='left'), last)])
+    upperfence = max(q3, values[max(np.searchsorted(values, 2.5 * q3 - 1.5 * q1, side='right') - 1, 0)])
+    outliers = (values < lowerfence) | (values > upperfence)
+    return {
+        'n': n,
+        'q1': float(q1),
+        'median': float(median),
+        'q3': float(q3),
+        'lowerfence': float(lowerfence),
+        'upperfence': float(upperfence),
+        'outlier_values': values[outliers],
+        'outlier_counts': counts[outliers].astype(int),
+    }
+
+
+class RateCube:
+    # Cubo pre-agregado de tasas: por cada combinación de dimensiones guarda la suma y el
+    # conteo de 'Tasa Nominal', la suma de 'Total' y la suma de tasa × total. Cualquier
+    # promedio o promedio ponderado filtrado se compone sumando celdas, sin tocar filas
+
+    def __init__(self, df, dimensions=CUBE_DIMENSIONS):
+        self.dimensions = list(dimensions)
+        rate = df['Tasa Nominal']
+        total = df['Total']
+        grouped = (
+            df[self.dimensions]
+            .assign(
+                rate_sum=rate.fillna(0.0),
+                rate_count=rate.notna().astype('int64'),
+                total_sum=total.fillna(0.0),
+                rate_total_sum=(rate * total).fillna(0.0),
+                rows=1,
+            )
+            .groupby(self.dimensions, dropna=False, sort=False, observed=True)
+        )
+        cells = grouped.sum().reset_index()
+        self.cells = cells
+        self.index = FilterIndex(cells)
+        # Co-ocurrencia de los valores de los dropdowns: filas por combinación de las cuatro
+        # columnas de filtro (menos celdas que el cubo), para las opciones dependientes
+        filter_columns = list(FILTER_COLUMNS.values())
+        self.cooccurrence = (
+            cells.groupby(filter_columns, dropna=False, sort=False, observed=True)['rows'].sum().reset_index()
+        )
+        self.cooccurrence_index = FilterIndex(self.cooccurrence)
+        # Deja listos los códigos ordenados al construir la versión, fuera de las peticiones
+        self.option_counts()
+        # Histogramas de la tasa por celda (ngroup numera las celdas en el mismo orden que sum)
+        self.sketch = RateSketch(rate.to_numpy(dtype=float), grouped.ngroup().to_numpy(), len(cells))
+
+    def select(self, **selection):
+        # Celdas del cubo que cumplen la selección de los dropdowns
+        return self.index.select(**selection)
+
+    def option_counts(self, **selection):
+        # Filas por valor de cada dropdown bajo las selecciones de los demás
+        return self.cooccurrence_index.facet_counts(weights=self.cooccurrence['rows'].to_numpy(), **selection)
+
+    @staticmethod
+    def mean_by(cells, by):
+        # Promedio simple de la tasa agrupado por las columnas indicadas
+        grouped = cells.groupby(by, observed=True)[['rate_sum', 'rate_count']].sum()
+        return (grouped['rate_sum'] / grouped['rate_count'].replace(0, np.nan)).rename('Tasa Nominal')
+
+    @staticmethod
+    def weighted_mean_by(cells, by):
+        # Promedio ponderado por monto: Σ(tasa × total) / Σ total
+        grouped = cells.groupby(by, observed=True)[['rate_total_sum', 'total_sum']].sum()
+        return (grouped['rate_total_sum'] / grouped['total_sum'].replace(0, np.nan)).rename('Tasa Nominal')
+
+    @staticmethod
+    def summary_by(cells, by):
+        # Promedio, promedio ponderado, monto total y filas agrupados por by (una sola fila si
+        # by está vacío), con una única agrupación de las celdas
+        sums = cells.groupby(by, observed=True)[CELL_SUMS].sum() if by else cells[CELL_SUMS].sum().to_frame().T
+        return summarize(sums.to_numpy(dtype=float), sums.index)
+
+    @staticmethod
+    def mean(cells):
+        count = cells['rate_count'].sum()
+        return cells['rate_sum'].sum() / count if count else np.nan
+
+    @staticmethod
+    def weighted_mean(cells):
+        total = cells['total_sum'].sum()
+        return cells['rate_total_sum'].sum() / total if total else np.nan
+
+    def rate_histograms(self, cells, by):
+        # Histogramas de la tasa de las celdas seleccionadas, sumados por los valores de by.
+        # Devuelve {valor: conteos sobre sketch.values}
+        codes, labels = pd.factorize(cells[by], sort=False)
+        keep = codes >= 0
+        counts = self.sketch.merge(cells.index.to_numpy()[keep], codes[keep], len(labels))
+        return dict(zip(labels, counts))
+
+    @staticmethod
+    def total(cells):
+        return float(cells['total_sum'].sum())
+
+    @staticmethod
+    def rows(cells):
+        return int(cells['rows'].sum())
+
+
+def summarize(sums, index):
+    # Métricas a partir de una matriz de sumas de celdas (columnas en el orden de CELL_SUMS,
+    # una fila por grupo)
+    rate_sum, rate_count, total_sum, rate_total_sum, rows = np.asarray(sums, dtype=float).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(rate_count > 0, rate_sum / rate_count, np.nan)
+        weighted_mean = np.where(total_sum != 0, rate_total_sum / total_sum, np.nan)
+    return pd.DataFrame({'mean': mean, 'weighted_mean': weighted_mean, 'total': total_sum,
+                         'rows': rows.astype('int64')}, index=index)
+
+
+def kpi_summary(cells, dimensions):
+    # KPIs de una selección en una pasada vectorizada sobre sus celdas: las sumas se acumulan
+    # con bincount por los códigos de cada dimensión (sin groupby de pandas). Devuelve
+    # {'overall': Series, dimensión: DataFrame indexado por sus valores}
+    sums = cells[CELL_SUMS].to_numpy(dtype=float)
+    summary = {'overall': summarize(sums.sum(axis=0, keepdims=True), pd.RangeIndex(1)).iloc[0]}
+    for dimension in dimensions:
+        codes, labels = pd.factorize(cells[dimension])
+        keep = codes >= 0
+        grouped = np.column_stack([np.bincount(codes[keep], weights=sums[keep, i], minlength=len(labels))
+                                   for i in range(len(CELL_SUMS))])
+        summary[dimension] = summarize(grouped, pd.Index(np.asarray(labels, dtype=object), name=dimension))
+    return summary
+
+
+def compare_periods(current_cells, previous_cells, by):
+    # Diferencia de la tasa promedio entre dos períodos a partir de sus cubos: cada período
+    # aporta solo sus celdas agregadas, nunca las filas
+    current = RateCube.mean_by(current_cells, by).rename('Tasa Actual')
+    previous = RateCube.mean_by(previous_cells, by).rename('Tasa Anterior')
+    comparison = pd.concat([current, previous], axis=1)
+    comparison['Diferencia'] = comparison['Tasa Actual'] - comparison['Tasa Anterior']
+    return comparison.dropna(subset=['Diferencia']).sort_values('Diferencia').reset_index()
+
+
+def extreme_points(x, y, max_points, k=3.0):
+    # Posiciones de los puntos atípicos (fuera de q1 - k·IQR o q3 + k·IQR en cualquiera de los
+    # ejes), como máximo max_points: se conservan los más alejados de las vallas
+    score = np.zeros(len(x))
+    for values in (x, y):
+        q1, q3 = np.percentile(values, [25, 75]) if len(values) else (0.0, 0.0)
+        iqr = q3 - q1
+        if iqr > 0:
+            excess = np.maximum((q1 - k * iqr) - values, values - (q3 + k * iqr)) / iqr
+            score = np.maximum(score, excess)
+    outliers = np.flatnonzero(score > 0)
+    if len(outliers) > max_points:
+        outliers = np.sort(outliers[np.argsort(score[outliers])[::-1][:max_points]])
+    return outliers
+
+
+def binned_density(x, y, bins, extent=None):
+    # Conteo de puntos en una grilla de bins[0] × bins[1] celdas sobre (x, y). Devuelve los
+    # conteos (filas = y, columnas = x) y los centros de las celdas de cada eje
+    if extent is None:
+        extent = ((x.min(), x.max()), (y.min(), y.max()))
+    extent = [(low, high) if high > low else (low - 0.5, high + 0.5) for low, high in extent]
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=extent)
+    return counts.T, (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
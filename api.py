@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import io
+import json
+
+import pyarrow as pa
+from flask import Response, jsonify, request, stream_with_context
+
+from aggregates import CUBE_DIMENSIONS, RateCube
+from cache import LRUCache, normalize_selection
+
+# Tamaño de página por defecto y máximo de /api/rates
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+# Filas por bloque al generar NDJSON en streaming
+NDJSON_CHUNK_ROWS = 1000
+
+AGGREGATE_METRICS = ['mean', 'weighted_mean', 'total', 'rows']
+FORMATS = {
+    'json': "application/json",
+    'ndjson': "application/x-ndjson",
+    'arrow': "application/vnd.apache.arrow.stream",
+}
+
+# Orden de las filas por (versión, selección, orden pedido), compartido entre páginas
+sorted_rows_cache = LRUCache(maxsize=64)
+
+
+class QueryError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def selection_from_args():
+    # Selección de los dropdowns a partir de los parámetros de la URL (repetibles: empresa, sector,
+    # banco y plazo); compartida por la API, /figures y las descargas
+    return normalize_selection(request.args.getlist('empresa'), request.args.getlist('sector'),
+                               request.args.getlist('banco'), request.args.getlist('plazo'))
+
+
+def dataset_from_args(get_dataset):
+    # Dataset del parámetro periodo (por defecto el más reciente); get_dataset lanza KeyError si
+    # el período no existe
+    periodo = request.args.get('periodo')
+    try:
+        return get_dataset(periodo)
+    except KeyError:
+        raise QueryError(f"periodo: no existe {periodo!r}")
+
+
+def list_arg(name, allowed=None, default=None, descending=False):
+    # Parámetro con valores separados por coma (o repetido), validado contra allowed. Con
+    # descending=True se acepta el prefijo - (orden descendente)
+    values = [value.strip() for raw in request.args.getlist(name) for value in raw.split(",") if value.strip()]
+    if allowed is not None:
+        names = [value[1:] if descending and value.startswith('-') else value for value in values]
+        unknown = [value for value in names if value not in allowed]
+        if unknown:
+            raise QueryError(f"{name}: valores no válidos {unknown}; permitidos: {list(allowed)}")
+    return values or default
+
+
+def output_format():
+    fmt = request.args.get('format', 'json')
+    if fmt not in FORMATS:
+        raise QueryError(f"format: debe ser uno de {list(FORMATS)}")
+    return fmt
+
+
+def limit_arg():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise QueryError("limit: debe ser un entero")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise QueryError(f"limit: debe estar entre 1 y {MAX_LIMIT}")
+    return limit
+
+
+def query_digest(*parts):
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def encode_cursor(version, digest, offset):
+    # Cursor opaco: versión de los datos, consulta y posición de la siguiente página
+    raw = json.dumps({'v': version, 'q': digest, 'o': offset}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor, version, digest):
+    if not cursor:
+        return 0
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(state['o'])
+    except (ValueError, KeyError, TypeError):
+        raise QueryError("cursor: no válido")
+    if state.get('q') != digest:
+        raise QueryError("cursor: corresponde a otra consulta")
+    # Las páginas de una misma consulta deben venir de la misma versión de los datos
+    if state.get('v') != version:
+        raise QueryError("cursor: los datos cambiaron, se debe repetir la consulta desde el inicio", status=410)
+    return offset
+
+
+def sorted_row_ids(dataset, selection, sort):
+    # Ids de fila de la selección en el orden pedido (estable: empates en el orden original)
+    def compute():
+        row_ids = dataset.row_ids(*selection)
+        if not sort:
+            return row_ids
+        columns = [key.lstrip('-') for key in sort]
+        order = (
+            dataset.df.iloc[row_ids][columns]
+            .reset_index(drop=True)
+            .sort_values(columns, ascending=[not key.startswith('-') for key in sort], kind="mergesort",
+                         na_position="last")
+            .index.to_numpy()
+        )
+        return row_ids[order]
+    return sorted_rows_cache.get_or_compute((dataset.version, selection, tuple(sort or ())), compute)
+
+
+def records(frame):
+    # Filas como dicts con valores de Python (NaN -> None); json.dumps conserva los float exactos,
+    # a diferencia de DataFrame.to_json que los redondea a 10 decimales
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+def frame_response(frame, fmt, headers, envelope=None):
+    # Respuesta en JSON (con envelope), NDJSON en streaming o Arrow IPC (formato stream)
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue(), mimetype=FORMATS[fmt], headers=headers)
+    if fmt == 'ndjson':
+        def generate():
+            for start in range(0, len(frame), NDJSON_CHUNK_ROWS):
+                chunk = records(frame.iloc[start:start + NDJSON_CHUNK_ROWS])
+                yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk)
+        return Response(stream_with_context(generate()), mimetype=FORMATS[fmt], headers=headers)
+    body = dict(envelope or {})
+    body['data'] = records(frame)
+    return Response(json.dumps(body, ensure_ascii=False), mimetype=FORMATS[fmt], headers=headers)
+
+
+def aggregate_frame(cells, by, metrics):
+    # Promedio, promedio ponderado por monto, total y filas por grupo a partir del cubo
+    summary = RateCube.summary_by(cells, by)
+    result = summary.reset_index() if by else summary.reset_index(drop=True)
+    return result[by + metrics]
+
+
+def init_app(server, get_dataset):
+    # Registrar /api/rates y /api/aggregates; get_dataset(periodo) resuelve el período pedido y
+    # lanza KeyError si no existe (respuesta 400)
+
+    @server.errorhandler(QueryError)
+    def _query_error(error):
+        return jsonify(error=str(error)), error.status
+
+    @server.route("/api/rates")
+    def api_rates():
+        # Filas de bancos chilenos con los filtros del dashboard, proyección (columns), orden
+        # (sort, con - para descendente) y paginación por cursor (limit, cursor)
+        dataset = dataset_from_args(get_dataset)
+        columns = list_arg('columns', allowed=list(dataset.df.columns), default=list(dataset.df.columns))
+        sort = list_arg('sort', allowed=list(dataset.df.columns), default=[], descending=True)
+        fmt = output_format()
+        limit = limit_arg()
+        selection = selection_from_args()
+        digest = query_digest(selection, sort, columns, request.args.get('periodo'))
+        offset = decode_cursor(request.args.get('cursor'), dataset.version, digest)
+
+        row_ids = sorted_row_ids(dataset, selection, sort)
+        page = dataset.df.iloc[row_ids[offset:offset + limit]][columns]
+        next_offset = offset + len(page)
+        next_cursor = encode_cursor(dataset.version, digest, next_offset) if next_offset < len(row_ids) else None
+
+        headers = {'X-Total-Count': str(len(row_ids)), 'X-Data-Version': dataset.version}
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        envelope = {'data_version': dataset.version, 'total': len(row_ids), 'next_cursor': next_cursor}
+        return frame_response(page, fmt, headers, envelope)
+
+    @server.route("/api/aggregates")
+    def api_aggregates():
+        # Promedios y promedios ponderados agrupados (by) sobre el cubo, con los mismos filtros
+        dataset = dataset_from_args(get_dataset)
+        by = list_arg('by', allowed=CUBE_DIMENSIONS, default=[])
+        metrics = list_arg('metrics', allowed=AGGREGATE_METRICS, default=AGGREGATE_METRICS)
+        fmt = output_format()
+        cells = dataset.cells(*selection_from_args())
+        result = aggregate_frame(cells, by, metrics)
+        headers = {'X-Data-Version': dataset.version}
+        return frame_response(result, fmt, headers, {'data_version': dataset.version, 'by': by})
+
+    return server
@@ -1,37 +1,141 @@
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
+import numpy as np
 import pandas as pd
 import plotly.express as px
-import re  # Para procesar el formato monetario
 from datetime import datetime as dt
-from flask import Flask, send_file
-import io
-from dash.exceptions import PreventUpdate
+import os
+from flask import Response, abort, jsonify, request, send_file, stream_with_context
+import json
 import plotly.graph_objects as go
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from data_store import DataStore
+from filters import as_plain
+from cache import (SHARED_CACHE_PATH, SHARED_CACHE_TTL, FigureCache, LRUCache, SharedCache, SQLiteStore,
+                   code_version, normalize_selection)
+from clientside import encode_frame
+from aggregates import RateCube, binned_density, box_stats, compare_periods, extreme_points, kpi_summary
+from data_loader import EXCEL_PATH, SNAPSHOT_DIR, period_label
+from exports import iter_csv
+from api import dataset_from_args, init_app as init_api, selection_from_args
+from warmup import SelectionLog, Warmer, load_selections
+from metrics import bind_callback, init_app as init_metrics, instrument_callback, observe_rows, registry, stage
+from payloads import etag_matches, init_compression, register_template, serialize_figure
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+# Cargar los datos desde el snapshot columnar (se reconstruye solo si cambia el Excel). El
+# almacén revisa el Excel periódicamente y activa la nueva versión sin reiniciar los workers
+# Cada hoja bd_* del libro es un período (por defecto se muestra el más reciente o
+# DATA_DEFAULT_PERIOD); los demás se cargan al primer uso y se desalojan si superan DATA_MEMORY_BUDGET_MB
+# DATA_EXCEL_PATH y DATA_SNAPSHOT_DIR sirven otro libro (p.ej. el sintético de las pruebas de carga)
+data_store = DataStore(os.environ.get("DATA_EXCEL_PATH", EXCEL_PATH),
+                       sheet_name=os.environ.get("DATA_DEFAULT_PERIOD"),
+                       poll_interval=int(os.environ.get("DATA_RELOAD_INTERVAL", "60")),
+                       memory_budget=int(os.environ.get("DATA_MEMORY_BUDGET_MB", "512")) * 1024 * 1024,
+                       snapshot_dir=os.environ.get("DATA_SNAPSHOT_DIR", SNAPSHOT_DIR))
+
+# Hilos de fondo (revisión del Excel, exportación base y precálculo): al importar la app, salvo
+# en el maestro de gunicorn con preload (gunicorn.conf.py fija GUNICORN_PRELOADING=1), donde se
+# inician en cada worker con start_background desde post_fork
+BACKGROUND_AT_IMPORT = os.environ.get("GUNICORN_PRELOADING") != "1"
+
+# Caché compartida entre los workers de gunicorn (archivo SQLite local) detrás de las cachés en
+# memoria de figuras y KPIs: un worker nuevo o recién reiniciado encuentra lo que ya calcularon
+# los demás. CACHE_BACKEND=memory deja solo la caché en memoria de cada worker
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite")
+if CACHE_BACKEND not in ('sqlite', 'memory'):
+    raise ValueError(f"CACHE_BACKEND debe ser 'sqlite' o 'memory', no {CACHE_BACKEND!r}")
+shared_store = SQLiteStore(
+    os.environ.get("SHARED_CACHE_PATH", SHARED_CACHE_PATH),
+    max_bytes=int(os.environ.get("SHARED_CACHE_MAX_MB", "256")) * 1024 * 1024,
+) if CACHE_BACKEND == 'sqlite' else None
+
+
+# Versión del código en las claves compartidas: tras un deploy los workers no sirven figuras ni
+# KPIs armados por el código anterior
+CACHE_VERSION = code_version(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shared_tier(namespace, **options):
+    # Nivel compartido de una caché (None sin backend compartido). options son las opciones de
+    # configuración que cambian los valores guardados, y forman parte de la versión
+    if shared_store is None:
+        return None
+    version = ":".join([CACHE_VERSION] + [f"{name}={value}" for name, value in sorted(options.items())])
+    return SharedCache(shared_store, namespace, version=version,
+                       ttl=int(os.environ.get("SHARED_CACHE_TTL", SHARED_CACHE_TTL)))
+
+# Modo de filtrado en el navegador (CLIENTSIDE_FILTERING=1): los datos compactos de los bancos
+# chilenos se envían una vez en un dcc.Store y los KPIs y gráficos se recalculan en el navegador
+# (assets/js/clientside.js) sin ir al servidor en cada cambio de los dropdowns
+CLIENTSIDE_FILTERING = os.environ.get("CLIENTSIDE_FILTERING") == "1"
+
+# Estilo común de los gráficos en un template registrado una vez (ver payloads.py)
+register_template()
+
+# Datos numéricos de las figuras en binario (base64 de arreglos tipados) con
+# FIGURE_TYPED_ARRAYS=1. El plotly.js incluido en Dash no los lee, por lo que se debe indicar en
+# PLOTLY_JS_URL un plotly.js >= 2.28, que se carga antes que el de dcc.Graph
+FIGURE_TYPED_ARRAYS = os.environ.get("FIGURE_TYPED_ARRAYS") == "1"
+PLOTLY_JS_URL = os.environ.get("PLOTLY_JS_URL")
+if FIGURE_TYPED_ARRAYS and not PLOTLY_JS_URL:
+    raise ValueError("FIGURE_TYPED_ARRAYS=1 requiere PLOTLY_JS_URL con un plotly.js >= 2.28")
+
+
+def server_callback(*args, **kwargs):
+    # Callback del servidor solo si el modo clientside está desactivado
+    if CLIENTSIDE_FILTERING:
+        return lambda func: func
+    return app.callback(*args, **kwargs)
 
-# Cargar los datos desde el archivo Excel
-
-df = pd.read_excel("data/tasas_interes.xlsx", sheet_name="bd_2023")
-
-# Obtener una lista de colores únicos para cada banco
-colores_banco = px.colors.qualitative.Set1[:len(df['Nombre Entidad Acreedora'].unique())]
 
 # Inicializar la aplicación Dash sin tema de Bootstrap
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])  # Usando Bootstrap para mejorar el diseño
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],  # Usando Bootstrap para mejorar el diseño
+                external_scripts=[PLOTLY_JS_URL] if PLOTLY_JS_URL else [])
 server = app.server
 app.title = "Prestamos Bancarios Empresas Chilenas"
+# Tiempos y tamaños de respuesta por ruta (expuestos en /metrics)
+init_metrics(server)
+# Respuestas comprimidas con brotli o gzip (RESPONSE_COMPRESSION=0 lo desactiva, p.ej. si ya
+# comprime un proxy). Se registra después de las métricas, que así miden los bytes comprimidos
+if os.environ.get("RESPONSE_COMPRESSION", "1") == "1":
+    init_compression(server)
+
+
+def get_dataset(period=None):
+    # Dataset del período seleccionado; si el período ya no existe (p.ej. tras una recarga)
+    # se usa el más reciente
+    if period in data_store.periods:
+        return data_store.get(period)
+    return data_store.current
+
+
+# API de consulta (/api/rates y /api/aggregates) sobre el mismo filtrado y cubo del dashboard
+init_api(server, data_store.get)
+
+
+def filter_data(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None):
+    # Filas de bancos chilenos que cumplen las selecciones de los dropdowns (resultado compartido,
+    # no debe modificarse). Sin dataset explícito se usa la versión activa
+    dataset = dataset or data_store.current
+    with stage('filter'):
+        filtered_df = dataset.filter(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+    observe_rows(len(filtered_df))
+    return filtered_df
+
 
-# Obtener la lista de nombres de empresas, sectores y bancos únicos
-empresa_options = [{'label': empresa, 'value': empresa} for empresa in df['Empresa'].unique()]
-sector_options = [{'label': sector, 'value': sector} for sector in df['Sector'].unique()]
-plazo_options = [{'label': plazo, 'value': plazo} for plazo in df['Plazo'].unique()]
-# Filtrar el DataFrame para incluir solo bancos chilenos
-df_bancos_chilenos = df[df['Pais Empresa Acreedora'] == 'Chile']
+def select_cells(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None):
+    # Celdas del cubo que cumplen las selecciones de los dropdowns
+    dataset = dataset or data_store.current
+    with stage('filter'):
+        return dataset.cells(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
 
-# Obtener la lista de nombres de bancos chilenos únicos
-banco_options = [{'label': banco, 'value': banco} for banco in df_bancos_chilenos['Nombre Entidad Acreedora'].unique()]
 
 # Introducción explicativa
 external_stylesheets = ['styles.css']
@@ -106,129 +210,100 @@ footer = dbc.Row(
 )
 
 
-colores_graficos = px.colors.qualitative.Vivid  # Cambia esto por una paleta que prefieras
+# Dimensiones de la tabla de KPIs y columnas que se muestran por cada fila
+KPI_BANK = 'Nombre Entidad Acreedora'
+KPI_DIMENSIONS = [KPI_BANK, 'Empresa']
+KPI_COLUMNS = ["Tasa Promedio", "Tasa Promedio Ponderada", "Monto Total (M$)", "Operaciones"]
+
+
+def format_rate(value):
+    return "—" if pd.isna(value) else f"{value * 100:.2f}%"
+
+
+def kpi_row(label, metrics, className=None):
+    cells = [format_rate(metrics['mean']), format_rate(metrics['weighted_mean']),
+             f"${metrics['total']:,.0f}", f"{int(metrics['rows']):,}"]
+    return html.Tr([html.Td(label)] + [html.Td(value) for value in cells], className=className)
+
+
+def kpi_table(summary, title, sort_by, overall=None):
+    # Tabla con una fila por valor de la dimensión, ordenada de mayor a menor tasa (sort_by) y,
+    # en empates, por nombre. overall agrega al final la fila del total de la selección
+    rows = [dict(zip(summary.columns, values), label=str(label))
+            for label, values in zip(summary.index, summary.to_numpy().tolist())]
+    rows.sort(key=lambda row: row['label'])
+    rows.sort(key=lambda row: (pd.isna(row[sort_by]), -row[sort_by] if pd.notna(row[sort_by]) else 0))
+    body = [kpi_row(row['label'], row) for row in rows]
+    if overall is not None:
+        body.append(kpi_row("Total selección", overall, className="fw-bold"))
+    return dbc.Table([
+        html.Thead(html.Tr([html.Th(title)] + [html.Th(column) for column in KPI_COLUMNS])),
+        html.Tbody(body),
+    ], bordered=False, hover=True, striped=True, size="sm", className="kpi-table")
+
+
+def generate_kpis(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None):
+    # Tabla de KPIs a partir del cubo pre-agregado: promedio simple y ponderado por monto, monto
+    # total y operaciones de cada banco y, si se eligieron empresas, de cada empresa (cualquier
+    # cantidad), más el total de la selección y los bancos con la tasa promedio más alta y baja
+    cells = select_cells(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset)
+    with stage('aggregate'):
+        summary = kpi_summary(cells, KPI_DIMENSIONS)
+    overall = summary['overall']
+    if overall['rows'] == 0:
+        return dbc.Container([html.P("No hay créditos de bancos chilenos para la selección.",
+                                     className="card-text text-muted")])
+
+    # Bancos con la tasa promedio más alta y más baja (en empates, el primero por nombre)
+    bank_means = summary[KPI_BANK]['mean'].dropna()
+    bank_means.index = bank_means.index.astype(str)
+    bank_means = bank_means.sort_index()
+    children = []
+    if len(bank_means):
+        highlights = [f"Tasa de Interés más Alta: {bank_means.idxmax()} ", html.Strong(format_rate(bank_means.max())),
+                      f" · Tasa de Interés más Baja: {bank_means.idxmin()} ", html.Strong(format_rate(bank_means.min()))]
+        children.append(dbc.Row(dbc.Col(html.P(highlights, className="card-title text-muted"))))
+    children.append(kpi_table(summary[KPI_BANK], "Banco", 'mean', overall=overall))
+    if selected_empresas:
+        children.append(kpi_table(summary['Empresa'], "Empresa", 'weighted_mean'))
 
-# Personaliza los estilos de los gráficos
-def customizar_grafico(fig):
-    fig.update_layout(
-        font=dict(family="Helvetica", size=12, color="#7f7f7f"),
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        xaxis=dict(showgrid=False),
-        yaxis=dict(showgrid=False)
-    )
-    return fig
+    # Nota explicativa del promedio de todas las monedas
+    children.append(dbc.Row([
+        dbc.Col(html.P("Nota: El promedio de tasa de interés incluye todas las monedas ofrecidas por el banco.",
+                       className="card-text text-muted"))
+    ]))
+    return dbc.Container(children)
 
 
 
-def generate_kpis(selected_empresas, selected_sectores, selected_bancos, selected_plazo):
-    # Cálculos de las tasas promedio máximas y mínimas
-   
-    filtered_df = df.copy()
 
-    # Filtrar el DataFrame según las selecciones de empresas y sectores
-    if selected_empresas:
-        filtered_df = filtered_df[filtered_df['Empresa'].isin(selected_empresas)]
-    if selected_sectores:
-        filtered_df = filtered_df[filtered_df['Sector'].isin(selected_sectores)]
-    if selected_plazo:
-        filtered_df = filtered_df[filtered_df['Plazo'].isin(selected_plazo)]
-    # Filtrar el DataFrame para incluir solo bancos chilenos
-    filtered_df = filtered_df[filtered_df['Pais Empresa Acreedora'] == 'Chile']
-
-    # Si se han seleccionado bancos específicos, aplicar ese filtro
-    if selected_bancos:
-        filtered_df = filtered_df[filtered_df['Nombre Entidad Acreedora'].isin(selected_bancos)]
-        
-    # Verificar si solo se ha seleccionado una empresa (si selected_empresas es una lista)
-    if selected_empresas is not None and len(selected_empresas) == 1:
-        # Calcular la tasa de interés promedio ponderada de la empresa seleccionada
-        selected_empresa = selected_empresas[0]
-        weighted_average_interest_rate = (filtered_df[filtered_df['Empresa'] == selected_empresa]['Tasa Nominal'] * 
-                                           filtered_df[filtered_df['Empresa'] == selected_empresa]['Total']).sum() / \
-                                          filtered_df[filtered_df['Empresa'] == selected_empresa]['Total'].sum() * 100
-        
-        # Mostrar un KPI especial para la empresa seleccionada
-        selected_empresa_kpi = dbc.Row(
-            dbc.Col(
-                dbc.Card([
-                    html.H3(f"{weighted_average_interest_rate:.2f}%", className="card-title text-muted"),
-                    html.P(f"Tasa Promedio Ponderada de {selected_empresa}", className="card-title"),
-                ], body=True, color="light", inverse=False),
-                width={"size": 4, "offset": 4},  # Ancho de 4 y centrado
-            )
-        )
-        return selected_empresa_kpi
-    
-    # Verificar si solo se ha seleccionado un banco (si selected_bancos es una lista)
-    if selected_bancos is not None and len(selected_bancos) == 1:
-        # Calcular la tasa de interés promedio del banco seleccionado
-        selected_banco = selected_bancos[0]
-        single_bank_average_interest_rate = filtered_df['Tasa Nominal'].mean() * 100
-        
-        # Mostrar un KPI especial para el banco seleccionado
-        single_bank_kpi = dbc.Row(
-            dbc.Col(
-                dbc.Card([
-                    html.H3(f"{single_bank_average_interest_rate:.2f}%", className="card-title text-muted"),
-                    html.P(f"Tasa de Interés Promedio del {selected_banco}", className="card-title"),
-                ], body=True, color="light", inverse=False),
-                width={"size": 4, "offset": 4},  # Ancho de 4 y centrado
-            )
-        )
-        return single_bank_kpi
-    
-    
-    max_average_interest_rate = filtered_df.groupby('Nombre Entidad Acreedora')['Tasa Nominal'].mean().idxmax()
-    max_average_interest_rate_value = filtered_df.groupby('Nombre Entidad Acreedora')['Tasa Nominal'].mean().max() * 100
-    
-    min_average_interest_rate = filtered_df.groupby('Nombre Entidad Acreedora')['Tasa Nominal'].mean().idxmin()
-    min_average_interest_rate_value = filtered_df.groupby('Nombre Entidad Acreedora')['Tasa Nominal'].mean().min() * 100
-    
-    average_interest_rate = filtered_df['Tasa Nominal'].mean() * 100
-    
-    # Crear las tarjetas para los KPIs
-    kpi_cards = dbc.Row([
-        dbc.Col(dbc.Card([
-            html.H3(f"{max_average_interest_rate_value:.2f}%", className="card-title text-muted"),
-            html.P(f"Tasa de Interés más Alta - {max_average_interest_rate}",
-                   className="card-text"),
-        ], body=True, color="light", inverse=False)),
-        dbc.Col(dbc.Card([
-            html.H3(f"{min_average_interest_rate_value:.2f}%", className="card-title text-muted"),
-            html.P(f"Tasa de Interés más Baja - {min_average_interest_rate}",
-                   className="card-text"),
-        ], body=True, color="light", inverse=False)),
-        dbc.Col(dbc.Card([
-            html.H3(f"{average_interest_rate:.2f}%", className="card-title text-muted"),
-            html.P("Promedio Tasa de Interés", className="card-text"),
-        ], body=True, color="light", inverse=False)),
-    ])
-    
-    # Crear la nota explicativa del promedio de todas las monedas
-    note_average_currency = dbc.Row([
-        dbc.Col(html.P("Nota: El promedio de tasa de interés incluye todas las monedas ofrecidas por el banco.",
-                       className="card-text text-muted"))
-    ])
-    
-    # Combinar las tarjetas de KPIs y la nota en un solo contenedor
-    kpis_and_note = dbc.Container([kpi_cards, note_average_currency])
-    
-    return kpis_and_note
+# Caché de las tarjetas de KPIs por selección y versión de los datos
+kpi_cache = LRUCache(maxsize=1024, shared=shared_tier('kpis'))
+data_store.on_reload(lambda previous, dataset: kpi_cache.clear())
 
 
+def cached_kpis(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None):
+    dataset = dataset or data_store.current
+    selection = normalize_selection(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+    return kpi_cache.get_or_compute(
+        (selection, dataset.version),
+        lambda: generate_kpis(*[list(values) for values in selection], dataset=dataset),
+    )
 
 
-@app.callback(
+@server_callback(
     Output('kpi-cards-container', 'children'),
     [Input('empresa-dropdown', 'value'),
      Input('sector-dropdown', 'value'),
      Input('banco-dropdown', 'value'),
-     Input('plazo-dropdown', 'value')]
+     Input('plazo-dropdown', 'value'),
+     Input('periodo-dropdown', 'value')]
 )
-def update_kpi_cards(selected_empresas, selected_sectores, selected_bancos, selected_plazo):
+@instrument_callback('update_kpi_cards')
+def update_kpi_cards(selected_empresas, selected_sectores, selected_bancos, selected_plazo, selected_periodo):
     # Actualizar los KPIs en función de las selecciones de los dropdowns
-    kpi_cards = generate_kpis(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+    kpi_cards = cached_kpis(selected_empresas, selected_sectores, selected_bancos, selected_plazo,
+                            get_dataset(selected_periodo))
     return kpi_cards
 
 
@@ -256,335 +331,761 @@ navbar_wrapper = html.Div(
     className="navbar-wrapper mx-auto text-center",
 
 )
-# Diseño de la aplicación
-app.layout = dbc.Container([
-    navbar_wrapper,
-    html.Link(
-        rel="icon",
-        href="/assets/img/favicon.ico",
-        type="image/x-icon"
-    ),
-    dbc.Row(
-        dbc.Col(html.H2("Tasas de Interés de Bancos Chilenos y Descubre la Realidad de los Costos Financieros de Empresas del IPSA", className="text-center"), width="auto"),
-        justify="center",
-        style={"margin-top": "5rem", "margin-bottom": "1rem" ,'margin-left':'20px','margin-right':'20px'}
-    ),
+# Diseño de la aplicación. Se arma en cada carga de página para que los dropdowns muestren
+# las opciones de la versión de datos activa
+def serve_layout():
+    dataset = data_store.current
+    empresa_options, sector_options, banco_options, plazo_options = dataset.dropdown_options(None, None, None, None)
+    return dbc.Container([
+        navbar_wrapper,
+        html.Link(
+            rel="icon",
+            href="/assets/img/favicon.ico",
+            type="image/x-icon"
+        ),
+        dbc.Row(
+            dbc.Col(html.H2("Tasas de Interés de Bancos Chilenos y Descubre la Realidad de los Costos Financieros de Empresas del IPSA", className="text-center"), width="auto"),
+            justify="center",
+            style={"margin-top": "5rem", "margin-bottom": "1rem" ,'margin-left':'20px','margin-right':'20px'}
+        ),
     
-    dbc.Row(
-        dbc.Col(
-            dcc.Markdown(
-                """
-                **Descubre los Costos Financieros de las Empresas Chilenas**
+        dbc.Row(
+            dbc.Col(
+                dcc.Markdown(
+                    """
+                    **Descubre los Costos Financieros de las Empresas Chilenas**
 
-                En el mundo financiero, las tasas de interés son un indicador crítico que afecta tanto a las empresas como a los individuos. Estas tasas determinan el costo de los préstamos y tienen un impacto significativo en las decisiones financieras.
+                    En el mundo financiero, las tasas de interés son un indicador crítico que afecta tanto a las empresas como a los individuos. Estas tasas determinan el costo de los préstamos y tienen un impacto significativo en las decisiones financieras.
 
-                Sin embargo, a menudo nos enfrentamos a la dispersión y fragmentación de la información sobre tasas de interés, especialmente en el contexto de las empresas chilenas, ya que no existen simuladores que mencionen la tasa de interés real que pagan las empresas.
+                    Sin embargo, a menudo nos enfrentamos a la dispersión y fragmentación de la información sobre tasas de interés, especialmente en el contexto de las empresas chilenas, ya que no existen simuladores que mencionen la tasa de interés real que pagan las empresas.
 
-                Esta aplicación fue creada con el propósito de brindarte una visión más clara y accesible de las tasas de interés de préstamos ofrecidos por diferentes bancos en Chile, centrándose especialmente en las empresas que componen el IPSA.
+                    Esta aplicación fue creada con el propósito de brindarte una visión más clara y accesible de las tasas de interés de préstamos ofrecidos por diferentes bancos en Chile, centrándose especialmente en las empresas que componen el IPSA.
 
-                **Nota:** Los datos utilizados en esta aplicación son recopilados directamente de los estados financieros de las empresas actualizados a septiembre de 2023.
+                    **Nota:** Los datos utilizados en esta aplicación son recopilados directamente de los estados financieros de las empresas actualizados a septiembre de 2023.
 
-                ### ¿Qué Puedes Hacer Aquí?
+                    ### ¿Qué Puedes Hacer Aquí?
 
-                - Explora datos de tasas de interés de empresas chilenas.
-                - Filtra por empresa, sector, banco y plazo para análisis personalizados.
-                - Visualiza gráficos informativos y realiza comparaciones.
-                - Descarga datos en formato CSV o Excel para tu propio análisis.
+                    - Explora datos de tasas de interés de empresas chilenas.
+                    - Filtra por empresa, sector, banco y plazo para análisis personalizados.
+                    - Visualiza gráficos informativos y realiza comparaciones.
+                    - Descarga datos en formato CSV o Excel para tu propio análisis.
 
-                Nuestro objetivo es proporcionarte una herramienta que te ayude a comprender mejor el panorama financiero de las empresas chilenas.
+                    Nuestro objetivo es proporcionarte una herramienta que te ayude a comprender mejor el panorama financiero de las empresas chilenas.
 
-                **Para una experiencia óptima, se recomienda visualizar esta página en un PC. Si estás utilizando un teléfono, gira tu dispositivo horizontalmente para obtener una mejor visualización  **             
+                    **Para una experiencia óptima, se recomienda visualizar esta página en un PC. Si estás utilizando un teléfono, gira tu dispositivo horizontalmente para obtener una mejor visualización  **             
                 
-                ¡Esperamos que esta aplicación sea de gran utilidad para ti!
-                """
+                    ¡Esperamos que esta aplicación sea de gran utilidad para ti!
+                    """
+                ),
+                width="auto"
             ),
-            width="auto"
+            justify="center",
+            style={"margin-bottom": "2rem", "padding": "0 15px", 'margin-left':'20px','margin-right':'20px'}  # Agrega margen inferior y relleno horizontal
         ),
-        justify="center",
-        style={"margin-bottom": "2rem", "padding": "0 15px", 'margin-left':'20px','margin-right':'20px'}  # Agrega margen inferior y relleno horizontal
+        # Selección del período de reporte y, opcionalmente, de un período para comparar
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id='periodo-dropdown', options=data_store.period_options(), value=dataset.sheet_name, clearable=False, placeholder="Seleccionar Período", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
+            dbc.Col(dcc.Dropdown(id='comparar-dropdown', options=data_store.period_options(), placeholder="Comparar con Período", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
+        ], justify="center",   style={"margin-left": "60px", "margin-right": "60px"}
     ),
-    # Incluir KPIs con un estilo mejorado
-    html.Div(id='kpi-cards-container'),
-    # Mejor diseño para los Dropdowns
-    dbc.Row([
-        dbc.Col(dcc.Dropdown(id='empresa-dropdown', options=empresa_options, multi=True, placeholder="Seleccionar Empresa(s)", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
-        dbc.Col(dcc.Dropdown(id='sector-dropdown', options=sector_options, multi=True, placeholder="Seleccionar Sector(es)", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
-        dbc.Col(dcc.Dropdown(id='banco-dropdown', options=banco_options, multi=True, placeholder="Seleccionar Banco(s) (Solo Chilenos)", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
-        dbc.Col(dcc.Dropdown(id='plazo-dropdown', options=plazo_options, multi=True, placeholder="Seleccionar Plazo", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
-    ], justify="around",   style={"margin-left": "60px", "margin-right": "60px"}  # Agrega margen izquierdo y derecho
-),
-    dbc.Row(dbc.Col(dcc.Graph(id='bar-chart', config=display_bar_logo), width=12), className="mb-4"),  # Tamaño completo en dispositivos móviles
-    dbc.Row([
-        dbc.Col(dcc.Graph(id='scatter-plot', config=display_bar_logo), width=12, lg=6, md=12, sm=12, xs=12),  # Ancho completo en dispositivos móviles en orientación vertical
-        dbc.Col(dcc.Graph(id='boxplot', config=display_bar_logo), width=12, lg=6, md=12, sm=12, xs=12),
-    ], justify="around"),
-    dbc.Row(
-        dbc.Col(dcc.Markdown(clasification_text, className="p-4"), className="mt-4 bg-light border"),
-        justify="center" 
+        # Datos compactos para el modo de filtrado en el navegador (se llenan al cargar la página)
+        *([dcc.Store(id='compact-data'), dcc.Store(id='comparison-selection')] if CLIENTSIDE_FILTERING else []),
+        # Incluir KPIs con un estilo mejorado
+        html.Div(id='kpi-cards-container'),
+        # Mejor diseño para los Dropdowns
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id='empresa-dropdown', options=empresa_options, multi=True, placeholder="Seleccionar Empresa(s)", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
+            dbc.Col(dcc.Dropdown(id='sector-dropdown', options=sector_options, multi=True, placeholder="Seleccionar Sector(es)", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
+            dbc.Col(dcc.Dropdown(id='banco-dropdown', options=banco_options, multi=True, placeholder="Seleccionar Banco(s) (Solo Chilenos)", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
+            dbc.Col(dcc.Dropdown(id='plazo-dropdown', options=plazo_options, multi=True, placeholder="Seleccionar Plazo", className="mt-2 mb-2"), width=6, lg=3, md=12, sm=12, xs=12),
+        ], justify="around",   style={"margin-left": "60px", "margin-right": "60px"}  # Agrega margen izquierdo y derecho
     ),
-    dbc.Row(
-        dbc.Col(
-            html.H3(children="Descargar Datos", id="descargar-seccion"),
-            width="auto"
+        dbc.Row(dbc.Col(dcc.Graph(id='bar-chart', config=display_bar_logo), width=12), className="mb-4"),  # Tamaño completo en dispositivos móviles
+        # Comparación entre períodos (visible solo si se elige un período para comparar)
+        html.Div(
+            dbc.Row([
+                dbc.Col(dcc.Graph(id='comparison-bank-chart', config=display_bar_logo), width=12, lg=6, md=12, sm=12, xs=12),
+                dbc.Col(dcc.Graph(id='comparison-company-chart', config=display_bar_logo), width=12, lg=6, md=12, sm=12, xs=12),
+            ], justify="around", className="mb-4"),
+            id='comparison-container',
+            style={'display': 'none'},
         ),
-        justify="center",
-        style={"margin-top": "4rem", "margin-bottom": "0.5rem"}
-    ),
-    dbc.Row(
-        dbc.Col(
-            html.P(
-                "Descarga la base de datos completa en CSV para acceder a todos los datos disponibles. Además, tienes la opción de descargar los datos en formato Excel, en el caso de que no se tenga disponible la forma de abrir el archivo en formato CSV."
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='scatter-plot', config=display_bar_logo), width=12, lg=6, md=12, sm=12, xs=12),  # Ancho completo en dispositivos móviles en orientación vertical
+            dbc.Col(dcc.Graph(id='boxplot', config=display_bar_logo), width=12, lg=6, md=12, sm=12, xs=12),
+        ], justify="around"),
+        dbc.Row(
+            dbc.Col(dcc.Markdown(clasification_text, className="p-4"), className="mt-4 bg-light border"),
+            justify="center" 
+        ),
+        dbc.Row(
+            dbc.Col(
+                html.H3(children="Descargar Datos", id="descargar-seccion"),
+                width="auto"
             ),
-            width="auto"
+            justify="center",
+            style={"margin-top": "4rem", "margin-bottom": "0.5rem"}
         ),
-        justify="center",
-        style={"margin-bottom": "0.2rem","margin-left": "20px", "margin-right": "20px"} 
-    ),
-    dbc.Row(
-        dbc.Col(
-            html.Div(
-                className="text-center my-4",
-                children=[
-                    html.A(
-                        html.Button("Descargar CSV", className="btn btn-info", style={"margin-right": "10px"}),
-                        href="/download_csv"
-                    ),
-                    html.A(
-                        html.Button("Descargar Excel", className="btn btn-info ml-10 mt-10"),
-                        href="/download_excel"
-                    ),
-                ]
+        dbc.Row(
+            dbc.Col(
+                html.P(
+                    "Descarga la base de datos completa en CSV para acceder a todos los datos disponibles. Además, tienes la opción de descargar los datos en formato Excel, en el caso de que no se tenga disponible la forma de abrir el archivo en formato CSV."
+                ),
+                width="auto"
             ),
+            justify="center",
+            style={"margin-bottom": "0.2rem","margin-left": "20px", "margin-right": "20px"} 
         ),
-        justify="center" 
-    ),
-    footer,
-], fluid=True, className="py-3 p-0")  # Elimina el relleno del Container
-
-
-base_graph_style = {
-    'font_family': 'Open Sans, sans-serif',
-    'title_font_family': 'Open Sans, sans-serif',
-    'legend_title_font_family': 'Open Sans, sans-serif',
-    'font_size': 14,
-    'title_font_size': 18,
-    'legend_title_font_size': 16,
-    'colorway': ['#003f5c', '#58508d', '#bc5090', '#ff6361', '#ffa600'],  # Ejemplo de una paleta de colores
-}
-
-
-
-def update_scatter_plot(selected_empresas, selected_sectores, selected_bancos, selected_plazo):
-    # Crear una copia del DataFrame original
-    filtered_df = df.copy()
-
-    # Filtrar el DataFrame según las selecciones de empresas y sectores
-    if selected_empresas:
-        filtered_df = filtered_df[filtered_df['Empresa'].isin(selected_empresas)]
-    if selected_sectores:
-        filtered_df = filtered_df[filtered_df['Sector'].isin(selected_sectores)]
-    if selected_plazo:
-        filtered_df = filtered_df[filtered_df['Plazo'].isin(selected_plazo)]
-
-    # Filtrar el DataFrame para incluir solo bancos chilenos
-    filtered_df = filtered_df[filtered_df['Pais Empresa Acreedora'] == 'Chile']
-
-    # Si se han seleccionado bancos específicos, aplicar ese filtro
-    if selected_bancos:
-        filtered_df = filtered_df[filtered_df['Nombre Entidad Acreedora'].isin(selected_bancos)]
-
-    # Procesar la columna "Total" para obtener el monto del crédito como un valor numérico
-    filtered_df['Monto del Crédito'] = filtered_df['Total']
-    # Crear un gráfico de dispersión
+        dbc.Row(
+            dbc.Col(
+                html.Div(
+                    className="text-center my-4",
+                    children=[
+                        html.A(
+                            html.Button("Descargar CSV", className="btn btn-info", style={"margin-right": "10px"}),
+                            href="/download_csv"
+                        ),
+                        html.A(
+                            html.Button("Descargar Excel", className="btn btn-info ml-10 mt-10"),
+                            href="/download_excel"
+                        ),
+                    ]
+                ),
+            ),
+            justify="center" 
+        ),
+        footer,
+    ], fluid=True, className="py-3 p-0")  # Elimina el relleno del Container
+
+
+app.layout = serve_layout
+
+
+# Nivel de detalle del gráfico de dispersión: sobre SCATTER_LOD_THRESHOLD puntos se envía una
+# grilla de densidad de Total × Tasa Nominal más los atípicos como puntos (WebGL); los puntos
+# individuales vuelven al hacer zoom, cuando la ventana visible queda bajo el umbral
+SCATTER_LOD_THRESHOLD = int(os.environ.get("SCATTER_LOD_THRESHOLD", "5000"))
+SCATTER_LOD_BINS = (80, 60)
+
+
+def quantize_range(low, high, bins):
+    # Extremos redondeados hacia afuera a una grilla de paso 10^k, con k tal que el paso no supere
+    # una celda de la grilla de densidad: zooms casi iguales comparten la clave de la caché y la
+    # ventana crece a lo más dos celdas
+    exponent = int(np.floor(np.log10((high - low) / bins))) if high > low else 0
+    step = 10.0 ** exponent
+    digits = max(0, -exponent)
+    return round(float(np.floor(low / step) * step), digits), round(float(np.ceil(high / step) * step), digits)
+
+
+def viewport_from_relayout(relayout_data):
+    # Ventana visible ((x0, x1), (y0, y1)) a partir del relayoutData del gráfico, cuantizada (ver
+    # quantize_range); None en un eje sin zoom. Devuelve None si no hay zoom (p.ej. doble clic para
+    # volver a la vista completa)
+    relayout_data = relayout_data or {}
+    ranges = []
+    for axis, bins in zip(('xaxis', 'yaxis'), SCATTER_LOD_BINS):
+        if f'{axis}.range[0]' in relayout_data and f'{axis}.range[1]' in relayout_data:
+            low, high = relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']
+        elif f'{axis}.range' in relayout_data:
+            low, high = relayout_data[f'{axis}.range']
+        else:
+            ranges.append(None)
+            continue
+        ranges.append(quantize_range(float(min(low, high)), float(max(low, high)), bins))
+    return tuple(ranges) if any(ranges) else None
+
+
+def viewport_mask(df, viewport):
+    mask = np.ones(len(df), dtype=bool)
+    for column, bounds in zip(('Total', 'Tasa Nominal'), viewport):
+        if bounds is not None:
+            values = df[column].to_numpy(dtype=float)
+            mask &= (values >= bounds[0]) & (values <= bounds[1])
+    return mask
+
+
+def update_scatter_plot(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None,
+                        viewport=None):
+    dataset = dataset or data_store.current
+    # Filtrar los datos según las selecciones (solo bancos chilenos)
+    filtered_df = filter_data(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset)
+
+    # Con zoom solo interesan los puntos de la ventana visible
+    points = filtered_df
+    if viewport is not None:
+        with stage('filter'):
+            points = filtered_df[viewport_mask(filtered_df, viewport)]
+
+    # Sobre el umbral: densidad agregada en el servidor y solo los atípicos como puntos
+    density = None
+    lod = len(points) > SCATTER_LOD_THRESHOLD
+    if lod:
+        with stage('aggregate'):
+            valid = points[points['Total'].notna() & points['Tasa Nominal'].notna()]
+            x = valid['Total'].to_numpy(dtype=float)
+            y = valid['Tasa Nominal'].to_numpy(dtype=float)
+            outliers = extreme_points(x, y, max_points=SCATTER_LOD_THRESHOLD // 2)
+            inliers = np.ones(len(valid), dtype=bool)
+            inliers[outliers] = False
+            density = binned_density(x[inliers], y[inliers], SCATTER_LOD_BINS)
+            points = valid.iloc[outliers]
+
+    # Crear un gráfico de dispersión; "Total" se muestra como el monto del crédito sin
+    # modificar el DataFrame filtrado (puede ser compartido)
     scatter_fig = px.scatter(
-        filtered_df,
-        x='Monto del Crédito',  # Monto en el eje x
+        as_plain(points, ['Nombre Entidad Acreedora', 'Empresa', 'Tipo Moneda']),
+        x='Total',  # Monto en el eje x
         y='Tasa Nominal',  # Tasa de interés en el eje y
         color='Nombre Entidad Acreedora',
         hover_data=['Empresa', 'Tipo Moneda'],  # Aquí se especifica qué datos adicionales mostrar en el hover
-        labels={'Monto del Crédito': 'Monto del Crédito', 'Tasa Nominal': 'Tasa de Interés (%)', 'Empresa':'Empresa', 'Tipo Moneda':'Moneda'},
-        color_discrete_sequence=colores_banco,
+        labels={'Total': 'Monto del Crédito', 'Tasa Nominal': 'Tasa de Interés (%)', 'Empresa':'Empresa', 'Tipo Moneda':'Moneda'},
+        color_discrete_sequence=dataset.colores_banco,
+        render_mode='webgl' if lod or viewport is not None else 'auto',
     )
 
+    if density is not None:
+        counts, x_centers, y_centers = density
+        # La grilla va debajo de los puntos; las celdas vacías quedan transparentes
+        scatter_fig.add_trace(go.Heatmap(
+            x=x_centers, y=y_centers, z=np.where(counts > 0, counts, np.nan),
+            colorscale='Greys', showscale=False, name='Densidad',
+            hovertemplate='Monto: %{x:$,.0f}<br>Tasa: %{y:.2%}<br>Créditos: %{z}<extra></extra>',
+        ))
+        scatter_fig.data = scatter_fig.data[-1:] + scatter_fig.data[:-1]
+
     # Personalizar el gráfico de dispersión
     scatter_fig.update_layout(
         title='Relación entre Monto del Crédito y Tasa de Interés',
         xaxis_title='Monto del Crédito',
         yaxis_title='Tasa de Interés (%)',
-        font=dict(family='Arial', size=12),
         legend_title_text='Banco',
-        legend_title_font=dict(family='Arial', size=12),
-        margin=dict(l=60, r=10, t=50, b=60),
-        plot_bgcolor='#F7F7F7',
-        paper_bgcolor='#FFFFFF',
     )
 
-    scatter_fig.update_xaxes(title_text="Monto Total (M$)", showline=True, linecolor='black', tickfont=dict(family='Arial', size=12), tickformat="$,.0f")
-
-    scatter_fig.update_yaxes(title_text="Tasa Nominal %", showline=True, linecolor='black', tickfont=dict(family='Arial', size=12), tickformat=",.2%",)
+    scatter_fig.update_xaxes(title_text="Monto Total (M$)", tickformat="$,.0f")
 
+    scatter_fig.update_yaxes(title_text="Tasa Nominal %", tickformat=",.2%",)
 
+    # Mantener la ventana con zoom al reemplazar la figura
+    if viewport is not None:
+        x_range, y_range = viewport
+        if x_range is not None:
+            scatter_fig.update_xaxes(range=list(x_range))
+        if y_range is not None:
+            scatter_fig.update_yaxes(range=list(y_range))
 
     return scatter_fig
 
 
-# Función para actualizar el gráfico de caja
-@app.callback(
-    Output('boxplot', 'figure'),
-    [Input('empresa-dropdown', 'value'),
-     Input('sector-dropdown', 'value'),
-     Input('banco-dropdown', 'value'),
-     Input('plazo-dropdown', 'value')]
-)
-def update_boxplot(selected_empresas, selected_sectores, selected_bancos, selected_plazo):
-    # Filtrar el DataFrame según las selecciones
-    filtered_df = df.copy()
-    filtered_df = filtered_df[filtered_df['Pais Empresa Acreedora'] == 'Chile']
-
-    if selected_empresas:
-        filtered_df = filtered_df[filtered_df['Empresa'].isin(selected_empresas)]
-    if selected_sectores:
-        filtered_df = filtered_df[filtered_df['Sector'].isin(selected_sectores)]
-    if selected_bancos:
-        filtered_df = filtered_df[filtered_df['Nombre Entidad Acreedora'].isin(selected_bancos)]
-    if selected_plazo:
-        filtered_df = filtered_df[filtered_df['Plazo'].isin(selected_plazo)] 
-     # Verificar si el DataFrame filtrado está vacío
-    if filtered_df.empty:
+# Función para construir el gráfico de caja
+def build_boxplot(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None):
+    dataset = dataset or data_store.current
+    # Celdas del cubo según las selecciones (solo bancos chilenos)
+    cells = select_cells(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset)
+     # Verificar si la selección está vacía
+    if cells.empty:
         return px.box()
 
     # Lista ordenada de ratings
     ordered_ratings = ['AA+', 'AA', 'AA-', 'A+', 'A', 'A-', 'BBB+', 'BBB', 'BBB-', 'BB+', 'BB', 'BB-', 'B+', 'B', 'B-', 'C', 'D', 'E']
 
-    # Ajustar las categorías de 'Rating' basadas en los valores presentes en el DataFrame filtrado
-    existing_ratings = filtered_df['Rating'].dropna().unique()
-    ordered_ratings = [rating for rating in ordered_ratings if rating in existing_ratings]
+    # Cuartiles, bigotes y atípicos por rating a partir de los histogramas del cubo: la figura
+    # solo lleva los estadísticos de cada caja, no las filas
+    with stage('aggregate'):
+        histograms = dataset.rate_cube.rate_histograms(cells, 'Rating')
+        stats = {
+            rating: box_stats(histograms[rating], dataset.rate_cube.sketch.values)
+            for rating in ordered_ratings
+            if rating in histograms and histograms[rating].sum() > 0
+        }
 
     # Si no hay ratings disponibles, devolver un gráfico vacío
-    if not ordered_ratings:
+    if not stats:
         return px.box()
 
-    # Aplicar las categorías ajustadas al DataFrame
-    filtered_df['Rating'] = pd.Categorical(filtered_df['Rating'], categories=ordered_ratings, ordered=True)
-    filtered_df = filtered_df.sort_values(by='Rating')
-
-    # Crear el gráfico de caja
-    boxplot_fig = px.box(
-        filtered_df,
-        x='Rating',
-        y='Tasa Nominal',
-        color='Rating',
-        labels={'Rating': 'Rating', 'Tasa Nominal': 'Tasa de Interés (%)'}
-    )
+    # Crear el gráfico de caja (un trazo por rating, con los colores por defecto de Plotly)
+    colors = px.colors.qualitative.Plotly
+    boxplot_fig = go.Figure()
+    for i, (rating, box) in enumerate(stats.items()):
+        color = colors[i % len(colors)]
+        boxplot_fig.add_trace(go.Box(
+            name=rating, x=[rating], q1=[box['q1']], median=[box['median']], q3=[box['q3']],
+            lowerfence=[box['lowerfence']], upperfence=[box['upperfence']],
+            marker_color=color, legendgroup=rating, boxpoints=False,
+        ))
+        # Atípicos como puntos aparte: un punto por valor distinto, con la cantidad de créditos
+        if len(box['outlier_values']):
+            boxplot_fig.add_trace(go.Scatter(
+                x=[rating] * len(box['outlier_values']), y=box['outlier_values'], customdata=box['outlier_counts'],
+                mode='markers', marker=dict(color=color), name=rating, legendgroup=rating, showlegend=False,
+                hovertemplate='Rating=%{x}<br>Tasa de Interés (%)=%{y}<br>Créditos=%{customdata}<extra></extra>',
+            ))
 
     # Personalizar el gráfico de caja
     boxplot_fig.update_layout(
         title='Distribución de Tasas de Interés por Rating',
         xaxis_title='Rating',
         yaxis_title='Tasa de Interés (%)',
-        font=dict(family='Arial', size=12),
-        margin=dict(l=60, r=10, t=50, b=60),
-        plot_bgcolor='#F7F7F7',
-        paper_bgcolor='#FFFFFF'
-        
+        legend_title_text='Rating',
     )
-    
-
+    # El eje de ratings va sin línea (el template la dibuja en ambos ejes)
+    boxplot_fig.update_xaxes(categoryorder='array', categoryarray=list(stats), showline=False)
 
-    boxplot_fig.update_yaxes(title_text="Tasa Nominal %", showline=True, linecolor='black', tickfont=dict(family='Arial', size=12), tickformat=",.2%",)
+    boxplot_fig.update_yaxes(title_text="Tasa Nominal %", tickformat=",.2%",)
 
     return boxplot_fig
 
-# Añadir el gráfico de caja al layout de la aplicación
-# Definir una función para actualizar el gráfico y los mensajes informativos
-@app.callback(
-    [Output('bar-chart', 'figure'),
-     Output('scatter-plot', 'figure')],
-    [Input('empresa-dropdown', 'value'),
-     Input('sector-dropdown', 'value'),
-     Input('banco-dropdown', 'value'),
-     Input('plazo-dropdown', 'value')]
-)
-def update_bar_and_scatter(selected_empresas, selected_sectores, selected_bancos, selected_plazo):
-    # Crear una copia del DataFrame original
-    filtered_df = df.copy()
-
-    # Filtrar el DataFrame según las selecciones de empresas y sectores
-    if selected_empresas:
-        filtered_df = filtered_df[filtered_df['Empresa'].isin(selected_empresas)]
-    if selected_sectores:
-        filtered_df = filtered_df[filtered_df['Sector'].isin(selected_sectores)]
-    if selected_plazo:
-        filtered_df = filtered_df[filtered_df['Plazo'].isin(selected_plazo)]
-    # Filtrar el DataFrame para incluir solo bancos chilenos
-    filtered_df = filtered_df[filtered_df['Pais Empresa Acreedora'] == 'Chile']
-
-    # Si se han seleccionado bancos específicos, aplicar ese filtro
-    if selected_bancos:
-        filtered_df = filtered_df[filtered_df['Nombre Entidad Acreedora'].isin(selected_bancos)]
+# Función para construir el gráfico de barras agrupadas por moneda y banco
+def build_bar_chart(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None):
+    dataset = dataset or data_store.current
+    # Celdas del cubo según las selecciones (solo bancos chilenos)
+    cells = select_cells(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset)
 
-    
-    # Agrupar por moneda y calcular la tasa de interés promedio
-    grouped_df = filtered_df.groupby(['Tipo Moneda', 'Nombre Entidad Acreedora'])['Tasa Nominal'].mean().reset_index()
-    grouped_df = grouped_df.sort_values(by=['Tipo Moneda', 'Tasa Nominal'], ascending=[True, True])
-    scatter_fig = update_scatter_plot(selected_empresas, selected_sectores, selected_bancos,selected_plazo)
+    # Agrupar por moneda y calcular la tasa de interés promedio a partir del cubo
+    with stage('aggregate'):
+        grouped_df = RateCube.mean_by(cells, ['Tipo Moneda', 'Nombre Entidad Acreedora']).reset_index()
+        grouped_df = grouped_df.sort_values(by=['Tipo Moneda', 'Tasa Nominal'], ascending=[True, True])
 
-    
     # Crear un gráfico de barras grupales con colores por banco
     fig = px.bar(
-        grouped_df,
+        as_plain(grouped_df, ['Tipo Moneda', 'Nombre Entidad Acreedora']),
         x='Tipo Moneda',
         y='Tasa Nominal',
         color='Nombre Entidad Acreedora',
         barmode='group',
         labels={'Tipo Moneda': 'Moneda', 'Tasa Nominal': 'Tasa de Interés (%)'},
-        color_discrete_sequence=colores_banco,
+        color_discrete_sequence=dataset.colores_banco,
     )
 
     fig.update_yaxes(categoryorder='total ascending')
 
     # Personalizar el gráfico para hacerlo más profesional y atractivo
-    fig.update_xaxes(title_text="Moneda", showline=True, linecolor='black', tickfont=dict(family='Arial', size=12))
-    fig.update_yaxes(title_text="Tasa de Interés (%)", showline=True, linecolor='black', tickfont=dict(family='Arial', size=12), tickformat=",.2%",)
+    fig.update_xaxes(title_text="Moneda")
+    fig.update_yaxes(title_text="Tasa de Interés (%)", tickformat=",.2%",)
     fig.update_layout(
         title='Distribución de Tasas de Interés Promedio por Banco',
         xaxis_tickangle=-45,
         legend_title_text='Banco',
-        legend_title_font=dict(family="Arial", size=12),
-        font=dict(family="Arial", size=12),
-        margin=dict(l=60, r=10, t=50, b=60),
-        plot_bgcolor='#F7F7F7',  # Fondo del gráfico
-        paper_bgcolor='#FFFFFF',  # Fondo del papel
-        legend=dict(title=dict(font=dict(family="Arial", size=12))),
         legend_traceorder='normal',
     )
 
+    return fig
 
-    return fig, scatter_fig
 
+# Constructores de figuras disponibles para la caché y el endpoint /figures/<tipo>
+FIGURE_BUILDERS = {
+    'bar': build_bar_chart,
+    'scatter': update_scatter_plot,
+    'boxplot': build_boxplot,
+}
 
+# Caché de figuras ya serializadas; la versión de los datos forma parte de la clave y además
+# se vacía cuando el almacén activa una versión nueva (en la compartida, las entradas de la
+# versión anterior dejan de pedirse y salen por vencimiento o por tamaño). La compartida separa
+# además las figuras por formato (arreglos tipados) y umbral de nivel de detalle: un proceso con
+# otra configuración no las puede usar
+figure_cache = FigureCache(max_bytes=64 * 1024 * 1024,
+                           shared=shared_tier('figures', typed_arrays=FIGURE_TYPED_ARRAYS,
+                                              lod_threshold=SCATTER_LOD_THRESHOLD))
+data_store.on_reload(lambda previous, dataset: figure_cache.invalidate())
+
+
+def cached_figure(kind, selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset=None,
+                  viewport=None):
+    # Devuelve (json, etag) de la figura, construyéndola solo si no está en la caché. viewport
+    # (solo el gráfico de dispersión) es la ventana con zoom y forma parte de la clave
+    dataset = dataset or data_store.current
+    selection = normalize_selection(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+    options = {'viewport': viewport} if viewport is not None else {}
+
+    def build():
+        # La etapa figure excluye el filtrado y la agregación, que se miden por separado
+        with stage('figure'):
+            fig = FIGURE_BUILDERS[kind](*[list(values) for values in selection], dataset=dataset, **options)
+        with stage('serialize'):
+            return serialize_figure(fig, typed_arrays=FIGURE_TYPED_ARRAYS).encode("utf-8")
+
+    return figure_cache.get_or_build((kind, selection, dataset.version, viewport), build)
+
+
+# Con FIGURE_THREADS > 1 las figuras independientes de una misma selección (barras y
+# dispersión) se construyen en paralelo: el hilo de la petición arma la primera y un pool del
+# worker las demás. Solo se solapa lo que libera el GIL (numpy, parte de pandas); armar las
+# figuras de plotly y serializarlas no, por lo que con benchmarks/load_test.py no se midió
+# mejora y por defecto se arman una tras otra en el hilo de la petición
+FIGURE_THREADS = int(os.environ.get("FIGURE_THREADS", "1"))
+_figure_pools = {}
+_figure_pool_lock = threading.Lock()
+
+
+def figure_pool():
+    # Un pool por proceso, creado al primer uso (los hilos del maestro no pasan a los workers)
+    with _figure_pool_lock:
+        pool = _figure_pools.get(os.getpid())
+        if pool is None:
+            pool = _figure_pools[os.getpid()] = ThreadPoolExecutor(max_workers=FIGURE_THREADS - 1,
+                                                                   thread_name_prefix="figure-build")
+        return pool
+
+
+def build_concurrently(*builds):
+    # Ejecuta las funciones sin argumentos y devuelve sus resultados en el mismo orden
+    if FIGURE_THREADS <= 1 or len(builds) < 2:
+        return [build() for build in builds]
+    futures = [figure_pool().submit(bind_callback(build)) for build in builds[1:]]
+    return [builds[0]()] + [future.result() for future in futures]
+
+
+def figure_payload(payload):
+    # Dash vuelve a serializar la figura al responder; aquí solo se decodifica el JSON cacheado
+    with stage('serialize'):
+        return json.loads(payload)
+
+
+def wire_figure(fig):
+    # Figura tal como va en la respuesta de un callback que no pasa por la caché: con
+    # FIGURE_TYPED_ARRAYS, el JSON con los datos de los trazos en binario
+    if not FIGURE_TYPED_ARRAYS:
+        return fig
+    with stage('serialize'):
+        return json.loads(serialize_figure(fig, typed_arrays=True))
 
-@app.server.route("/download_csv")
-def download_csv():
-    # Guardar el DataFrame en un archivo CSV en memoria
-    csv_data = df_bancos_chilenos.to_csv(index=False)
 
-    # Crear un objeto de archivo en memoria utilizando io.BytesIO
-    mem_file = io.BytesIO()
-    mem_file.write(csv_data.encode())
-    mem_file.seek(0)
-    now = dt.now().strftime("%d-%m-%y")
+# Función para actualizar el gráfico de caja
+@server_callback(
+    Output('boxplot', 'figure'),
+    [Input('empresa-dropdown', 'value'),
+     Input('sector-dropdown', 'value'),
+     Input('banco-dropdown', 'value'),
+     Input('plazo-dropdown', 'value'),
+     Input('periodo-dropdown', 'value')]
+)
+@instrument_callback('update_boxplot')
+def update_boxplot(selected_empresas, selected_sectores, selected_bancos, selected_plazo, selected_periodo):
+    payload, _ = cached_figure('boxplot', selected_empresas, selected_sectores, selected_bancos, selected_plazo,
+                               get_dataset(selected_periodo))
+    return figure_payload(payload)
 
 
+# Definir una función para actualizar el gráfico y los mensajes informativos
+@server_callback(
+    [Output('bar-chart', 'figure'),
+     Output('scatter-plot', 'figure')],
+    [Input('empresa-dropdown', 'value'),
+     Input('sector-dropdown', 'value'),
+     Input('banco-dropdown', 'value'),
+     Input('plazo-dropdown', 'value'),
+     Input('periodo-dropdown', 'value'),
+     Input('scatter-plot', 'relayoutData')]
+)
+@instrument_callback('update_bar_and_scatter')
+def update_bar_and_scatter(selected_empresas, selected_sectores, selected_bancos, selected_plazo, selected_periodo,
+                           scatter_relayout):
+    # Ambas figuras se construyen con la misma versión de los datos aunque haya una recarga en curso
+    dataset = get_dataset(selected_periodo)
+
+    # Zoom en el gráfico de dispersión: solo se actualiza ese gráfico, y solo si la vista completa
+    # estaba agregada (si no, el navegador ya tiene todos los puntos)
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if triggered == ['scatter-plot.relayoutData']:
+        reset = any(key.endswith('.autorange') for key in scatter_relayout or {})
+        if not reset and viewport_from_relayout(scatter_relayout) is None:
+            return dash.no_update, dash.no_update
+        filtered_df = filter_data(selected_empresas, selected_sectores, selected_bancos, selected_plazo, dataset)
+        if len(filtered_df) <= SCATTER_LOD_THRESHOLD:
+            return dash.no_update, dash.no_update
+        scatter_payload, _ = cached_figure('scatter', selected_empresas, selected_sectores, selected_bancos,
+                                           selected_plazo, dataset, viewport=viewport_from_relayout(scatter_relayout))
+        return dash.no_update, figure_payload(scatter_payload)
+
+    # Registrar la selección para precalcular las más usadas tras un reinicio
+    selection_log.record((selected_empresas, selected_sectores, selected_bancos, selected_plazo), dataset.sheet_name)
+    selection = (selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+    (bar_payload, _), (scatter_payload, _) = build_concurrently(
+        lambda: cached_figure('bar', *selection, dataset),
+        lambda: cached_figure('scatter', *selection, dataset),
+    )
+    return figure_payload(bar_payload), figure_payload(scatter_payload)
+
+
+# Precálculo de KPIs y figuras al iniciar el worker y al recargar los datos: selección vacía,
+# cada empresa, sector y banco por separado, las WARMUP_POPULAR selecciones más usadas del
+# registro y las de WARMUP_SELECTIONS_FILE. Se desactiva con WARMUP_ENABLED=0
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") == "1"
+WARMUP_POPULAR = int(os.environ.get("WARMUP_POPULAR", "20"))
+selection_log = SelectionLog()
+warmer = Warmer(
+    {
+        'kpis': lambda dataset, selection: cached_kpis(*selection, dataset=dataset),
+        'bar': lambda dataset, selection: cached_figure('bar', *selection, dataset=dataset),
+        'scatter': lambda dataset, selection: cached_figure('scatter', *selection, dataset=dataset),
+        'boxplot': lambda dataset, selection: cached_figure('boxplot', *selection, dataset=dataset),
+    },
+    extra_selections=lambda dataset: (selection_log.popular(dataset.sheet_name, WARMUP_POPULAR)
+                                      + load_selections(os.environ.get("WARMUP_SELECTIONS_FILE"))),
+    max_workers=int(os.environ.get("WARMUP_WORKERS", "2")),
+)
+
+
+def start_warmup(dataset=None):
+    if WARMUP_ENABLED:
+        warmer.start(dataset or data_store.current)
+
+
+def start_background():
+    data_store.start_background()
+    selection_log.start()
+    start_warmup()
+
+
+data_store.on_reload(lambda previous, dataset: start_warmup(dataset))
+if BACKGROUND_AT_IMPORT:
+    start_background()
+
+
+# Comparación entre períodos: diferencia de tasa promedio por banco y por empresa
+def build_comparison_chart(comparison, by, title, yaxis_title):
+    fig = px.bar(
+        as_plain(comparison, [by]),
+        x='Diferencia',
+        y=by,
+        orientation='h',
+        hover_data=['Tasa Actual', 'Tasa Anterior'],
+        labels={'Diferencia': 'Diferencia de Tasa', by: yaxis_title},
+        color='Diferencia',
+        color_continuous_scale='RdYlGn_r',
+        color_continuous_midpoint=0,
+    )
+    fig.update_xaxes(title_text="Diferencia de Tasa (puntos %)", tickformat=",.2%",)
+    fig.update_yaxes(title_text=yaxis_title)
+    fig.update_layout(
+        title=title,
+        coloraxis_showscale=False,
+    )
+    return fig
+
+
+COMPARISON_OUTPUTS = [Output('comparison-bank-chart', 'figure'),
+                      Output('comparison-company-chart', 'figure'),
+                      Output('comparison-container', 'style')]
 
-    # Devolver el archivo CSV generado como respuesta
-    return send_file(mem_file, mimetype="text/csv", as_attachment=True,download_name=f"data_{now}.csv")
+
+@server_callback(
+    COMPARISON_OUTPUTS,
+    [Input('empresa-dropdown', 'value'),
+     Input('sector-dropdown', 'value'),
+     Input('banco-dropdown', 'value'),
+     Input('plazo-dropdown', 'value'),
+     Input('periodo-dropdown', 'value'),
+     Input('comparar-dropdown', 'value')]
+)
+@instrument_callback('update_comparison')
+def update_comparison(selected_empresas, selected_sectores, selected_bancos, selected_plazo, selected_periodo,
+                      compared_periodo):
+    return comparison_outputs((selected_empresas, selected_sectores, selected_bancos, selected_plazo),
+                              selected_periodo, compared_periodo)
+
+
+def comparison_outputs(selection, selected_periodo, compared_periodo):
+    # Sin período de comparación la sección queda oculta y sus gráficos no se rearman (construir
+    # dos figuras vacías costaba ~200 ms en cada cambio de los dropdowns)
+    if not compared_periodo or compared_periodo not in data_store.periods:
+        return dash.no_update, dash.no_update, {'display': 'none'}
+    current = get_dataset(selected_periodo)
+    previous = data_store.get(compared_periodo)
+    current_cells = select_cells(*selection, dataset=current)
+    previous_cells = select_cells(*selection, dataset=previous)
+    title_suffix = f"{period_label(current.sheet_name)} vs {period_label(previous.sheet_name)}"
+
+    with stage('aggregate'):
+        bank_comparison = compare_periods(current_cells, previous_cells, 'Nombre Entidad Acreedora')
+        company_comparison = compare_periods(current_cells, previous_cells, 'Empresa')
+    with stage('figure'):
+        bank_fig = build_comparison_chart(
+            bank_comparison,
+            'Nombre Entidad Acreedora', f"Cambio en la Tasa Promedio por Banco ({title_suffix})", 'Banco')
+        company_fig = build_comparison_chart(
+            company_comparison,
+            'Empresa', f"Cambio en la Tasa Promedio por Empresa ({title_suffix})", 'Empresa')
+    return wire_figure(bank_fig), wire_figure(company_fig), {'display': 'block'}
+
+
+@server_callback(
+    [Output('empresa-dropdown', 'options'),
+     Output('sector-dropdown', 'options'),
+     Output('banco-dropdown', 'options'),
+     Output('plazo-dropdown', 'options')],
+    [Input('empresa-dropdown', 'value'),
+     Input('sector-dropdown', 'value'),
+     Input('banco-dropdown', 'value'),
+     Input('plazo-dropdown', 'value'),
+     Input('periodo-dropdown', 'value')]
+)
+@instrument_callback('update_dropdown_options')
+def update_dropdown_options(selected_empresas, selected_sectores, selected_bancos, selected_plazo, selected_periodo):
+    # Opciones dependientes: cada dropdown muestra solo los valores con créditos bajo las
+    # selecciones de los demás (en el período seleccionado), con la cantidad en la etiqueta
+    dataset = get_dataset(selected_periodo)
+    with stage('aggregate'):
+        return dataset.dropdown_options(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+
+
+# Datos compactos por versión para el modo clientside (se arman una vez por versión)
+compact_payloads = LRUCache(maxsize=8)
+
+
+def compact_payload(dataset):
+    # Filas de bancos chilenos codificadas por columnas, más el layout de cada figura (construido
+    # en el servidor sin filtros) y los colores, para armar las figuras en el navegador
+    def build():
+        payload = encode_frame(dataset.df_bancos_chilenos)
+        layouts = {
+            kind: json.loads(builder([], [], [], [], dataset=dataset).to_json())['layout']
+            for kind, builder in FIGURE_BUILDERS.items()
+        }
+        template = None
+        for layout in layouts.values():
+            template = layout.pop('template', template)
+        payload.update(version=dataset.version, template=template, layouts=layouts,
+                       colors=dataset.colores_banco, box_colors=px.colors.qualitative.Plotly)
+        return payload
+    return compact_payloads.get_or_compute(dataset.version, build)
+
+
+if CLIENTSIDE_FILTERING:
+    filter_inputs = [Input('empresa-dropdown', 'value'),
+                     Input('sector-dropdown', 'value'),
+                     Input('banco-dropdown', 'value'),
+                     Input('plazo-dropdown', 'value'),
+                     Input('compact-data', 'data')]
+    app.clientside_callback(ClientsideFunction('tasas', 'kpis'),
+                            Output('kpi-cards-container', 'children'), filter_inputs)
+    app.clientside_callback(ClientsideFunction('tasas', 'barAndScatter'),
+                            [Output('bar-chart', 'figure'), Output('scatter-plot', 'figure')], filter_inputs)
+    app.clientside_callback(ClientsideFunction('tasas', 'boxplot'),
+                            Output('boxplot', 'figure'), filter_inputs)
+    app.clientside_callback(ClientsideFunction('tasas', 'options'),
+                            [Output('empresa-dropdown', 'options'), Output('sector-dropdown', 'options'),
+                             Output('banco-dropdown', 'options'), Output('plazo-dropdown', 'options')],
+                            filter_inputs)
+
+    # Una sola petición al cargar la página y otra por cada cambio de período
+    @app.callback(Output('compact-data', 'data'), [Input('periodo-dropdown', 'value')])
+    @instrument_callback('update_compact_data')
+    def update_compact_data(selected_periodo):
+        return compact_payload(get_dataset(selected_periodo))
+
+    # La comparación entre períodos se sigue calculando en el servidor, pero los filtros y el
+    # período de comparación le llegan por comparison-selection, que el navegador solo actualiza si
+    # hay un período de comparación: sin él, los cambios de los dropdowns no hacen ninguna petición.
+    # Cada cambio (de filtros, de período o de período de comparación) dispara una sola petición
+    app.clientside_callback(ClientsideFunction('tasas', 'comparisonSelection'),
+                            Output('comparison-selection', 'data'),
+                            filter_inputs[:4] + [Input('comparar-dropdown', 'value')],
+                            [State('comparison-selection', 'data')])
+
+    @app.callback(COMPARISON_OUTPUTS,
+                  [Input('comparison-selection', 'data'),
+                   Input('periodo-dropdown', 'value')])
+    @instrument_callback('update_comparison')
+    def update_comparison_clientside(comparison, selected_periodo):
+        if not comparison:
+            return dash.no_update, dash.no_update, {'display': 'none'}
+        return comparison_outputs(comparison[:4], selected_periodo, comparison[4])
+
+
+@app.server.route("/figures/<kind>")
+def figure_json(kind):
+    # Figura serializada para la selección de los parámetros empresa, sector, banco y plazo,
+    # con ETag para que el cliente pueda revalidar sin volver a descargarla
+    if kind not in FIGURE_BUILDERS:
+        abort(404)
+    payload, etag = cached_figure(kind, *selection_from_args(), dataset_from_args(data_store.get))
+    if etag_matches(request.if_none_match, etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    return Response(payload, mimetype="application/json",
+                    headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+
+@app.server.route("/figures/stats")
+def figure_stats():
+    return jsonify(figures=figure_cache.stats(), filtered=data_store.current.filtered_cache.stats())
+
+
+@app.server.route("/status")
+def status():
+    # Versión de datos activa, recargas y estado de las cachés
+    return jsonify(data=data_store.status(), figures=figure_cache.stats(), kpis=kpi_cache.stats(),
+                   warmup=warmer.status())
+
+
+@registry.gauges
+def cache_gauges():
+    # Estado de las cachés y de los datos al momento de cada lectura de /metrics
+    figures = figure_cache.stats()
+    filtered = data_store.current.filtered_cache.stats()
+    tiers = []
+    for name, stats in (('figures', figures), ('kpis', kpi_cache.stats())):
+        tiers.append(('tasas_cache_hit_rate', {'cache': name, 'tier': 'local'}, stats['hit_rate']))
+        if 'shared' in stats:
+            tiers.append(('tasas_cache_hit_rate', {'cache': name, 'tier': 'shared'}, stats['shared']['hit_rate']))
+    if shared_store is not None:
+        store = shared_store.stats()
+        tiers += [('tasas_shared_cache_bytes', {}, store['bytes']),
+                  ('tasas_shared_cache_entries', {}, store['entries'])]
+    return tiers + [
+        ('tasas_figure_cache_bytes', {}, figures['bytes']),
+        ('tasas_figure_cache_entries', {}, figures['entries']),
+        ('tasas_figure_cache_hit_rate', {}, figures['hit_rate']),
+        ('tasas_filtered_cache_hit_rate', {}, filtered['hit_rate']),
+        ('tasas_warmup_done', {}, warmer.status().get('done', 0)),
+        ('tasas_warmup_total', {}, warmer.status().get('total', 0)),
+        ('tasas_dataset_rows', {'data_version': data_store.current.version}, len(data_store.current.df)),
+    ]
+
+
+@app.server.route("/metrics")
+def metrics():
+    # Métricas de este worker en formato de texto de Prometheus
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.server.route("/download_csv")
+def download_csv():
+    # Generar el CSV en streaming por bloques, aplicando los mismos filtros del dashboard
+    # (parámetros empresa, sector, banco, plazo y periodo) y opcionalmente comprimido con gzip=1
+    dataset = dataset_from_args(data_store.get)
+    row_ids = dataset.row_ids(*selection_from_args())
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+    now = dt.now().strftime("%d-%m-%y")
+
+    filename = f"data_{now}.csv.gz" if use_gzip else f"data_{now}.csv"
+    return Response(
+        stream_with_context(iter_csv(dataset.df, row_ids, gzip=use_gzip)),
+        mimetype="application/gzip" if use_gzip else "text/csv",
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
 
 @app.server.route("/download_excel")
 def download_excel():
-    excel_path = "../Idea/tasas_interes.xlsx"  # Reemplaza con la ruta real de tu archivo CSV
-    return send_file(excel_path, as_attachment=True)
+    # Servir el Excel pre-generado (las filas del dashboard sin filtros, como el CSV) o, con
+    # filtros en la URL, la variante filtrada. send_file agrega Content-Length, ETag y
+    # Last-Modified y responde 304 a las peticiones condicionales. Una selección sin filas (p.ej.
+    # con valores que no existen) se arma en memoria y no se guarda
+    dataset = dataset_from_args(data_store.get)
+    key = normalize_selection(*selection_from_args())
+    download_name = f"tasas_interes_{period_label(dataset.sheet_name)}.xlsx"
+    if not any(key):
+        excel_path = dataset.excel_exporter.full_export()
+    else:
+        row_ids = dataset.row_ids(*key)
+        if not len(row_ids):
+            return send_file(dataset.excel_exporter.export_bytes(row_ids), as_attachment=True,
+                             download_name=download_name, max_age=0)
+        excel_path = dataset.excel_exporter.filtered_export(row_ids)
+    return send_file(os.path.abspath(excel_path), as_attachment=True, download_name=download_name,
+                     conditional=True, etag=True, max_age=0)
 # Ejecutar la aplicación Dash
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,492 @@
+// Modo de filtrado en el navegador (CLIENTSIDE_FILTERING=1): los filtros, los KPIs y los
+// gráficos se calculan aquí a partir de los datos compactos del dcc.Store 'compact-data', con
+// las mismas fórmulas que generate_kpis y los constructores de figuras de app.py
+(function () {
+    var TYPED_ARRAYS = {
+        int8: Int8Array, int16: Int16Array, int32: Int32Array, float64: Float64Array
+    };
+    var ORDERED_RATINGS = ['AA+', 'AA', 'AA-', 'A+', 'A', 'A-', 'BBB+', 'BBB', 'BBB-', 'BB+', 'BB', 'BB-',
+                           'B+', 'B', 'B-', 'C', 'D', 'E'];
+    var FILTER_COLUMNS = ['Empresa', 'Sector', 'Nombre Entidad Acreedora', 'Plazo'];
+
+    var decoded = {version: null, columns: null};
+
+    function decodeArray(encoded) {
+        var binary = atob(encoded.data);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new TYPED_ARRAYS[encoded.dtype](bytes.buffer);
+    }
+
+    function columns(store) {
+        // Los arreglos se decodifican una sola vez por versión de los datos
+        if (decoded.version !== store.version || decoded.columns === null) {
+            var result = {};
+            Object.keys(store.columns).forEach(function (name) {
+                var column = store.columns[name];
+                result[name] = column.codes
+                    ? {codes: decodeArray(column.codes), labels: column.labels}
+                    : {values: decodeArray(column.values)};
+            });
+            decoded = {version: store.version, columns: result};
+        }
+        return decoded.columns;
+    }
+
+    function filterRows(store, selections) {
+        // Filas que cumplen las selecciones (None o [] significan "sin filtro")
+        var cols = columns(store);
+        var allowed = FILTER_COLUMNS.map(function (name, i) {
+            var selected = selections[i];
+            if (!selected || selected.length === 0) {
+                return null;
+            }
+            var codes = new Set();
+            cols[name].labels.forEach(function (label, code) {
+                if (selected.indexOf(label) !== -1) {
+                    codes.add(code);
+                }
+            });
+            return {codes: cols[name].codes, set: codes};
+        }).filter(function (filter) { return filter !== null; });
+
+        var rows = [];
+        for (var row = 0; row < store.rows; row++) {
+            var keep = true;
+            for (var f = 0; f < allowed.length && keep; f++) {
+                keep = allowed[f].set.has(allowed[f].codes[row]);
+            }
+            if (keep) {
+                rows.push(row);
+            }
+        }
+        return rows;
+    }
+
+    function finite(value) {
+        return !Number.isNaN(value);
+    }
+
+    function formatPercent(value) {
+        // Equivalente a f"{valor:.2f}%" de Python
+        return (Number.isNaN(value) ? 'nan' : value.toFixed(2)) + '%';
+    }
+
+    function component(namespace, type, props) {
+        return {props: props, type: type, namespace: namespace};
+    }
+
+    var KPI_BANK = 'Nombre Entidad Acreedora';
+    var KPI_COLUMNS = ['Tasa Promedio', 'Tasa Promedio Ponderada', 'Monto Total (M$)', 'Operaciones'];
+
+    function formatRate(value) {
+        return Number.isNaN(value) ? '—' : formatPercent(value * 100);
+    }
+
+    function formatThousands(value) {
+        // Equivalente a f"{valor:,.0f}" de Python
+        return Math.round(value).toString().replace(/\B(?=(\d{3})+(?!\d))/g, ',');
+    }
+
+    function emptySums() {
+        return {rateSum: 0, rateCount: 0, totalSum: 0, rateTotalSum: 0, rows: 0};
+    }
+
+    function addRow(sums, rate, total) {
+        // Mismas sumas que una celda de RateCube (los vacíos no suman)
+        var product = rate * total;
+        if (finite(rate)) {
+            sums.rateSum += rate;
+            sums.rateCount += 1;
+        }
+        if (finite(total)) {
+            sums.totalSum += total;
+        }
+        if (finite(product)) {
+            sums.rateTotalSum += product;
+        }
+        sums.rows += 1;
+    }
+
+    function metrics(sums) {
+        // Como summarize de aggregates.py
+        return {
+            mean: sums.rateCount > 0 ? sums.rateSum / sums.rateCount : NaN,
+            weightedMean: sums.totalSum !== 0 ? sums.rateTotalSum / sums.totalSum : NaN,
+            total: sums.totalSum,
+            rows: sums.rows
+        };
+    }
+
+    function kpiSummary(rows, cols) {
+        // Sumas del total y de cada banco y empresa en una sola pasada por las filas
+        var rates = cols['Tasa Nominal'].values, totals = cols['Total'].values;
+        var overall = emptySums(), groups = {};
+        var dimensions = [KPI_BANK, 'Empresa'];
+        dimensions.forEach(function (name) { groups[name] = {}; });
+        rows.forEach(function (row) {
+            addRow(overall, rates[row], totals[row]);
+            dimensions.forEach(function (name) {
+                var code = cols[name].codes[row];
+                if (code >= 0) {
+                    groups[name][code] = groups[name][code] || emptySums();
+                    addRow(groups[name][code], rates[row], totals[row]);
+                }
+            });
+        });
+        var summary = {overall: metrics(overall)};
+        dimensions.forEach(function (name) {
+            summary[name] = Object.keys(groups[name]).map(function (code) {
+                return Object.assign({label: cols[name].labels[code]}, metrics(groups[name][code]));
+            });
+        });
+        return summary;
+    }
+
+    function compareLabels(a, b) {
+        return a.label < b.label ? -1 : a.label > b.label ? 1 : 0;
+    }
+
+    function kpiRow(label, values, className) {
+        var cells = [formatRate(values.mean), formatRate(values.weightedMean),
+                     '$' + formatThousands(values.total), formatThousands(values.rows)];
+        return component('dash_html_components', 'Tr', {
+            children: [component('dash_html_components', 'Td', {children: label})].concat(cells.map(function (value) {
+                return component('dash_html_components', 'Td', {children: value});
+            })),
+            className: className || null
+        });
+    }
+
+    function kpiTable(groups, title, sortBy, overall) {
+        // Como kpi_table de app.py: de mayor a menor tasa, vacíos al final y empates por nombre
+        var sorted = groups.slice().sort(function (a, b) {
+            var x = a[sortBy], y = b[sortBy];
+            if (Number.isNaN(x) !== Number.isNaN(y)) {
+                return Number.isNaN(x) ? 1 : -1;
+            }
+            if (!Number.isNaN(x) && x !== y) {
+                return y - x;
+            }
+            return compareLabels(a, b);
+        });
+        var body = sorted.map(function (group) { return kpiRow(group.label, group); });
+        if (overall) {
+            body.push(kpiRow('Total selección', overall, 'fw-bold'));
+        }
+        var header = component('dash_html_components', 'Tr', {
+            children: [component('dash_html_components', 'Th', {children: title})].concat(KPI_COLUMNS.map(function (column) {
+                return component('dash_html_components', 'Th', {children: column});
+            }))
+        });
+        return component('dash_bootstrap_components', 'Table', {
+            children: [component('dash_html_components', 'Thead', {children: header}),
+                       component('dash_html_components', 'Tbody', {children: body})],
+            bordered: false, hover: true, striped: true, size: 'sm', className: 'kpi-table'
+        });
+    }
+
+    function kpis(empresas, sectores, bancos, plazos, store) {
+        if (!store) {
+            return window.dash_clientside.no_update;
+        }
+        var cols = columns(store);
+        var summary = kpiSummary(filterRows(store, [empresas, sectores, bancos, plazos]), cols);
+        if (summary.overall.rows === 0) {
+            return component('dash_bootstrap_components', 'Container', {children: [
+                component('dash_html_components', 'P', {
+                    children: 'No hay créditos de bancos chilenos para la selección.',
+                    className: 'card-text text-muted'
+                })
+            ]});
+        }
+
+        // Bancos con la tasa promedio más alta y más baja (en empates, el primero por nombre)
+        var max = null, min = null;
+        summary[KPI_BANK].slice().sort(compareLabels).forEach(function (bank) {
+            if (Number.isNaN(bank.mean)) {
+                return;
+            }
+            if (max === null || bank.mean > max.mean) {
+                max = bank;
+            }
+            if (min === null || bank.mean < min.mean) {
+                min = bank;
+            }
+        });
+        var children = [];
+        if (max !== null) {
+            children.push(component('dash_bootstrap_components', 'Row', {
+                children: component('dash_bootstrap_components', 'Col', {
+                    children: component('dash_html_components', 'P', {
+                        children: [
+                            'Tasa de Interés más Alta: ' + max.label + ' ',
+                            component('dash_html_components', 'Strong', {children: formatRate(max.mean)}),
+                            ' · Tasa de Interés más Baja: ' + min.label + ' ',
+                            component('dash_html_components', 'Strong', {children: formatRate(min.mean)})
+                        ],
+                        className: 'card-title text-muted'
+                    })
+                })
+            }));
+        }
+        children.push(kpiTable(summary[KPI_BANK], 'Banco', 'mean', summary.overall));
+        if (empresas && empresas.length) {
+            children.push(kpiTable(summary['Empresa'], 'Empresa', 'weightedMean'));
+        }
+        children.push(component('dash_bootstrap_components', 'Row', {children: [
+            component('dash_bootstrap_components', 'Col', {children: component('dash_html_components', 'P', {
+                children: 'Nota: El promedio de tasa de interés incluye todas las monedas ofrecidas por el banco.',
+                className: 'card-text text-muted'
+            })})
+        ]}));
+        return component('dash_bootstrap_components', 'Container', {children: children});
+    }
+
+    function layout(store, kind) {
+        return Object.assign({template: store.template}, store.layouts[kind]);
+    }
+
+    function tracesBy(rows, codes, labels, build) {
+        // Un trazo por valor en orden de primera aparición, como Plotly Express con color=...
+        var order = [], groups = {};
+        rows.forEach(function (row) {
+            var code = codes[row];
+            if (!(code in groups)) {
+                groups[code] = [];
+                order.push(code);
+            }
+            groups[code].push(row);
+        });
+        return order.map(function (code, i) {
+            return build(code < 0 ? null : labels[code], groups[code], i);
+        });
+    }
+
+    function nullable(value) {
+        return Number.isNaN(value) ? null : value;
+    }
+
+    function barChart(store, rows) {
+        var cols = columns(store);
+        var moneda = cols['Tipo Moneda'], bank = cols['Nombre Entidad Acreedora'];
+        var rates = cols['Tasa Nominal'].values;
+
+        // Promedio por (moneda, banco), en el orden de agrupación de pandas
+        var groups = {};
+        rows.forEach(function (row) {
+            var m = moneda.codes[row], b = bank.codes[row];
+            if (m < 0 || b < 0) {
+                return;
+            }
+            var key = m * bank.labels.length + b;
+            var group = groups[key] || (groups[key] = {moneda: m, bank: b, sum: 0, count: 0});
+            if (finite(rates[row])) {
+                group.sum += rates[row];
+                group.count += 1;
+            }
+        });
+        var grouped = Object.keys(groups).map(Number).sort(function (a, b) { return a - b; }).map(function (key) {
+            var group = groups[key];
+            return {moneda: group.moneda, bank: group.bank, rate: group.count ? group.sum / group.count : NaN};
+        });
+        // Ordenar por moneda y tasa (vacíos al final), de forma estable como sort_values
+        grouped.sort(function (a, b) {
+            if (a.moneda !== b.moneda) {
+                return a.moneda - b.moneda;
+            }
+            if (Number.isNaN(a.rate) || Number.isNaN(b.rate)) {
+                return Number.isNaN(a.rate) - Number.isNaN(b.rate);
+            }
+            return a.rate - b.rate;
+        });
+
+        var order = [], byBank = {};
+        grouped.forEach(function (group) {
+            if (!(group.bank in byBank)) {
+                byBank[group.bank] = [];
+                order.push(group.bank);
+            }
+            byBank[group.bank].push(group);
+        });
+        var data = order.map(function (code, i) {
+            var name = bank.labels[code];
+            return {
+                alignmentgroup: 'True',
+                hovertemplate: 'Nombre Entidad Acreedora=' + name + '<br>Moneda=%{x}<br>Tasa de Interés (%)=%{y}<extra></extra>',
+                legendgroup: name,
+                marker: {color: store.colors[i % store.colors.length], pattern: {shape: ''}},
+                name: name,
+                offsetgroup: name,
+                orientation: 'v',
+                showlegend: true,
+                textposition: 'auto',
+                x: byBank[code].map(function (group) { return moneda.labels[group.moneda]; }),
+                xaxis: 'x',
+                y: byBank[code].map(function (group) { return nullable(group.rate); }),
+                yaxis: 'y',
+                type: 'bar'
+            };
+        });
+        return {data: data, layout: layout(store, 'bar')};
+    }
+
+    function scatterPlot(store, rows) {
+        var cols = columns(store);
+        var bank = cols['Nombre Entidad Acreedora'], empresa = cols['Empresa'], moneda = cols['Tipo Moneda'];
+        var totals = cols['Total'].values, rates = cols['Tasa Nominal'].values;
+        // Plotly Express usa WebGL sobre 1000 puntos
+        var type = rows.length > 1000 ? 'scattergl' : 'scatter';
+        var data = tracesBy(rows, bank.codes, bank.labels, function (name, groupRows, i) {
+            var trace = {
+                customdata: groupRows.map(function (row) {
+                    return [empresa.codes[row] < 0 ? null : empresa.labels[empresa.codes[row]],
+                            moneda.codes[row] < 0 ? null : moneda.labels[moneda.codes[row]]];
+                }),
+                hovertemplate: 'Nombre Entidad Acreedora=' + name + '<br>Monto del Crédito=%{x}<br>Tasa de Interés (%)=%{y}<br>Empresa=%{customdata[0]}<br>Moneda=%{customdata[1]}<extra></extra>',
+                legendgroup: name,
+                marker: {color: store.colors[i % store.colors.length], symbol: 'circle'},
+                mode: 'markers',
+                name: name,
+                orientation: 'v',
+                showlegend: true,
+                x: groupRows.map(function (row) { return nullable(totals[row]); }),
+                xaxis: 'x',
+                y: groupRows.map(function (row) { return nullable(rates[row]); }),
+                yaxis: 'y',
+                type: type
+            };
+            // Plotly Express no fija la orientación en los trazos WebGL
+            if (type === 'scattergl') {
+                delete trace.orientation;
+            }
+            return trace;
+        });
+        return {data: data, layout: layout(store, 'scatter')};
+    }
+
+    function boxplot(store, rows) {
+        // Gráfico de caja con los puntos crudos: Plotly calcula los cuartiles en el navegador
+        var cols = columns(store);
+        var rating = cols['Rating'], rates = cols['Tasa Nominal'].values;
+        var byRating = {};
+        rows.forEach(function (row) {
+            var code = rating.codes[row];
+            if (code >= 0) {
+                (byRating[rating.labels[code]] = byRating[rating.labels[code]] || []).push(row);
+            }
+        });
+        var present = ORDERED_RATINGS.filter(function (label) { return label in byRating; });
+        if (present.length === 0) {
+            return {data: [], layout: {template: store.template}};
+        }
+        var data = present.map(function (label, i) {
+            var values = byRating[label].map(function (row) { return nullable(rates[row]); });
+            return {
+                hovertemplate: 'Rating=%{x}<br>Tasa de Interés (%)=%{y}<extra></extra>',
+                legendgroup: label,
+                marker: {color: store.box_colors[i % store.box_colors.length]},
+                name: label,
+                x: values.map(function () { return label; }),
+                y: values,
+                type: 'box'
+            };
+        });
+        var boxLayout = layout(store, 'boxplot');
+        boxLayout.xaxis = Object.assign({}, boxLayout.xaxis, {categoryorder: 'array', categoryarray: present});
+        return {data: data, layout: boxLayout};
+    }
+
+    function figures(empresas, sectores, bancos, plazos, store) {
+        if (!store) {
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+        }
+        var rows = filterRows(store, [empresas, sectores, bancos, plazos]);
+        return [barChart(store, rows), scatterPlot(store, rows)];
+    }
+
+    function box(empresas, sectores, bancos, plazos, store) {
+        if (!store) {
+            return window.dash_clientside.no_update;
+        }
+        return boxplot(store, filterRows(store, [empresas, sectores, bancos, plazos]));
+    }
+
+    function compareOptions(a, b) {
+        // Como option_sort_key de filters.py: por nombre sin distinguir mayúsculas
+        var x = a.toLowerCase(), y = b.toLowerCase();
+        if (x !== y) {
+            return x < y ? -1 : 1;
+        }
+        return a < b ? -1 : a > b ? 1 : 0;
+    }
+
+    function options(empresas, sectores, bancos, plazos, store) {
+        // Como Dataset.dropdown_options: cada dropdown con los valores que tienen filas bajo las
+        // selecciones de los otros tres (más los ya elegidos), por nombre y con la cantidad
+        if (!store) {
+            return FILTER_COLUMNS.map(function () { return window.dash_clientside.no_update; });
+        }
+        var cols = columns(store);
+        var selections = [empresas, sectores, bancos, plazos];
+        var filters = FILTER_COLUMNS.map(function (name, i) {
+            var selected = selections[i];
+            var allowed = null;
+            if (selected && selected.length) {
+                allowed = new Uint8Array(cols[name].labels.length);
+                cols[name].labels.forEach(function (label, code) {
+                    allowed[code] = selected.indexOf(label) !== -1 ? 1 : 0;
+                });
+            }
+            return {codes: cols[name].codes, allowed: allowed, counts: new Float64Array(cols[name].labels.length)};
+        });
+        for (var row = 0; row < store.rows; row++) {
+            // Una fila cuenta para un filtro si cumple todos los demás
+            var failed = 0, failedAt = -1, f, code;
+            for (f = 0; f < filters.length; f++) {
+                code = filters[f].codes[row];
+                if (filters[f].allowed !== null && (code < 0 || !filters[f].allowed[code])) {
+                    failed += 1;
+                    failedAt = f;
+                }
+            }
+            for (f = 0; f < filters.length && failed < 2; f++) {
+                code = filters[f].codes[row];
+                if (code >= 0 && (failed === 0 || failedAt === f)) {
+                    filters[f].counts[code] += 1;
+                }
+            }
+        }
+        return filters.map(function (filter, i) {
+            var counts = {};
+            cols[FILTER_COLUMNS[i]].labels.forEach(function (label, code) {
+                if (filter.counts[code]) {
+                    counts[label] = filter.counts[code];
+                }
+            });
+            (selections[i] || []).forEach(function (value) {
+                counts[value] = counts[value] || 0;
+            });
+            return Object.keys(counts).sort(compareOptions).map(function (value) {
+                return {label: value + ' (' + formatThousands(counts[value]) + ')', value: value};
+            });
+        });
+    }
+
+    function comparisonSelection(empresas, sectores, bancos, plazos, compared, current) {
+        // Filtros y período de comparación para el callback del servidor, que solo depende de
+        // este store y del período: sin período de comparación los dropdowns no hacen peticiones
+        // (al quitarlo se envía null una vez, para ocultar la sección)
+        if (!compared) {
+            return current ? null : window.dash_clientside.no_update;
+        }
+        return [empresas, sectores, bancos, plazos, compared];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        tasas: {kpis: kpis, barAndScatter: figures, boxplot: box, options: options,
+                comparisonSelection: comparisonSelection}
+    });
+})();
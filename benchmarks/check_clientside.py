@@ -0,0 +1,178 @@
+# Paridad del modo clientside (assets/js/clientside.js) con los resultados de Python.
+#
+# Ejecuta las funciones de JavaScript con Node sobre los datos compactos del dcc.Store y compara
+# KPIs, gráfico de barras, dispersión, estadísticos del gráfico de caja y opciones de los dropdowns
+# contra generate_kpis, los constructores de figuras de app.py y Dataset.dropdown_options, para un
+# conjunto de selecciones de los dropdowns. Termina con código 1 si hay alguna diferencia; también lo
+# ejecuta python -m pytest (tests/test_clientside.py).
+#
+# Uso (desde la raíz del repositorio, requiere node):
+#
+#     python benchmarks/check_clientside.py                  # datos reales y sintéticos (5.000 filas)
+#     python benchmarks/check_clientside.py --rows 0         # solo datos reales (período por defecto)
+#     python benchmarks/check_clientside.py --rows 50000     # solo datos sintéticos
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+
+import numpy as np
+import plotly
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("DATA_RELOAD_INTERVAL", "0")
+os.environ.setdefault("WARMUP_ENABLED", "0")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app  # noqa: E402
+from aggregates import box_stats  # noqa: E402
+from benchmarks.run_benchmarks import build_dataset  # noqa: E402
+
+CLIENTSIDE_JS = os.path.join(ROOT, "assets", "js", "clientside.js")
+
+# Carga clientside.js en Node con un window mínimo y evalúa cada selección
+NODE_DRIVER = """
+const fs = require('fs');
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+global.window = {dash_clientside: {no_update: '__no_update__'}};
+eval(fs.readFileSync(input.script, 'utf8'));
+const tasas = window.dash_clientside.tasas;
+const results = input.selections.map(function (selection) {
+    const args = selection.concat([input.store]);
+    const figures = tasas.barAndScatter.apply(null, args);
+    return {kpis: tasas.kpis.apply(null, args), bar: figures[0], scatter: figures[1],
+            boxplot: tasas.boxplot.apply(null, args), options: tasas.options.apply(null, args),
+            comparison: [tasas.comparisonSelection.apply(null, selection.concat(['bd_previo', null])),
+                         tasas.comparisonSelection.apply(null, selection.concat([null, null])),
+                         tasas.comparisonSelection.apply(null, selection.concat([null, ['x']]))]};
+});
+process.stdout.write(JSON.stringify(results));
+"""
+
+
+def selections_for(dataset, samples=80, seed=1):
+    # Sin filtros, cada valor de cada dropdown por separado y combinaciones al azar
+    options = [[option['value'] for option in getattr(dataset, name)]
+               for name in ('empresa_options', 'sector_options', 'banco_options', 'plazo_options')]
+    selections = [[None, None, None, None], [[], [], [], []]]
+    for position, values in enumerate(options):
+        for value in values:
+            selection = [None, None, None, None]
+            selection[position] = [value]
+            selections.append(selection)
+    rng = random.Random(seed)
+    for _ in range(samples):
+        selections.append([rng.sample(values, rng.randint(0, 2)) or None for values in options])
+    return selections
+
+
+def run_node(store, selections):
+    result = subprocess.run(
+        ["node", "-e", NODE_DRIVER],
+        input=json.dumps({'script': CLIENTSIDE_JS, 'store': store, 'selections': selections}),
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def to_json(value):
+    return json.loads(json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def differences(expected, actual, path=""):
+    # Diferencias entre dos estructuras JSON; números con tolerancia relativa 1e-9 y los KPI
+    # en porcentaje ("6.51%") con tolerancia de 0.01 (redondeo en el límite de .xx5)
+    if isinstance(expected, bool) or isinstance(actual, bool):
+        return [] if expected == actual else [(path, expected, actual)]
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        return [] if abs(expected - actual) <= 1e-9 * max(1, abs(expected)) else [(path, expected, actual)]
+    if isinstance(expected, str) and isinstance(actual, str) and expected.endswith("%") and actual.endswith("%"):
+        try:
+            if abs(float(expected[:-1]) - float(actual[:-1])) <= 0.0100001:
+                return []
+        except ValueError:
+            pass
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        found = []
+        for key in sorted(set(expected) | set(actual)):
+            found += differences(expected.get(key), actual.get(key), f"{path}.{key}")
+        return found
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [(path, f"len {len(expected)}", f"len {len(actual)}")]
+        found = []
+        for i, (a, b) in enumerate(zip(expected, actual)):
+            found += differences(a, b, f"{path}[{i}]")
+        return found
+    return [] if expected == actual else [(path, expected, actual)]
+
+
+def box_differences(expected, actual):
+    # El servidor envía los estadísticos de cada caja y el navegador los puntos crudos: se
+    # comparan los estadísticos que Plotly calculará con ellos
+    boxes = {trace['name']: trace for trace in expected['data'] if trace.get('type') == 'box' and 'q1' in trace}
+    traces = {trace['name']: trace for trace in actual['data']}
+    if list(boxes) != list(traces):
+        return [("boxplot.names", list(boxes), list(traces))]
+    found = []
+    for name, trace in traces.items():
+        values, counts = np.unique([y for y in trace['y'] if y is not None], return_counts=True)
+        stats = box_stats(counts, values.astype(float))
+        for field in ('q1', 'median', 'q3', 'lowerfence', 'upperfence'):
+            found += differences(boxes[name][field][0], stats[field], f"boxplot.{name}.{field}")
+    return found
+
+
+def check(dataset, selections):
+    store = app.compact_payload(dataset)
+    results = run_node(store, selections)
+    failures = 0
+    for selection, result in zip(selections, results):
+        expected_kpis = to_json(app.generate_kpis(*selection, dataset=dataset).to_plotly_json())
+        found = differences(expected_kpis, result['kpis'], "kpis")
+        for kind in ('bar', 'scatter'):
+            expected = json.loads(app.FIGURE_BUILDERS[kind](*selection, dataset=dataset).to_json())
+            found += differences(expected['data'], result[kind]['data'], kind)
+        found += differences(list(dataset.dropdown_options(*selection)), result['options'], "options")
+        found += box_differences(json.loads(app.build_boxplot(*selection, dataset=dataset).to_json()),
+                                 result['boxplot'])
+        # Store de la comparación: con período, sin período y al quitarlo
+        found += differences([selection + ['bd_previo'], '__no_update__', None], result['comparison'], "comparison")
+        if found:
+            failures += 1
+            print(f"DIFERENCIA {selection}: {found[:3]}")
+    return failures
+
+
+def check_all(sizes=(0, 5000)):
+    # Cantidad de selecciones con diferencias sobre cada conjunto de datos (0: datos reales)
+    failures = 0
+    lod_threshold = app.SCATTER_LOD_THRESHOLD
+    try:
+        for rows in sizes:
+            dataset = build_dataset(rows) if rows else app.data_store.current
+            # La dispersión del servidor se compara en su vista con todos los puntos
+            app.SCATTER_LOD_THRESHOLD = max(lod_threshold, len(dataset.df_bancos_chilenos))
+            selections = selections_for(dataset)
+            found = check(dataset, selections)
+            print(f"{rows or 'datos reales'}: {len(selections)} selecciones, {found} con diferencias")
+            failures += found
+    finally:
+        app.SCATTER_LOD_THRESHOLD = lod_threshold
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Paridad del modo clientside con los resultados de Python")
+    parser.add_argument("--rows", type=int, action="append",
+                        help="filas de datos sintéticos (0: datos reales; repetible; por defecto 0 y 5000)")
+    args = parser.parse_args(argv)
+    return 1 if check_all(args.rows or (0, 5000)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+# Prueba de carga del dashboard con sesiones de dropdowns concurrentes.
+#
+# Cada usuario virtual repite sesiones como las de un navegador: carga la página (callbacks
+# iniciales) y hace entre 3 y 10 cambios en los dropdowns, eligiendo entre las opciones que el
+# servidor le va mostrando. Cada cambio dispara en paralelo todos los callbacks del servidor que
+# dependen de los filtros (/_dash-update-component) y, con probabilidad --download-ratio, termina
+# en una descarga del CSV o del Excel de la selección (/download_csv, /download_excel). Se
+# informan el rendimiento, los percentiles de latencia y la tasa de errores por callback y por
+# ruta, y la latencia de cada cambio completo (hasta la última respuesta de sus callbacks).
+#
+# Sin --serve se usa el servidor de --url. Con --serve se levanta gunicorn con gunicorn.conf.py
+# para cada configuración indicada, clase[:workers[xhilos]][/hilos de figuras] (p.ej. sync:2,
+# gthread:2x4 o gthread:2x4/2), y se repite la misma carga sobre cada una, esperando antes a que
+# termine el precálculo de las cachés.
+#
+# Uso (desde la raíz del repositorio):
+#
+#     python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 8 --duration 30
+#     python benchmarks/load_test.py --serve sync:2 --serve gthread:2x4 --users 1,8,32
+#     python benchmarks/load_test.py --serve gthread:2x4 --serve gthread:2x4/2 --rows 100000 \
+#         --env WARMUP_ENABLED=0 --env CACHE_BACKEND=memory
+#     python benchmarks/load_test.py --url http://127.0.0.1:8000 --json
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlsplit
+
+import brotli
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FILTER_IDS = ['empresa-dropdown', 'sector-dropdown', 'banco-dropdown', 'plazo-dropdown']
+# Parámetros de las descargas para cada dropdown (los mismos de /download_csv y /download_excel)
+QUERY_KEYS = dict(zip(FILTER_IDS, ['empresa', 'sector', 'banco', 'plazo']))
+DOWNLOADS = ['/download_csv', '/download_excel']
+PERCENTILES = (50, 90, 95, 99)
+# Valores seleccionados como máximo por dropdown y probabilidad de quitar uno en cada cambio
+MAX_VALUES = 3
+REMOVE_PROBABILITY = 0.35
+SESSION_CLICKS = (3, 10)
+CONFIG_PATTERN = re.compile(r"(sync|gthread)(?::(\d+)(?:x(\d+))?)?(?:/(\d+))?")
+SYNTHETIC_SHEET = "bd_synthetic"
+# Errores de una conexión keep-alive que el servidor cerró mientras estaba libre
+DISCONNECTED = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class Client:
+    # Conexiones keep-alive por hilo (como las del navegador) contra el servidor
+
+    def __init__(self, url, timeout=120):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        # Devuelve (código, cuerpo tal como viaja, Content-Encoding). Tras un error la conexión se
+        # descarta; si el servidor había cerrado la conexión keep-alive se reintenta una vez
+        headers = {'Accept-Encoding': 'br, gzip'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+            try:
+                connection.request(method, self.prefix + path, data, headers)
+                response = connection.getresponse()
+                return response.status, response.read(), response.getheader('Content-Encoding')
+            except (OSError, http.client.HTTPException) as error:
+                connection.close()
+                self._local.connection = None
+                if attempt or not isinstance(error, DISCONNECTED):
+                    raise
+
+    def get_json(self, path):
+        status, payload, encoding = self.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f"GET {path}: {status}")
+        return json.loads(decode(payload, encoding))
+
+
+def decode(payload, encoding):
+    if encoding == 'br':
+        return brotli.decompress(payload)
+    if encoding == 'gzip':
+        return gzip.decompress(payload)
+    return payload
+
+
+def split_outputs(output):
+    # "..bar-chart.figure...scatter-plot.figure.." -> ["bar-chart.figure", "scatter-plot.figure"]
+    return output[2:-2].split("...") if output.startswith("..") else [output]
+
+
+def callback_label(spec):
+    ids = [output.rsplit(".", 1)[0] for output in split_outputs(spec['output'])]
+    return "+".join(ids) if len(ids) <= 2 else f"{ids[0]}+{len(ids) - 1}"
+
+
+def component_props(node, found):
+    # Props de cada componente del layout por id (valores iniciales de los inputs que no son filtros)
+    if isinstance(node, dict):
+        props = node.get('props')
+        if isinstance(props, dict) and 'type' in node:
+            if isinstance(props.get('id'), str):
+                found[props['id']] = props
+            for value in props.values():
+                component_props(value, found)
+    elif isinstance(node, list):
+        for item in node:
+            component_props(item, found)
+    return found
+
+
+class Plan:
+    # Lo que el navegador sabe al cargar la página: los callbacks del servidor que dependen de
+    # los filtros y los valores y opciones iniciales de los componentes
+
+    def __init__(self, client):
+        dependencies = client.get_json("/_dash-dependencies")
+        self.callbacks = [spec for spec in dependencies if not spec.get('clientside_function')
+                          and any(item['id'] in FILTER_IDS for item in spec['inputs'])]
+        self.props = component_props(client.get_json("/_dash-layout"), {})
+        self.options = {dropdown: [option['value'] for option in self.props[dropdown].get('options') or []]
+                        for dropdown in FILTER_IDS}
+
+    def body(self, spec, values, changed):
+        # Cuerpo de /_dash-update-component tal como lo arma el renderer de Dash
+        outputs = [dict(zip(('id', 'property'), output.rsplit(".", 1))) for output in split_outputs(spec['output'])]
+
+        def value_of(item):
+            if item['id'] in values:
+                return values[item['id']]
+            return self.props.get(item['id'], {}).get(item['property'])
+
+        return {
+            'output': spec['output'],
+            'outputs': outputs if spec['output'].startswith("..") else outputs[0],
+            'inputs': [dict(item, value=value_of(item)) for item in spec['inputs']],
+            'state': [dict(item, value=value_of(item)) for item in spec.get('state', [])],
+            'changedPropIds': [f"{changed}.value"] if changed else [],
+        }
+
+
+class Recorder:
+    # Latencias, errores y bytes por nombre (callback, ruta o "cambio")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.error_samples = []
+
+    def record(self, name, elapsed, ok, size=0, detail=None):
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.bytes[name] += size
+            if not ok:
+                self.errors[name] += 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append(f"{name}: {detail}")
+
+    def summary(self, elapsed):
+        def stats(latencies, errors, size):
+            values = np.array(latencies) * 1000
+            result = {'requests': len(values), 'errors': errors, 'error_rate': errors / len(values),
+                      'per_second': len(values) / elapsed, 'bytes': size, 'mean_ms': float(values.mean()),
+                      'max_ms': float(values.max())}
+            result.update({f"p{q}_ms": float(np.percentile(values, q)) for q in PERCENTILES})
+            return result
+
+        with self._lock:
+            names = sorted(self.latencies, key=lambda name: (name == 'cambio', name))
+            results = {name: stats(self.latencies[name], self.errors[name], self.bytes[name]) for name in names}
+            requests = [name for name in names if name != 'cambio']
+            if requests:
+                results['total'] = stats(sum((self.latencies[name] for name in requests), []),
+                                         sum(self.errors[name] for name in requests),
+                                         sum(self.bytes[name] for name in requests))
+            return results, list(self.error_samples)
+
+
+class VirtualUser:
+    def __init__(self, client, plan, recorder, rng, think_time, download_ratio):
+        self.client = client
+        self.plan = plan
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.download_ratio = download_ratio
+        # Los callbacks de un cambio van en paralelo, cada uno por su conexión
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(plan.callbacks)))
+
+    def call(self, name, method, path, body=None, parse=False):
+        start = time.perf_counter()
+        try:
+            status, payload, encoding = self.client.request(method, path, body)
+        except (OSError, http.client.HTTPException) as error:
+            self.recorder.record(name, time.perf_counter() - start, False, detail=repr(error))
+            return False, None
+        elapsed = time.perf_counter() - start
+        # 204 es un callback que no actualizó nada (PreventUpdate)
+        ok = status in (200, 204, 304)
+        self.recorder.record(name, elapsed, ok, len(payload), detail=f"{method} {path} -> {status}")
+        if ok and parse and status == 200:
+            return ok, json.loads(decode(payload, encoding))
+        return ok, None
+
+    def click(self, values, changed):
+        # Todos los callbacks que dependen de los filtros; las opciones de los dropdowns que
+        # devuelvan acotan los próximos cambios
+        start = time.perf_counter()
+        futures = [self.pool.submit(self.call, callback_label(spec), 'POST', "/_dash-update-component",
+                                    self.plan.body(spec, values, changed), True)
+                   for spec in self.plan.callbacks]
+        responses = [future.result() for future in futures]
+        if self.plan.callbacks:
+            self.recorder.record('cambio', time.perf_counter() - start, all(ok for ok, _ in responses))
+        for _, response in responses:
+            for dropdown, props in ((response or {}).get('response') or {}).items():
+                if dropdown in FILTER_IDS and 'options' in props:
+                    self.options[dropdown] = [option['value'] for option in props['options']]
+
+    def next_values(self, values):
+        # Agregar una opción visible a un dropdown o quitar una de las ya elegidas
+        dropdown = self.rng.choice(FILTER_IDS)
+        current = list(values[dropdown] or [])
+        available = [value for value in self.options[dropdown] if value not in current]
+        if current and (not available or len(current) >= MAX_VALUES or self.rng.random() < REMOVE_PROBABILITY):
+            current.remove(self.rng.choice(current))
+        elif available:
+            current.append(self.rng.choice(available))
+        return dict(values, **{dropdown: current}), dropdown
+
+    def download(self, values):
+        path = self.rng.choice(DOWNLOADS)
+        query = urlencode([(QUERY_KEYS[dropdown], value) for dropdown in FILTER_IDS
+                           for value in values[dropdown] or []])
+        self.call(path, 'GET', f"{path}?{query}" if query else path)
+
+    def run(self, deadline):
+        while time.perf_counter() < deadline:
+            self.options = dict(self.plan.options)
+            values = dict.fromkeys(FILTER_IDS)
+            self.click(values, None)
+            for _ in range(self.rng.randint(*SESSION_CLICKS)):
+                if time.perf_counter() >= deadline:
+                    break
+                if self.think_time:
+                    time.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+                values, changed = self.next_values(values)
+                self.click(values, changed)
+                if self.rng.random() < self.download_ratio:
+                    self.download(values)
+        self.pool.shutdown()
+
+
+def run_load(url, users, duration, think_time, download_ratio, seed):
+    client = Client(url)
+    plan = Plan(client)
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    virtual_users = [VirtualUser(client, plan, recorder, random.Random(seed + i), think_time, download_ratio)
+                     for i in range(users)]
+    threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in virtual_users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results, error_samples = recorder.summary(time.perf_counter() - start)
+    return {'users': users, 'callbacks_per_change': len(plan.callbacks), 'results': results,
+            'error_samples': error_samples}
+
+
+def parse_config(spec):
+    # "gthread:2x4/2" -> variables de entorno de gunicorn.conf.py y app.py
+    match = CONFIG_PATTERN.fullmatch(spec)
+    if not match:
+        raise argparse.ArgumentTypeError(f"configuración inválida {spec!r} (clase[:workers[xhilos]][/hilos])")
+    worker_class, workers, threads, figure_threads = match.groups()
+    env = {'GUNICORN_WORKER_CLASS': worker_class}
+    for name, value in (('WEB_CONCURRENCY', workers), ('GUNICORN_THREADS', threads),
+                        ('FIGURE_THREADS', figure_threads)):
+        if value:
+            env[name] = value
+    return spec, env
+
+
+def parse_env(item):
+    if "=" not in item:
+        raise argparse.ArgumentTypeError(f"se esperaba NOMBRE=valor, no {item!r}")
+    return tuple(item.split("=", 1))
+
+
+def synthetic_workbook(rows):
+    # Libro sintético con una hoja de período, generado una vez por tamaño, y su carpeta de snapshots
+    from benchmarks.synthetic import generate
+
+    directory = os.path.join(ROOT, "data", "cache", f"loadtest_{rows}")
+    path = os.path.join(directory, "tasas_interes.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        print(f"Generando libro sintético de {rows:,} filas en {path}", file=sys.stderr)
+        tmp_path = f"{path}.{os.getpid()}.tmp.xlsx"
+        generate(rows).to_excel(tmp_path, sheet_name=SYNTHETIC_SHEET, index=False)
+        os.replace(tmp_path, path)
+    return {'DATA_EXCEL_PATH': path, 'DATA_SNAPSHOT_DIR': os.path.join(directory, "snapshots")}
+
+
+def wait_ready(client, process, log_path, timeout):
+    # Hasta que el servidor responda el layout y no quede precálculo de cachés en curso
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                raise RuntimeError(f"gunicorn terminó con código {process.returncode}:\n{f.read()[-2000:]}")
+        try:
+            if client.get_json("/status")['warmup'].get('state') != 'running':
+                return
+        except (OSError, RuntimeError, http.client.HTTPException, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"el servidor no quedó listo en {timeout} s")
+
+
+@contextmanager
+def serve(env, port, timeout):
+    log_path = os.path.join(ROOT, "data", "cache", f"loadtest_gunicorn_{port}.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    url = f"http://127.0.0.1:{port}"
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:server"],
+                                   cwd=ROOT, env=dict(os.environ, PORT=str(port), **env),
+                                   stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_ready(Client(url), process, log_path, timeout)
+            yield url
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def print_run(label, run):
+    print(f"\n{label}: {run['users']} usuarios, {run['callbacks_per_change']} callbacks por cambio")
+    print(f"{'':<34}{'peticiones':>11}{'por s':>9}{'errores':>9}{'media':>9}"
+          + "".join(f"{f'p{q}':>9}" for q in PERCENTILES) + f"{'máx':>9}")
+    for name, stats in run['results'].items():
+        print(f"{name[:33]:<34}{stats['requests']:>11,}{stats['per_second']:>9.1f}{stats['error_rate']:>9.1%}"
+              f"{stats['mean_ms']:>9.1f}" + "".join(f"{stats[f'p{q}_ms']:>9.1f}" for q in PERCENTILES)
+              + f"{stats['max_ms']:>9.1f}")
+    for sample in run['error_samples']:
+        print(f"  error {sample}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del dashboard con sesiones de dropdowns concurrentes")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="servidor a probar (sin --serve)")
+    parser.add_argument("--serve", action="append", type=parse_config, default=[],
+                        help="levantar gunicorn con esta configuración (repetible)")
+    parser.add_argument("--port", type=int, default=8765, help="puerto de los servidores de --serve")
+    parser.add_argument("--env", action="append", type=parse_env, default=[],
+                        help="variable NOMBRE=valor para los servidores de --serve (repetible)")
+    parser.add_argument("--rows", type=int, help="servir un libro sintético con esta cantidad de filas (--serve)")
+    parser.add_argument("--users", default="8", help="usuarios concurrentes, separados por coma")
+    parser.add_argument("--duration", type=float, default=30, help="segundos por nivel de concurrencia")
+    parser.add_argument("--think-time", type=float, default=0, help="pausa media entre cambios (s)")
+    parser.add_argument("--download-ratio", type=float, default=0.05, help="probabilidad de descargar tras un cambio")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ready-timeout", type=float, default=600, help="espera máxima al servidor de --serve (s)")
+    parser.add_argument("--json", action="store_true", help="imprimir el resultado en JSON")
+    args = parser.parse_args(argv)
+    if args.rows and not args.serve:
+        parser.error("--rows requiere --serve")
+
+    levels = [int(users) for users in args.users.split(",")]
+    env = dict(args.env)
+    if args.rows:
+        env.update(synthetic_workbook(args.rows))
+
+    def run_levels(url):
+        return [run_load(url, users, args.duration, args.think_time, args.download_ratio, args.seed)
+                for users in levels]
+
+    runs = {}
+    if args.serve:
+        for spec, config_env in args.serve:
+            with serve(dict(env, **config_env), args.port, args.ready_timeout) as url:
+                runs[spec] = run_levels(url)
+    else:
+        runs[args.url] = run_levels(args.url)
+
+    if args.json:
+        print(json.dumps(runs, indent=2))
+    else:
+        for label, results in runs.items():
+            for run in results:
+                print_run(label, run)
+    failed = any(stats['errors'] for results in runs.values() for run in results
+                 for stats in run['results'].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
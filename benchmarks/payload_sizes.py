@@ -0,0 +1,129 @@
+# Bytes por interacción del dashboard (carga de la página y cambios de los dropdowns).
+#
+# Reproduce con el cliente de pruebas de Flask lo que hace el navegador: la página, el layout, las
+# dependencias y los bundles estáticos en la primera visita, y luego una sesión de cambios de los
+# dropdowns, llamando en cada cambio a todos los callbacks que dependen de los filtros. Cada
+# petición se repite con Accept-Encoding identity, gzip y br y se suman los bytes del cuerpo tal
+# como viajan.
+#
+# Uso (desde la raíz del repositorio):
+#
+#     python benchmarks/payload_sizes.py               # datos reales (período por defecto)
+#     python benchmarks/payload_sizes.py --rows 5000   # datos sintéticos para las interacciones
+#     python benchmarks/payload_sizes.py --json        # resultado en JSON
+import argparse
+import json
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("DATA_RELOAD_INTERVAL", "0")
+os.environ.setdefault("WARMUP_ENABLED", "0")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app  # noqa: E402
+from benchmarks.run_benchmarks import build_dataset, representative_selections  # noqa: E402
+
+ENCODINGS = ['identity', 'gzip', 'br']
+FILTER_IDS = ['empresa-dropdown', 'sector-dropdown', 'banco-dropdown', 'plazo-dropdown']
+# Bundles de Dash y assets del repositorio enlazados desde el HTML de la página, más los que
+# dcc carga después al mostrar los gráficos y dropdowns (plotly.js incluido)
+STATIC_PATTERN = re.compile(r'(?:src|href)="(/(?:_dash-component-suites|assets)/[^"]+)"')
+LAZY_BUNDLES = [
+    "/_dash-component-suites/dash/dcc/async-graph.js",
+    "/_dash-component-suites/dash/dcc/async-dropdown.js",
+    "/_dash-component-suites/plotly/package_data/plotly.min.js",
+]
+
+
+def measure(client, method, path, encoding, **kwargs):
+    response = client.open(path, method=method, headers={'Accept-Encoding': encoding}, **kwargs)
+    if response.status_code != 200:
+        raise RuntimeError(f"{method} {path}: {response.status_code}")
+    return len(response.get_data())
+
+
+def filter_callbacks():
+    # Callbacks del servidor que se disparan al cambiar algún filtro
+    return {output: spec for output, spec in app.app.callback_map.items()
+            if any(item['id'] in FILTER_IDS for item in spec['inputs'])}
+
+
+def callback_body(output, spec, values, changed):
+    outputs = spec['output']
+    as_dict = lambda item: {'id': item.component_id, 'property': item.component_property}  # noqa: E731
+    return {
+        'output': output,
+        'outputs': [as_dict(item) for item in outputs] if isinstance(outputs, list) else as_dict(outputs),
+        'inputs': [dict(item, value=values.get(item['id'])) for item in spec['inputs']],
+        'state': [dict(item, value=values.get(item['id'])) for item in spec['state']],
+        'changedPropIds': [f"{changed}.value"] if changed else [],
+    }
+
+
+def session(selections):
+    # Estados sucesivos de los dropdowns: cada selección representativa y vuelta a sin filtros
+    states = []
+    for selection in list(selections.values()) + [(None, None, None, None)]:
+        values = dict(zip(FILTER_IDS, selection))
+        previous = states[-1][0] if states else dict.fromkeys(FILTER_IDS)
+        changed = next((key for key in FILTER_IDS if values[key] != previous[key]), FILTER_IDS[0])
+        states.append((values, changed))
+    return states
+
+
+def run(selections):
+    client = app.server.test_client()
+    callbacks = filter_callbacks()
+    html = client.get("/").get_data(as_text=True)
+    static = sorted(set(STATIC_PATTERN.findall(html))) + LAZY_BUNDLES
+    states = session(selections)
+
+    results = {}
+    for encoding in ENCODINGS:
+        page = sum(measure(client, 'GET', path, encoding)
+                   for path in ("/", "/_dash-layout", "/_dash-dependencies"))
+        bundles = sum(measure(client, 'GET', path, encoding) for path in static)
+        interactions = []
+        for values, changed in [(dict.fromkeys(FILTER_IDS), None)] + states:
+            interactions.append(sum(
+                measure(client, 'POST', "/_dash-update-component", encoding,
+                        json=callback_body(output, spec, values, changed))
+                for output, spec in callbacks.items()
+            ))
+        results[encoding] = {
+            'page': page, 'static': bundles, 'initial_callbacks': interactions[0],
+            'per_interaction': round(sum(interactions[1:]) / len(interactions[1:])),
+            'interactions': interactions[1:],
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes por interacción del dashboard")
+    parser.add_argument("--rows", type=int, help="usar datos sintéticos con esta cantidad de filas")
+    parser.add_argument("--json", action="store_true", help="imprimir el resultado en JSON")
+    args = parser.parse_args(argv)
+
+    dataset = app.data_store.current
+    if args.rows:
+        # Los callbacks resuelven el dataset con app.get_dataset al ser llamados
+        dataset = build_dataset(args.rows)
+        app.get_dataset = lambda period=None: dataset
+    results = run(representative_selections(dataset))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'encoding':<10}{'página':>12}{'estáticos':>12}{'callbacks inic.':>17}{'por interacción':>17}")
+    for encoding, sizes in results.items():
+        print(f"{encoding:<10}{sizes['page']:>12,}{sizes['static']:>12,}{sizes['initial_callbacks']:>17,}"
+              f"{sizes['per_interaction']:>17,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# Benchmarks de los callbacks del dashboard sobre datos sintéticos.
+#
+# Uso (desde la raíz del repositorio):
+#
+#     python benchmarks/run_benchmarks.py --sizes 1000,10000,100000,1000000
+#     python benchmarks/run_benchmarks.py --save-baseline      # guarda benchmarks/baseline.json
+#     python benchmarks/run_benchmarks.py --compare            # marca regresiones contra el baseline
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+# El benchmark no necesita revisar el Excel ni precalcular en segundo plano
+os.environ.setdefault("DATA_RELOAD_INTERVAL", "0")
+os.environ.setdefault("WARMUP_ENABLED", "0")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+import app  # noqa: E402
+from benchmarks.synthetic import generate  # noqa: E402
+from data_loader import compact_frame  # noqa: E402
+from data_store import Dataset  # noqa: E402
+from exports import iter_csv  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+def build_dataset(rows):
+    df = compact_frame(generate(rows))
+    df.attrs['data_version'] = f"synthetic_{rows}"
+    return Dataset(df, sheet_name="bd_synthetic")
+
+
+def representative_selections(dataset):
+    # Ninguna selección, una empresa, un banco y varios filtros combinados
+    chile = dataset.df_bancos_chilenos
+    empresas = chile['Empresa'].value_counts().index.tolist()
+    bancos = chile['Nombre Entidad Acreedora'].value_counts().index.tolist()
+    sectores = chile['Sector'].value_counts().index.tolist()
+    return {
+        'none': (None, None, None, None),
+        'single_empresa': ([empresas[0]], None, None, None),
+        'single_banco': (None, None, [bancos[0]], None),
+        'multi_filter': (empresas[:3], sectores[:3], bancos[:3], ['Largo Plazo']),
+    }
+
+
+def callbacks(dataset):
+    # Trabajo que hace cada callback (sin la caché de figuras): filtrar, agregar, construir
+    # la figura y serializarla
+    def kpis(*selection):
+        return app.generate_kpis(*selection, dataset=dataset).to_plotly_json()
+
+    def boxplot(*selection):
+        return app.build_boxplot(*selection, dataset=dataset).to_json()
+
+    def scatter(*selection):
+        return app.update_scatter_plot(*selection, dataset=dataset).to_json()
+
+    def bar_and_scatter(*selection):
+        return app.build_bar_chart(*selection, dataset=dataset).to_json(), scatter(*selection)
+
+    def dropdown_options(*selection):
+        return dataset.dropdown_options(*selection)
+
+    def download_csv(*selection):
+        return sum(len(chunk) for chunk in iter_csv(dataset.df, dataset.row_ids(*selection)))
+
+    return {
+        'generate_kpis': kpis,
+        'update_boxplot': boxplot,
+        'update_bar_and_scatter': bar_and_scatter,
+        'update_scatter_plot': scatter,
+        'update_dropdown_options': dropdown_options,
+        'download_csv': download_csv,
+    }
+
+
+def measure(fn, selection, dataset, repeat):
+    timings = []
+    for _ in range(repeat):
+        # Sin caché de filtrado para medir el costo completo de cada llamada
+        dataset.filtered_cache.clear()
+        start = time.perf_counter()
+        fn(*selection)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    dataset.filtered_cache.clear()
+    tracemalloc.start()
+    fn(*selection)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'peak_kb': peak / 1024,
+    }
+
+
+def run(sizes, repeat, only=None):
+    results = {}
+    for rows in sizes:
+        start = time.perf_counter()
+        dataset = build_dataset(rows)
+        results[f"{rows}/build_dataset"] = {'p50_ms': (time.perf_counter() - start) * 1000,
+                                            'p95_ms': None, 'peak_kb': None}
+        for name, fn in callbacks(dataset).items():
+            if only and name not in only:
+                continue
+            for label, selection in representative_selections(dataset).items():
+                key = f"{rows}/{name}/{label}"
+                results[key] = measure(fn, selection, dataset, repeat)
+                print(f"{key:55s} p50 {results[key]['p50_ms']:9.2f} ms  p95 {results[key]['p95_ms']:9.2f} ms"
+                      f"  peak {results[key]['peak_kb']:10.1f} KB", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Regresión: p50 o memoria pico por encima del baseline más la tolerancia
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous or result['p95_ms'] is None:
+            continue
+        for metric in ('p50_ms', 'peak_kb'):
+            if previous.get(metric) and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((key, metric, previous[metric], result[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de los callbacks del dashboard sobre datos sintéticos")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="cantidades de filas separadas por coma")
+    parser.add_argument("--repeat", type=int, default=15, help="repeticiones por caso")
+    parser.add_argument("--only", help="callbacks a medir, separados por coma")
+    parser.add_argument("--save-baseline", action="store_true", help="guardar los resultados como baseline")
+    parser.add_argument("--compare", action="store_true", help="comparar contra el baseline guardado")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="margen permitido sobre el baseline antes de marcar regresión")
+    parser.add_argument("--output", help="guardar los resultados en este JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    only = set(args.only.split(",")) if args.only else None
+    results = run(sizes, args.repeat, only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline guardado en {BASELINE_PATH}")
+    if args.compare:
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for key, metric, before, after in regressions:
+            print(f"REGRESIÓN {key} {metric}: {before:.2f} -> {after:.2f}")
+        if regressions:
+            return 1
+        print("Sin regresiones respecto al baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
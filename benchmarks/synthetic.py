@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# Valores con la misma forma que la hoja bd_2023
+BANCOS_CHILENOS = [
+    'Banco de Chile', 'Banco BCI', 'Banco Santander', 'Banco Estado', 'Banco ITAU', 'Banco BICE',
+    'Banco Scotiabank', 'Banco Security', 'Banco Consorcio',
+]
+BANCOS_EXTRANJEROS = [
+    ('Banco Banamex', 'Mexico'), ('Scotiabank Mexico', 'Mexico'), ('Banco BCI Miami', 'EE.UU'),
+]
+SECTORES = [
+    'Vinicola', 'Energía', 'Telecomunicaciones', 'Construcción e Ingeniería', 'Forestal', 'Aerolínea',
+    'Mínero', 'Retail', 'Bebestibles', 'Servicios Básicos', 'Holding', 'Inmobiliario', 'Salud',
+]
+RATINGS = ['AA+', 'AA', 'AA-', 'A+', 'A', 'A-', 'BBB+', 'BBB', 'BBB-', 'BB+']
+PLAZOS = ['Corto Plazo', 'Largo Plazo']
+# Moneda -> (probabilidad, tasa base)
+MONEDAS = {
+    'Peso Chileno': (0.45, 0.095),
+    'UF': (0.30, 0.035),
+    'Dólar EE.UU': (0.18, 0.060),
+    'EURO': (0.04, 0.040),
+    'Libra Esterlina': (0.02, 0.055),
+    'Peso Mexicano': (0.01, 0.110),
+}
+
+
+def generate(rows, seed=0):
+    # Genera un DataFrame sintético con el esquema de bd_2023. La cantidad de empresas crece con
+    # el tamaño (como si se sumaran emisores), los bancos, sectores, plazos, monedas y ratings no
+    rng = np.random.default_rng(seed)
+    n_empresas = int(np.clip(rows // 400, 25, 5000))
+    empresas = np.array([f"Empresa {i:04d}" for i in range(n_empresas)], dtype=object)
+    empresa_sector = rng.choice(SECTORES, size=n_empresas)
+    empresa_rating = rng.choice(RATINGS, size=n_empresas, p=_decreasing(len(RATINGS)))
+
+    # Pocas empresas concentran la mayoría de los préstamos (como en el IPSA)
+    empresa_idx = rng.choice(n_empresas, size=rows, p=_decreasing(n_empresas))
+
+    bancos = BANCOS_CHILENOS + [name for name, _ in BANCOS_EXTRANJEROS]
+    paises = ['Chile'] * len(BANCOS_CHILENOS) + [country for _, country in BANCOS_EXTRANJEROS]
+    banco_p = np.array([1.0] * len(BANCOS_CHILENOS) + [0.15] * len(BANCOS_EXTRANJEROS))
+    banco_idx = rng.choice(len(bancos), size=rows, p=banco_p / banco_p.sum())
+
+    monedas = list(MONEDAS)
+    moneda_idx = rng.choice(len(monedas), size=rows, p=[MONEDAS[m][0] for m in monedas])
+    base_rate = np.array([MONEDAS[m][1] for m in monedas])[moneda_idx]
+    rating_spread = np.array([RATINGS.index(r) for r in empresa_rating])[empresa_idx] * 0.004
+
+    tasa = np.round(base_rate + rating_spread + rng.normal(0, 0.01, rows).clip(-0.03, 0.05), 4)
+    total = np.round(rng.lognormal(mean=13, sigma=2, size=rows))
+
+    return pd.DataFrame({
+        'Nombre Entidad Acreedora': np.array(bancos, dtype=object)[banco_idx],
+        'Pais Empresa Acreedora': np.array(paises, dtype=object)[banco_idx],
+        'Empresa': empresas[empresa_idx],
+        'Rating': empresa_rating[empresa_idx],
+        'Sector': empresa_sector[empresa_idx],
+        'Tipo': 'Prestamo Bancario',
+        'Plazo': rng.choice(PLAZOS, size=rows, p=[0.55, 0.45]),
+        'Tipo Moneda': np.array(monedas, dtype=object)[moneda_idx],
+        'Tasa Nominal': tasa.clip(0.001),
+        'Total': total,
+    })
+
+
+def _decreasing(n):
+    weights = 1.0 / np.arange(1, n + 1) ** 0.8
+    return weights / weights.sum()
@@ -0,0 +1,407 @@
+import fcntl
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Caché compartida entre workers (archivo SQLite local), su tamaño máximo y vigencia por defecto
+SHARED_CACHE_PATH = "data/cache/shared_cache.sqlite"
+SHARED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SHARED_CACHE_TTL = 6 * 60 * 60
+# Los valores serializados sobre este tamaño se guardan comprimidos con zlib
+COMPRESS_MIN_BYTES = 1024
+# Formato de los valores de la caché compartida (pickle de figuras y componentes de Dash). Forma
+# parte de la versión junto con el código, y se sube si cambia algo que el código no refleja
+# (p.ej. una versión nueva de Dash o plotly)
+CACHE_SCHEMA = 1
+
+
+def normalize_selection(selected_empresas, selected_sectores, selected_bancos, selected_plazo):
+    # Clave canónica de una selección: valores ordenados y None equivalente a []
+    return tuple(
+        tuple(sorted(set(values))) if values else ()
+        for values in (selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+    )
+
+
+def code_version(directory):
+    # Hash de CACHE_SCHEMA y de los módulos de la aplicación: tras un deploy con otro código las
+    # entradas guardadas por el anterior dejan de coincidir
+    digest = hashlib.blake2b(str(CACHE_SCHEMA).encode("utf-8"), digest_size=8)
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class LRUCache:
+    # Caché LRU acotada y segura entre hilos, con contadores de aciertos, fallos y desalojos.
+    # Con shared, los fallos se buscan en la caché compartida entre workers antes de calcular.
+    # Con max_bytes se acota además por tamaño, medido con sizeof(valor)
+
+    def __init__(self, maxsize=256, shared=None, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.shared = shared
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self.bytes += size - self._sizes.pop(key, 0)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes
+                                                     and len(self._data) > 1):
+                old_key, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        # Sin caché compartida, si dos hilos fallan a la vez ambos calculan (el resultado es el
+        # mismo); con ella el cálculo de cada clave es único entre hilos y workers
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.shared.get_or_compute(key, compute) if self.shared else compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+        if self.shared:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+class FigureCache:
+    # Caché de figuras de Plotly ya serializadas a JSON, con clave (tipo de figura,
+    # selección normalizada, versión de los datos) y desalojo LRU por tamaño en bytes
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_etag(payload):
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, payload):
+        # Guarda el JSON (bytes) junto con su ETag y devuelve la entrada
+        entry = (payload, self.make_etag(payload))
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous[0])
+            self._data[key] = entry
+            self.bytes += len(payload)
+            while self.bytes > self.max_bytes and len(self._data) > 1:
+                _, (old_payload, _) = self._data.popitem(last=False)
+                self.bytes -= len(old_payload)
+                self.evictions += 1
+        return entry
+
+    def get_or_build(self, key, build):
+        # build() devuelve el JSON de la figura (bytes); solo se llama si falta en esta caché y
+        # en la compartida
+        entry = self.get(key)
+        if entry is None:
+            payload = self.shared.get_or_compute(key, build) if self.shared else build()
+            entry = self.set(key, payload)
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'entries': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+        if self.shared:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+class SQLiteStore:
+    # Almacén compartido entre procesos en un archivo SQLite en modo WAL (lecturas concurrentes
+    # sin bloquear a quien escribe). Guarda blobs con vencimiento (TTL) y desaloja por tamaño
+    # los menos usados. Cada hilo usa su propia conexión, que se vuelve a abrir tras un fork
+
+    # Cada cuántos segundos como máximo se actualiza la fecha de último uso de una entrada
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path=SHARED_CACHE_PATH, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expired = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            # La conexión heredada del proceso maestro no se usa ni se cierra en el worker
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, key):
+        now = time.time()
+        db = self._connection()
+        row = db.execute("SELECT value, expires, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires < now:
+            db.execute("DELETE FROM entries WHERE key = ? AND expires < ?", (key, now))
+            self.expired += 1
+            return None
+        if now - accessed > self.TOUCH_INTERVAL:
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        db = self._connection()
+        db.execute("INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                   (key, value, len(value), now + ttl, now))
+        self._evict(db, now)
+
+    def _evict(self, db, now):
+        # Sobre el máximo: primero las vencidas y luego las de uso más antiguo hasta bajar al 90%
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self.expired += db.execute("DELETE FROM entries WHERE expires < ?", (now,)).rowcount
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = self.max_bytes * 0.9
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        db.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entries")
+
+    def discard_stale(self, namespace, prefix):
+        # Borra las entradas del namespace que no empiezan con prefix (otra versión)
+        namespace = f"{namespace}:"
+        return self._connection().execute(
+            "DELETE FROM entries WHERE substr(key, 1, ?) = ? AND substr(key, 1, ?) != ?",
+            (len(namespace), namespace, len(prefix), prefix),
+        ).rowcount
+
+    def stats(self):
+        entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes,
+                'evictions': self.evictions, 'expired': self.expired}
+
+
+class SharedCache:
+    # Nivel compartido entre workers delante de un almacén (por defecto SQLiteStore; cualquier
+    # objeto con get/set/clear/stats sirve). Los valores se guardan como pickle, comprimido si
+    # es grande, con una clave derivada de namespace, version y la clave original. Al crearla se
+    # borran las entradas del namespace de otra versión (código u opciones anteriores), si el
+    # almacén lo permite. El cálculo de una clave ausente se hace una sola vez a la vez entre
+    # hilos y procesos (single-flight con un bloqueo de archivo), y quien esperaba toma el valor
+    # ya guardado
+
+    def __init__(self, store, namespace, version="", ttl=SHARED_CACHE_TTL, lock_dir=None, lock_stripes=256,
+                 lock_timeout=30):
+        self.store = store
+        self.namespace = namespace
+        self.version = version
+        self.prefix = f"{namespace}:{version}:"
+        self.ttl = ttl
+        self.lock_dir = lock_dir or os.path.join(os.path.dirname(getattr(store, 'path', SHARED_CACHE_PATH)) or ".",
+                                                 "locks")
+        self.lock_stripes = lock_stripes
+        self.lock_timeout = lock_timeout
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.discarded = 0
+        discard_stale = getattr(store, 'discard_stale', None)
+        if discard_stale is not None:
+            try:
+                self.discarded = discard_stale(namespace, self.prefix)
+            except Exception:
+                logger.debug("No se pudieron borrar las entradas antiguas de %s", namespace, exc_info=True)
+
+    def _key(self, key):
+        return f"{self.prefix}{hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()}"
+
+    @staticmethod
+    def dumps(value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > COMPRESS_MIN_BYTES:
+            return b"z" + zlib.compress(data, 3)
+        return b"p" + data
+
+    @staticmethod
+    def loads(blob):
+        data = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+        return pickle.loads(data)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _lookup(self, key):
+        # Valor guardado o None; un error del almacén cuenta como fallo y no interrumpe
+        try:
+            blob = self.store.get(key)
+            return None if blob is None else (self.loads(blob),)
+        except Exception:
+            self._count('errors')
+            logger.debug("Error al leer %s de la caché compartida", key, exc_info=True)
+            return None
+
+    @contextmanager
+    def _single_flight(self, key):
+        # Bloqueo de archivo por franja de claves; si otro proceso lo retiene más de lock_timeout
+        # se calcula igual
+        stripe = int(key[-8:], 16) % self.lock_stripes
+        with open(os.path.join(self.lock_dir, f"{self.namespace}-{stripe}.lock"), "a") as lock_file:
+            deadline = time.monotonic() + self.lock_timeout
+            locked = False
+            while not locked:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        break
+                    time.sleep(0.005)
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_or_compute(self, key, compute):
+        key = self._key(key)
+        found = self._lookup(key)
+        if found is not None:
+            self._count('hits')
+            return found[0]
+        with self._single_flight(key):
+            # Otro worker pudo haberlo calculado mientras se esperaba el bloqueo
+            found = self._lookup(key)
+            if found is not None:
+                self._count('coalesced')
+                return found[0]
+            self._count('misses')
+            value = compute()
+            try:
+                self.store.set(key, self.dumps(value), self.ttl)
+            except Exception:
+                self._count('errors')
+                logger.debug("Error al guardar %s en la caché compartida", key, exc_info=True)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            stats = {
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                'ttl': self.ttl,
+                'version': self.version,
+                'discarded': self.discarded,
+            }
+        try:
+            stats['store'] = self.store.stats()
+        except Exception:
+            stats['store'] = None
+        return stats
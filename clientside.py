@@ -0,0 +1,28 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+# Columnas que se envían al navegador en el modo de filtrado clientside
+CLIENTSIDE_CATEGORICAL = ['Empresa', 'Sector', 'Nombre Entidad Acreedora', 'Plazo', 'Tipo Moneda', 'Rating']
+CLIENTSIDE_NUMERIC = ['Tasa Nominal', 'Total']
+
+
+def encode_array(values):
+    # Arreglo numérico como base64 de sus bytes little-endian (se lee en JS con un TypedArray)
+    values = np.ascontiguousarray(values)
+    return {'dtype': values.dtype.name, 'data': base64.b64encode(values.astype(values.dtype.newbyteorder('<')).tobytes()).decode('ascii')}
+
+
+def encode_frame(df, categorical=CLIENTSIDE_CATEGORICAL, numeric=CLIENTSIDE_NUMERIC):
+    # Codificación columnar compacta: cada categórica como códigos enteros (-1 = vacío) más sus
+    # etiquetas ordenadas (el mismo orden en que agrupa pandas) y cada numérica como float64
+    # (NaN = vacío)
+    columns = {}
+    for column in categorical:
+        codes, labels = pd.factorize(df[column], sort=True)
+        dtype = np.int8 if len(labels) < 127 else np.int16 if len(labels) < 32767 else np.int32
+        columns[column] = {'codes': encode_array(codes.astype(dtype)), 'labels': [str(label) for label in labels]}
+    for column in numeric:
+        columns[column] = {'values': encode_array(df[column].to_numpy(dtype=np.float64))}
+    return {'rows': len(df), 'columns': columns}
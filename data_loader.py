@@ -0,0 +1,129 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from openpyxl import load_workbook
+
+# Rutas por defecto del libro de Excel y de la carpeta con los snapshots columnares
+EXCEL_PATH = "data/tasas_interes.xlsx"
+SHEET_NAME = "bd_2023"
+SNAPSHOT_DIR = "data/cache"
+# Las hojas con este prefijo son períodos de reporte (bd_2023, bd_2024_q1, ...)
+PERIOD_PREFIX = "bd_"
+
+# Tipos de las columnas del libro para que el snapshot quede tipado
+TEXT_COLUMNS = [
+    'Nombre Entidad Acreedora', 'Pais Empresa Acreedora', 'Empresa', 'Rating',
+    'Sector', 'Tipo', 'Plazo', 'Tipo Moneda',
+]
+NUMERIC_COLUMNS = ['Tasa Nominal', 'Total']
+# Columnas de texto de baja cardinalidad que se guardan como categóricas (diccionario compartido)
+CATEGORICAL_COLUMNS = [
+    'Empresa', 'Sector', 'Plazo', 'Nombre Entidad Acreedora', 'Tipo Moneda', 'Rating',
+    'Pais Empresa Acreedora', 'Tipo',
+]
+# Se incrementa cuando cambia el formato del snapshot para forzar su reconstrucción (3: filas
+# validadas por ingest.py, versión por contenido de la hoja; 4: se conservan las filas repetidas)
+SNAPSHOT_FORMAT = 4
+
+
+def snapshot_paths(sheet_name, snapshot_dir=SNAPSHOT_DIR):
+    base = os.path.join(snapshot_dir, sheet_name)
+    return base + ".feather", base + ".json"
+
+
+def read_meta(meta_path):
+    # JSON de metadatos (snapshot, manifiesto); None si no existe o está incompleto
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomic(path, data):
+    # Escritura a un temporal y os.replace: los lectores (otros workers) nunca ven un JSON a medias
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def compact_frame(df):
+    # Representación compacta: texto como categórico (códigos enteros + diccionario) y
+    # números reducidos a un tipo más chico solo si la conversión no pierde información
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns:
+            df[column] = _downcast_lossless(df[column])
+    return df
+
+
+def _downcast_lossless(series):
+    values = series.dropna()
+    # Montos enteros sin vacíos -> el entero más chico que los contenga
+    if len(values) == len(series) and (values == values.round()).all():
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        for dtype in ("int8", "int16", "int32", "int64"):
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                return series.astype(dtype)
+    # float32 solo si todos los valores se representan exactamente
+    as_float32 = series.astype("float32")
+    if (as_float32.astype("float64").fillna(0) == series.fillna(0)).all():
+        return as_float32
+    return series
+
+
+def memory_report(before, after):
+    # Bytes por columna antes y después de compactar
+    before_bytes = before.memory_usage(deep=True, index=False)
+    after_bytes = after.memory_usage(deep=True, index=False)
+    return {
+        column: {'before': int(before_bytes[column]), 'after': int(after_bytes[column]),
+                 'dtype': str(after[column].dtype)}
+        for column in after.columns
+    }
+
+
+def snapshot_meta(sheet_name, snapshot_dir=SNAPSHOT_DIR):
+    return read_meta(snapshot_paths(sheet_name, snapshot_dir)[1]) or {}
+
+
+def load_snapshot(snapshot_path):
+    # Mapear el archivo en memoria. Con un bloque por columna (split_blocks) las columnas
+    # numéricas sin vacíos quedan como vistas de solo lectura sobre el archivo mapeado, sin
+    # copiarse; por defecto to_pandas las consolida en un bloque nuevo y las copia. Las
+    # categóricas se reconstruyen desde los diccionarios guardados en el archivo
+    table = feather.read_table(snapshot_path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_manifest(excel_path=EXCEL_PATH, snapshot_dir=SNAPSHOT_DIR):
+    # Manifiesto de períodos disponibles (hojas del libro), guardado junto a los snapshots para
+    # no abrir el Excel en cada arranque mientras no cambie
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest_path = os.path.join(snapshot_dir, "manifest.json")
+    stat = os.stat(excel_path)
+    manifest = read_meta(manifest_path)
+    if manifest and manifest.get('mtime') == stat.st_mtime and manifest.get('size') == stat.st_size:
+        return manifest
+
+    workbook = load_workbook(excel_path, read_only=True)
+    try:
+        sheet_names = workbook.sheetnames
+    finally:
+        workbook.close()
+    periods = sorted(name for name in sheet_names if name.startswith(PERIOD_PREFIX))
+    manifest = {'mtime': stat.st_mtime, 'size': stat.st_size, 'periods': periods}
+    write_json_atomic(manifest_path, manifest)
+    return manifest
+
+
+def period_label(period):
+    # "bd_2023" -> "2023", "bd_2024_q1" -> "2024 Q1"
+    return period[len(PERIOD_PREFIX):].replace("_", " ").upper() if period.startswith(PERIOD_PREFIX) else period
@@ -0,0 +1,294 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+
+from aggregates import RateCube
+from cache import LRUCache, normalize_selection
+from data_loader import (EXCEL_PATH, PERIOD_PREFIX, SHEET_NAME, SNAPSHOT_DIR, period_label, read_manifest,
+                         snapshot_meta)
+from exports import ExcelExporter
+from filters import FilterIndex, option_sort_key
+from ingest import load_dataframe
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de la caché de resultados filtrados de cada partición
+FILTERED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def options_for(values):
+    return [{'label': value, 'value': value} for value in values if pd.notna(value)]
+
+
+def counted_options(counts, selected):
+    # Opciones con la cantidad de créditos en la etiqueta, en el orden de counts (por nombre): los
+    # valores con filas más los ya seleccionados (aunque queden en 0, para que se puedan quitar)
+    selected = set(selected or [])
+    options = [{'label': f"{value} ({count:,})", 'value': value}
+               for value, count in counts.items() if count or value in selected]
+    missing = [value for value in selected if value not in counts]
+    if missing:
+        options = sorted(options + [{'label': f"{value} (0)", 'value': value} for value in missing],
+                         key=lambda option: option_sort_key(option['value']))
+    return options
+
+
+def frame_bytes(df):
+    # Sin deep: los textos son categóricos, cuyos diccionarios se comparten con el DataFrame completo
+    return int(df.memory_usage(index=True).sum())
+
+
+def process_memory():
+    # Memoria del proceso (Linux): RSS total y cuánto está compartido con otros workers
+    memory = {'pid': os.getpid()}
+    for path, keys in (("/proc/self/status", ("VmRSS",)),
+                       ("/proc/self/smaps_rollup", ("Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"))):
+        try:
+            with open(path) as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name in keys:
+                        memory[name] = int(value.split()[0]) * 1024
+        except OSError:
+            pass
+    return memory
+
+
+class Dataset:
+    # Una versión de los datos con todo lo que se deriva de ella (índices, cubo, opciones de
+    # los dropdowns y cachés). No se modifica después de construida: al recargar se crea otra
+
+    def __init__(self, df, sheet_name=SHEET_NAME):
+        self.df = df
+        self.sheet_name = sheet_name
+        self.version = df.attrs.get('data_version', '')
+        self.loaded_at = time.time()
+
+        # Índice invertido para resolver los filtros de los dropdowns (solo bancos chilenos)
+        self.filter_index = FilterIndex(df, base_mask=(df['Pais Empresa Acreedora'] == 'Chile').to_numpy())
+        self.df_bancos_chilenos = self.filter_index.base_frame()
+        # Cubo pre-agregado de tasas de bancos chilenos para KPIs y gráfico de barras
+        self.rate_cube = RateCube(self.df_bancos_chilenos)
+        # Caché de resultados filtrados compartida por los callbacks de esta versión. Cada
+        # resultado es una copia de sus filas, por lo que se acota por bytes y no solo por cantidad
+        self.filtered_cache = LRUCache(maxsize=256, max_bytes=FILTERED_CACHE_MAX_BYTES, sizeof=frame_bytes)
+
+        # Opciones de los dropdowns
+        self.empresa_options = options_for(df['Empresa'].unique())
+        self.sector_options = options_for(df['Sector'].unique())
+        self.plazo_options = options_for(df['Plazo'].unique())
+        self.banco_options = options_for(self.df_bancos_chilenos['Nombre Entidad Acreedora'].unique())
+
+        # Obtener una lista de colores únicos para cada banco
+        self.colores_banco = px.colors.qualitative.Set1[:len(df['Nombre Entidad Acreedora'].unique())]
+
+        self.excel_exporter = ExcelExporter(df, self.version, sheet_name=sheet_name,
+                                            base_row_ids=self.filter_index.row_ids())
+        self.base_nbytes = int(df.memory_usage(deep=True).sum() + self.rate_cube.cells.memory_usage(deep=True).sum()
+                               + self.rate_cube.cooccurrence.memory_usage(deep=True).sum()
+                               + self.rate_cube.sketch.nbytes)
+
+    @property
+    def nbytes(self):
+        # Memoria aproximada de la partición con su caché de filtrado, para el presupuesto del almacén
+        return self.base_nbytes + self.filtered_cache.bytes
+
+    def filter(self, selected_empresas, selected_sectores, selected_bancos, selected_plazo):
+        # Filas de bancos chilenos que cumplen las selecciones de los dropdowns. El resultado
+        # se comparte entre callbacks, por lo que no debe modificarse
+        key = normalize_selection(selected_empresas, selected_sectores, selected_bancos, selected_plazo)
+        empresas, sectores, bancos, plazos = key
+        return self.filtered_cache.get_or_compute(
+            key,
+            lambda: self.filter_index.select(empresas=empresas, sectores=sectores, bancos=bancos, plazos=plazos),
+        )
+
+    def dropdown_options(self, selected_empresas, selected_sectores, selected_bancos, selected_plazo):
+        # Opciones de los dropdowns de empresa, sector, banco y plazo, cada una acotada por las
+        # selecciones de los otros tres (desde la co-ocurrencia del cubo, sin refiltrar filas)
+        selection = {'empresas': selected_empresas, 'sectores': selected_sectores,
+                     'bancos': selected_bancos, 'plazos': selected_plazo}
+        counts = self.rate_cube.option_counts(**selection)
+        return tuple(counted_options(counts[name], selected) for name, selected in selection.items())
+
+    def row_ids(self, selected_empresas, selected_sectores, selected_bancos, selected_plazo):
+        return self.filter_index.row_ids(empresas=selected_empresas, sectores=selected_sectores,
+                                         bancos=selected_bancos, plazos=selected_plazo)
+
+    def cells(self, selected_empresas, selected_sectores, selected_bancos, selected_plazo):
+        # Celdas del cubo que cumplen las selecciones de los dropdowns
+        return self.rate_cube.select(empresas=selected_empresas, sectores=selected_sectores,
+                                     bancos=selected_bancos, plazos=selected_plazo)
+
+
+class DataStore:
+    # Almacén versionado y particionado por período: cada hoja del Excel (bd_2023, ...) es una
+    # partición que se carga al primer uso y se desaloja (LRU) si se supera el presupuesto de
+    # memoria. Cuando cambia el Excel se relee el manifiesto y se reemplazan las particiones de
+    # una vez; los callbacks que ya tomaron un Dataset terminan con la versión anterior
+
+    def __init__(self, excel_path=EXCEL_PATH, sheet_name=None, poll_interval=60,
+                 memory_budget=512 * 1024 * 1024, snapshot_dir=SNAPSHOT_DIR):
+        # Los hilos (revisión del Excel y exportación base a Excel) parten recién con
+        # start_background, para poder crear el almacén en un proceso que luego hace fork
+        self.background = False
+        self.excel_path = excel_path
+        self.snapshot_dir = snapshot_dir
+        self.poll_interval = poll_interval
+        self.memory_budget = memory_budget
+        self.reloads = 0
+        self.loads = 0
+        self.evictions = 0
+        self.last_error = None
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stamp = self._file_stamp()
+        self._requested_period = sheet_name
+        self._partitions = OrderedDict()
+        self.periods, self.default_period = self._read_periods()
+        self.get(self.default_period)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.excel_path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _read_periods(self):
+        periods = read_manifest(self.excel_path, self.snapshot_dir)['periods']
+        if not periods:
+            raise ValueError(f"{self.excel_path} no tiene hojas de período ({PERIOD_PREFIX}*)")
+        # Por defecto se muestra la hoja pedida o, si no existe, el período más reciente
+        default = self._requested_period if self._requested_period in periods else periods[-1]
+        return periods, default
+
+    def _build(self, period):
+        dataset = Dataset(load_dataframe(self.excel_path, sheet_name=period, snapshot_dir=self.snapshot_dir), period)
+        if self.background:
+            dataset.excel_exporter.start_full_build()
+        self.loads += 1
+        return dataset
+
+    @property
+    def current(self):
+        # Dataset del período por defecto
+        return self.get(self.default_period)
+
+    def period_options(self):
+        return [{'label': period_label(period), 'value': period} for period in reversed(self.periods)]
+
+    def get(self, period=None):
+        # Dataset de un período; se carga de forma perezosa en el primer acceso
+        period = period or self.default_period
+        if period not in self.periods:
+            raise KeyError(period)
+        with self._lock:
+            dataset = self._partitions.get(period)
+            if dataset is not None:
+                self._partitions.move_to_end(period)
+                return dataset
+        with self._load_lock:
+            # Otro hilo pudo haberla cargado mientras se esperaba
+            with self._lock:
+                dataset = self._partitions.get(period)
+            if dataset is None:
+                dataset = self._build(period)
+                with self._lock:
+                    self._partitions[period] = dataset
+                    self._evict()
+        return dataset
+
+    def _evict(self):
+        # Desalojar particiones menos usadas hasta quedar bajo el presupuesto de memoria; la del
+        # período por defecto nunca se desaloja
+        while sum(dataset.nbytes for dataset in self._partitions.values()) > self.memory_budget:
+            candidates = [period for period in self._partitions if period != self.default_period]
+            if not candidates:
+                break
+            self._partitions.pop(candidates[0])
+            self.evictions += 1
+
+    def on_reload(self, callback):
+        # Registrar una función callback(anterior, nueva) para invalidar cachés dependientes
+        self._listeners.append(callback)
+        return callback
+
+    def reload(self):
+        # Construir la nueva versión fuera de la ruta de las peticiones y activarla de una vez.
+        # Las demás particiones se vuelven a cargar a pedido
+        with self._reload_lock:
+            self._stamp = self._file_stamp()
+            previous = self.current
+            try:
+                periods, default_period = self._read_periods()
+                dataset = self._build(default_period)
+            except Exception as exc:  # Un Excel a medio copiar no debe botar el worker
+                self.last_error = repr(exc)
+                logger.exception("No se pudo recargar %s", self.excel_path)
+                return previous
+            with self._lock:
+                self.periods, self.default_period = periods, default_period
+                self._partitions = OrderedDict({default_period: dataset})
+            self.reloads += 1
+            self.last_error = None
+        if dataset.version != previous.version:
+            logger.info("Datos recargados: versión %s -> %s", previous.version, dataset.version)
+            for callback in self._listeners:
+                callback(previous, dataset)
+        return dataset
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if self._file_stamp() != self._stamp:
+                self.reload()
+
+    def start_background(self):
+        # Inicia la revisión del Excel y las exportaciones base de las particiones ya cargadas (las
+        # que se carguen después la inician al construirse). Con gunicorn --preload se llama en
+        # cada worker (post_fork) y no en el maestro: un fork mientras un hilo tiene tomado un lock
+        # deja ese lock tomado para siempre en el worker
+        with self._lock:
+            started = self.background
+            self.background = True
+            datasets = list(self._partitions.values())
+        if not started:
+            for dataset in datasets:
+                dataset.excel_exporter.start_full_build()
+        if (self._watcher is None or not self._watcher.is_alive()) and self.poll_interval:
+            self._watcher = threading.Thread(target=self._watch, name="data-watcher", daemon=True)
+            self._watcher.start()
+
+    def status(self):
+        dataset = self.current
+        with self._lock:
+            partitions = {
+                period: {'data_version': loaded.version, 'rows': len(loaded.df), 'bytes': loaded.nbytes,
+                         'columns': meta.get('memory_report', {}), 'ingest': meta.get('ingest', {})}
+                for period, loaded in self._partitions.items()
+                for meta in [snapshot_meta(period, self.snapshot_dir)]
+            }
+        return {
+            'data_version': dataset.version,
+            'sheet_name': dataset.sheet_name,
+            'rows': len(dataset.df),
+            'loaded_at': dataset.loaded_at,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'filtered_cache': dataset.filtered_cache.stats(),
+            'periods': self.periods,
+            'partitions': partitions,
+            'partition_loads': self.loads,
+            'partition_evictions': self.evictions,
+            'memory_budget': self.memory_budget,
+            'process': process_memory(),
+        }
@@ -0,0 +1,174 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+# Carpeta donde se guardan las exportaciones a Excel ya generadas
+EXPORT_DIR = "data/cache/exports"
+
+# Filas por bloque al generar el CSV en streaming
+CSV_CHUNK_ROWS = 5000
+
+# Exportaciones filtradas que se conservan en disco por versión (las usadas más recientemente)
+FILTERED_EXPORTS_MAX_FILES = 64
+FILTERED_EXPORTS_MAX_BYTES = 256 * 1024 * 1024
+EXPORT_LOCK_STRIPES = 16
+
+
+def iter_csv(df, row_ids, chunk_rows=CSV_CHUNK_ROWS, gzip=False):
+    # Genera el CSV de las filas indicadas por bloques, sin armar el archivo completo en
+    # memoria. Con gzip=True cada bloque se comprime en el mismo flujo
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+
+    def emit(text):
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor is not None else data
+
+    yield emit(df.iloc[:0].to_csv(index=False))
+    for start in range(0, len(row_ids), chunk_rows):
+        chunk = df.iloc[row_ids[start:start + chunk_rows]]
+        data = emit(chunk.to_csv(index=False, header=False))
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+class ExcelExporter:
+    # Exportaciones a Excel construidas con openpyxl en modo write-only y guardadas en disco.
+    # La exportación base (las filas que muestra el dashboard sin filtros) se construye en
+    # segundo plano al cambiar la versión de los datos; las filtradas se construyen a pedido y
+    # quedan en caché con clave por las filas que contienen, acotadas a las más recientes
+
+    def __init__(self, df, data_version, sheet_name, base_row_ids=None, export_dir=EXPORT_DIR,
+                 max_files=FILTERED_EXPORTS_MAX_FILES, max_bytes=FILTERED_EXPORTS_MAX_BYTES):
+        self.df = df
+        self.data_version = data_version
+        self.sheet_name = sheet_name
+        self.base_row_ids = np.arange(len(df)) if base_row_ids is None else base_row_ids
+        self.export_dir = export_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        # Un número fijo de locks repartidos por ruta: no crece con las selecciones pedidas
+        self._locks = [threading.Lock() for _ in range(EXPORT_LOCK_STRIPES)]
+        self._evict_lock = threading.Lock()
+        self._full_thread = None
+        self._current_name = re.compile(rf"{re.escape(data_version)}_(?:base|[0-9a-f]{{16}})\.xlsx")
+        self._filtered_name = re.compile(rf"{re.escape(data_version)}_[0-9a-f]{{16}}\.xlsx")
+        os.makedirs(export_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.export_dir, f"{self.data_version}_{name}.xlsx")
+
+    def _lock_for(self, path):
+        return self._locks[zlib.crc32(path.encode("utf-8")) % len(self._locks)]
+
+    def write_xlsx(self, row_ids, target):
+        # Escribir fila a fila en modo streaming; target es una ruta (se reemplaza de forma
+        # atómica) o un archivo abierto
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(self.sheet_name)
+        sheet.append(list(self.df.columns))
+        for start in range(0, len(row_ids), CSV_CHUNK_ROWS):
+            chunk = self.df.iloc[row_ids[start:start + CSV_CHUNK_ROWS]]
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append([None if pd.isna(value) else value for value in row])
+        if not isinstance(target, str):
+            workbook.save(target)
+            return
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        workbook.save(tmp_path)
+        os.replace(tmp_path, target)
+
+    def _build(self, path, row_ids):
+        # Devuelve True si el archivo se generó en esta llamada
+        with self._lock_for(path):
+            if os.path.exists(path):
+                return False
+            start = time.perf_counter()
+            self.write_xlsx(row_ids, path)
+            logger.info("Excel %s generado en %.1f ms", os.path.basename(path),
+                        (time.perf_counter() - start) * 1000)
+            return True
+
+    def start_full_build(self):
+        # Construir la exportación base en un hilo y borrar las de versiones anteriores
+        self._remove_stale()
+        self._full_thread = threading.Thread(
+            target=self._build, args=(self._path("base"), self.base_row_ids),
+            name="excel-export", daemon=True,
+        )
+        self._full_thread.start()
+
+    def _remove_stale(self):
+        # Solo se borran las exportaciones de la misma hoja (las de otros períodos siguen
+        # vigentes) que no son de esta versión o tienen un formato de nombre anterior
+        same_sheet = re.compile(rf"{re.escape(self.sheet_name)}_[0-9a-f]*_[^_]+\.xlsx")
+        for name in os.listdir(self.export_dir):
+            if same_sheet.fullmatch(name) and not self._current_name.fullmatch(name):
+                try:
+                    os.remove(os.path.join(self.export_dir, name))
+                except OSError:
+                    pass
+
+    def full_export(self):
+        # Ruta de la exportación base; si aún se está construyendo se espera a que termine
+        if self._full_thread is not None:
+            self._full_thread.join()
+        path = self._path("base")
+        self._build(path, self.base_row_ids)
+        return path
+
+    def filtered_export(self, row_ids):
+        # Ruta de la exportación de esas filas. La clave son las filas y no los parámetros, así
+        # distintas URLs con el mismo resultado (p.ej. valores desconocidos) comparten el archivo
+        digest = hashlib.blake2b(np.asarray(row_ids, dtype=np.int64).tobytes(), digest_size=8).hexdigest()
+        path = self._path(digest)
+        if self._build(path, row_ids):
+            self._evict()
+        else:
+            try:
+                # Marca de uso para el desalojo en atime (mtime queda igual para el ETag)
+                os.utime(path, (time.time(), os.stat(path).st_mtime))
+            except OSError:
+                pass
+        return path
+
+    def export_bytes(self, row_ids):
+        # Exportación en memoria, sin caché (p.ej. selecciones sin filas)
+        buffer = io.BytesIO()
+        self.write_xlsx(row_ids, buffer)
+        buffer.seek(0)
+        return buffer
+
+    def _evict(self):
+        # Deja las max_files exportaciones filtradas usadas más recientemente de esta versión,
+        # sin superar max_bytes entre todas (en disco, así lo respetan todos los workers)
+        with self._evict_lock:
+            entries = []
+            for name in os.listdir(self.export_dir):
+                if self._filtered_name.fullmatch(name):
+                    try:
+                        stat = os.stat(os.path.join(self.export_dir, name))
+                    except OSError:
+                        continue
+                    entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, name))
+            entries.sort(reverse=True)
+            total = 0
+            for position, (_, size, name) in enumerate(entries):
+                total += size
+                if position >= self.max_files or (position > 0 and total > self.max_bytes):
+                    try:
+                        os.remove(os.path.join(self.export_dir, name))
+                    except OSError:
+                        pass
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+# Columnas por las que filtran los dropdowns del dashboard (nombre del filtro -> columna)
+FILTER_COLUMNS = {
+    'empresas': 'Empresa',
+    'sectores': 'Sector',
+    'bancos': 'Nombre Entidad Acreedora',
+    'plazos': 'Plazo',
+}
+
+
+def option_sort_key(value):
+    # Orden alfabético de las opciones de los dropdowns, sin distinguir mayúsculas
+    return str(value).casefold(), str(value)
+
+
+class FilterIndex:
+    # Índice invertido: para cada valor de cada columna de filtro guarda los ids de fila
+    # (ordenados) en que aparece, de modo que una selección se resuelve con uniones e
+    # intersecciones de esos conjuntos en vez de recorrer el DataFrame con .isin()
+
+    def __init__(self, df, columns=FILTER_COLUMNS, base_mask=None):
+        self.df = df
+        self.columns = dict(columns)
+        self.n_rows = len(df)
+        self.postings = {}
+        for column in self.columns.values():
+            codes, uniques = pd.factorize(df[column], sort=False)
+            # Agrupar los ids de fila por código con un argsort estable
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self.postings[column] = {
+                value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques)
+            }
+        # Filas que siempre se consideran (p.ej. solo bancos chilenos)
+        if base_mask is None:
+            self.base_mask = np.ones(self.n_rows, dtype=bool)
+        else:
+            self.base_mask = np.asarray(base_mask, dtype=bool)
+        self.base_rows = int(self.base_mask.sum())
+        self._base_frame = None
+        # Códigos por columna para contar filas por valor (se calculan al primer uso)
+        self._codes = {}
+
+    def values(self, column):
+        return list(self.postings[column].keys())
+
+    def _column_mask(self, column, selected):
+        # Unión de los ids de fila de los valores seleccionados
+        mask = np.zeros(self.n_rows, dtype=bool)
+        postings = self.postings[column]
+        for value in selected:
+            rows = postings.get(value)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def mask(self, **selection):
+        # Intersección de las uniones por columna; None o [] significan "sin filtro"
+        mask = self.base_mask.copy()
+        for name, selected in selection.items():
+            if selected:
+                mask &= self._column_mask(self.columns[name], selected)
+        return mask
+
+    def _column_codes(self, column):
+        # Códigos renumerados según el orden de los valores por nombre (sin distinguir mayúsculas),
+        # para que los conteos salgan ya ordenados
+        if column not in self._codes:
+            codes, uniques = pd.factorize(self.df[column], sort=False)
+            order = sorted(range(len(uniques)), key=lambda i: option_sort_key(uniques[i]))
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1)
+            self._codes[column] = codes, [uniques[i] for i in order]
+        return self._codes[column]
+
+    def facet_counts(self, weights=None, **selection):
+        # Para cada filtro, cuántas filas (o la suma de weights) tiene cada uno de sus valores
+        # bajo las selecciones de los demás filtros; la selección propia no se aplica para que
+        # se pueda seguir ampliando. Devuelve {nombre del filtro: {valor: conteo}}, con los valores
+        # ordenados por nombre
+        masks = {name: self._column_mask(self.columns[name], selected)
+                 for name, selected in selection.items() if selected}
+        counts = {}
+        for name, column in self.columns.items():
+            mask = self.base_mask.copy()
+            for other, other_mask in masks.items():
+                if other != name:
+                    mask &= other_mask
+            codes, uniques = self._column_codes(column)
+            keep = mask & (codes >= 0)
+            totals = np.bincount(codes[keep], weights=None if weights is None else weights[keep],
+                                 minlength=len(uniques))
+            counts[name] = dict(zip(uniques, totals.astype('int64').tolist()))
+        return counts
+
+    def row_ids(self, **selection):
+        return np.flatnonzero(self.mask(**selection))
+
+    def base_frame(self):
+        # Recorte base calculado una sola vez y compartido entre llamadas
+        if self._base_frame is None:
+            if self.base_mask.all():
+                self._base_frame = self.df
+            else:
+                self._base_frame = self.df.iloc[np.flatnonzero(self.base_mask)]
+        return self._base_frame
+
+    def select(self, **selection):
+        # Devuelve las filas seleccionadas en el orden original. Sin filtros activos (o si la
+        # selección cubre todo el recorte base) se devuelve el recorte base compartido, y si las
+        # filas son contiguas una vista por rango; en ambos casos sin copiar, por lo que el
+        # resultado no debe modificarse. Una selección dispersa sí copia sus filas (iloc con
+        # posiciones); quien solo necesite las posiciones debe usar row_ids
+        if not any(selection.values()):
+            return self.base_frame()
+        row_ids = self.row_ids(**selection)
+        if len(row_ids) == self.base_rows:
+            return self.base_frame()
+        if len(row_ids) and row_ids[-1] - row_ids[0] + 1 == len(row_ids):
+            return self.df.iloc[row_ids[0]:row_ids[-1] + 1]
+        return self.df.iloc[row_ids]
+
+
+def as_plain(df, columns):
+    # Copia liviana con las columnas categóricas indicadas convertidas a valores simples, para
+    # Plotly Express (que no maneja categorías sin observaciones en el recorte filtrado)
+    converted = {
+        column: df[column].astype(object)
+        for column in columns
+        if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype)
+    }
+    return df.assign(**converted) if converted else df
@@ -0,0 +1,58 @@
+import gc
+import os
+
+# Configuración de gunicorn (Procfile: gunicorn -c gunicorn.conf.py app:server)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+
+# Workers gthread: cada worker atiende GUNICORN_THREADS peticiones a la vez, así las cinco
+# peticiones que dispara cada cambio de los dropdowns (KPIs, caja, barras y dispersión,
+# comparación y opciones) y las descargas no esperan en cola detrás de otra, y las conexiones
+# keep-alive del navegador no ocupan un worker entero. Los callbacks son de CPU (pandas,
+# plotly) y comparten el GIL del worker, por lo que el paralelismo real sigue viniendo de
+# WEB_CONCURRENCY (un worker por núcleo). Los workers asíncronos (gevent, eventlet) no se
+# soportan: no ayudan con trabajo de CPU y su monkey patching llega después de los hilos que crea
+# la app al cargarse en el maestro. GUNICORN_WORKER_CLASS=sync vuelve a un worker por petición
+# (benchmarks/load_test.py compara ambas configuraciones)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class not in ("gthread", "sync"):
+    raise ValueError(f"GUNICORN_WORKER_CLASS debe ser 'gthread' o 'sync', no {worker_class!r}")
+# Con más de un hilo gunicorn cambia sync por gthread, por lo que sync queda con uno
+threads = int(os.environ.get("GUNICORN_THREADS", "4")) if worker_class == "gthread" else 1
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# Modo preload: el proceso maestro carga los datos una sola vez y los workers creados con fork
+# comparten esas páginas de memoria (copy-on-write) en vez de tener cada uno su copia.
+# Se puede desactivar con GUNICORN_PRELOAD=0
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+if preload_app:
+    # La app no inicia hilos al cargarse en el maestro (ver post_fork)
+    os.environ["GUNICORN_PRELOADING"] = "1"
+
+
+def pre_fork(server, worker):
+    # Mover los objetos ya creados a la generación permanente del recolector para que sus
+    # recorridos no escriban en las páginas compartidas y las dupliquen en cada worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Con preload el maestro carga los datos pero no inicia hilos: si hiciera fork mientras un
+    # hilo suyo (p.ej. la exportación a Excel) tiene tomado un lock, el worker heredaría ese lock
+    # tomado y sin dueño. Cada worker inicia aquí la revisión del Excel, la exportación base y el
+    # precálculo (lo que otro worker ya calculó lo encuentra en la caché compartida)
+    if preload_app:
+        import app
+        app.start_background()
+
+
+def post_worker_init(worker):
+    from data_store import process_memory
+    memory = process_memory()
+    worker.log.info(
+        "Worker %s: RSS %.1f MB (compartida %.1f MB)",
+        worker.pid,
+        memory.get("VmRSS", 0) / 1e6,
+        (memory.get("Shared_Clean", 0) + memory.get("Shared_Dirty", 0)) / 1e6,
+    )
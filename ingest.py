@@ -0,0 +1,467 @@
+# Ingesta de las hojas de período del libro de Excel a los snapshots columnares: lectura en
+# streaming (openpyxl en modo solo lectura), validación del esquema, normalización de montos
+# ("$ 1.234.567", "1,234,567.89") y tasas ("6,5%") y descarte de filas inválidas con su motivo
+# (las filas repetidas se conservan y se informan). Contra el snapshot existente solo se incorporan
+# las filas nuevas o modificadas (y se quitan las que ya no están); las hojas sin cambios en el
+# .xlsx no se vuelven a leer.
+#
+#     python ingest.py                          # todas las hojas bd_* de data/tasas_interes.xlsx
+#     python ingest.py --sheet bd_2024_q1       # solo algunas hojas (repetible)
+#     python ingest.py --report informe.json    # además guarda el informe completo en JSON
+#     python ingest.py --force                  # relee las hojas aunque no hayan cambiado
+import argparse
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import posixpath
+import re
+import sys
+import time
+import zipfile
+from contextlib import contextmanager
+from xml.etree import ElementTree
+
+import pandas as pd
+import pyarrow.feather as feather
+from openpyxl import load_workbook
+
+from data_loader import (EXCEL_PATH, NUMERIC_COLUMNS, PERIOD_PREFIX, SHEET_NAME, SNAPSHOT_DIR, SNAPSHOT_FORMAT,
+                         TEXT_COLUMNS, compact_frame, load_snapshot, memory_report, read_manifest, read_meta,
+                         snapshot_paths, write_json_atomic)
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = TEXT_COLUMNS + NUMERIC_COLUMNS
+# Sin acreedor o sin empresa la fila no se puede filtrar ni agregar
+REQUIRED_VALUES = ['Nombre Entidad Acreedora', 'Empresa']
+# Llave de un crédito: quién presta a quién y en qué condiciones. No es única (una empresa puede
+# tener varios tramos con el mismo banco); tasa, monto, rating, sector y país son atributos: si
+# cambian, el crédito se considera modificado
+LOAN_KEY_COLUMNS = ['Nombre Entidad Acreedora', 'Empresa', 'Tipo', 'Plazo', 'Tipo Moneda']
+# Tasas aceptadas (fracción: 0.065 = 6,5%); fuera de este rango la fila se rechaza
+RATE_BOUNDS = (-1.0, 1.0)
+# Ejemplos de filas rechazadas que se guardan en el informe
+REJECT_SAMPLES = 20
+
+# Símbolos y códigos de moneda que pueden acompañar a un monto
+CURRENCY_PATTERN = re.compile(r"(?i)us\$|m\$|clp|usd|eur|uf|\$")
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+DOC_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+class IngestError(ValueError):
+    pass
+
+
+def thousands_groups(groups):
+    # Grupos de miles válidos: el primero de 1 a 3 dígitos sin cero inicial ("0.065" no es 65) y
+    # los demás de exactamente 3
+    first = groups[0].lstrip("-")
+    return 1 <= len(first) <= 3 and not first.startswith("0") and all(len(group) == 3 for group in groups[1:])
+
+
+def parse_number(text, grouped):
+    # Número escrito con separadores de miles y decimales en formato chileno o inglés. Con
+    # grouped=True (montos) un único separador seguido de tres dígitos es de miles ("1.500"),
+    # salvo que la parte entera sea 0 ("0,065")
+    text = text.replace("\u00a0", "").replace(" ", "")
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1]
+    if "," in text and "." in text:
+        decimal = "," if text.rfind(",") > text.rfind(".") else "."
+        thousands = "." if decimal == "," else ","
+        integer, _, fraction = text.rpartition(decimal)
+        if not thousands_groups(integer.split(thousands)):
+            raise ValueError(text)
+        text = f"{integer.replace(thousands, '')}.{fraction}"
+    elif "," in text or "." in text:
+        separator = "," if "," in text else "."
+        groups = text.split(separator)
+        if len(groups) > 2 or (grouped and thousands_groups(groups)):
+            if not thousands_groups(groups):
+                raise ValueError(text)
+            text = "".join(groups)
+        else:
+            text = ".".join(groups)
+    if not NUMBER_PATTERN.fullmatch(text):
+        raise ValueError(text)
+    value = float(text)
+    return -value if negative else value
+
+
+def parse_money(value):
+    # Monto como float: números tal cual y textos sin símbolo de moneda ni separadores de miles
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return parse_number(CURRENCY_PATTERN.sub("", str(value)).strip(), grouped=True)
+
+
+def parse_rate(value):
+    # Tasa como fracción: números tal cual y textos con % divididos por 100 ("6,5%" -> 0.065)
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if text.endswith("%"):
+        return parse_number(text[:-1].strip(), grouped=False) / 100
+    return parse_number(text, grouped=False)
+
+
+def clean_text(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def normalize_row(values):
+    # Fila validada como dict {columna: valor} o (columna, motivo) si se rechaza
+    row = {column: clean_text(values[column]) for column in TEXT_COLUMNS}
+    for column in REQUIRED_VALUES:
+        if row[column] is None:
+            return column, "vacío"
+    for column, parse in (('Tasa Nominal', parse_rate), ('Total', parse_money)):
+        raw = values[column]
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            row[column] = math.nan
+            continue
+        try:
+            row[column] = parse(raw)
+        except ValueError:
+            return column, "no numérico"
+        if not math.isfinite(row[column]):
+            return column, "no numérico"
+    if not math.isnan(row['Tasa Nominal']) and not RATE_BOUNDS[0] <= row['Tasa Nominal'] <= RATE_BOUNDS[1]:
+        return 'Tasa Nominal', "fuera de rango"
+    if row['Total'] < 0:
+        return 'Total', "negativo"
+    return row
+
+
+def read_sheet(excel_path, sheet_name, report):
+    # Filas válidas de la hoja en un DataFrame con tipos estables (texto como str, números como
+    # float64). Las filas vacías se omiten y las inválidas quedan en el informe
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise IngestError(f"{excel_path} no tiene la hoja {sheet_name}")
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = [clean_text(name) for name in next(rows, ())]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise IngestError(f"{sheet_name}: faltan las columnas {missing}")
+        positions = {column: header.index(column) for column in COLUMNS}
+        report['ignored_columns'] = [name for name in header if name and name not in positions]
+
+        columns = {column: [] for column in COLUMNS}
+        rejects = report['rejects']
+        for number, values in enumerate(rows, start=2):
+            if values is None or all(value is None or value == "" for value in values):
+                report['blank_rows'] += 1
+                continue
+            report['rows_read'] += 1
+            values = {column: values[position] if position < len(values) else None
+                      for column, position in positions.items()}
+            row = normalize_row(values)
+            if isinstance(row, tuple):
+                column, reason = row
+                key = f"{column}: {reason}"
+                rejects['by_reason'][key] = rejects['by_reason'].get(key, 0) + 1
+                rejects['count'] += 1
+                if len(rejects['samples']) < REJECT_SAMPLES:
+                    rejects['samples'].append({'row': number, 'column': column, 'value': repr(values[column]),
+                                               'reason': reason})
+                continue
+            for column in COLUMNS:
+                columns[column].append(row[column])
+    finally:
+        workbook.close()
+
+    df = pd.DataFrame({column: pd.Series(columns[column], dtype="float64" if column in NUMERIC_COLUMNS else object)
+                       for column in COLUMNS})
+    report['accepted'] = len(df)
+    return df
+
+
+def expand_frame(df):
+    # Snapshot compacto (categóricas, enteros) de vuelta a los tipos de la ingesta, para comparar
+    # y combinar con las filas leídas
+    df = df[COLUMNS].copy()
+    for column in TEXT_COLUMNS:
+        df[column] = df[column].astype(object).where(df[column].notna(), None)
+    for column in NUMERIC_COLUMNS:
+        df[column] = df[column].astype("float64")
+    return df
+
+
+def row_hashes(df, columns=None):
+    return pd.util.hash_pandas_object(df[columns or COLUMNS], index=False).to_numpy()
+
+
+def count_duplicates(df):
+    # Filas idénticas en todas las columnas: pueden ser tramos iguales de un mismo crédito, así que
+    # se conservan y solo se informan
+    return int(pd.Series(row_hashes(df)).duplicated().sum())
+
+
+def occurrence_index(hashes):
+    # (hash de la fila, n.º de aparición): las filas repetidas se comparan como multiconjunto
+    return pd.MultiIndex.from_arrays([hashes, pd.Series(hashes).groupby(hashes).cumcount().to_numpy()])
+
+
+def merge_rows(existing, incoming, report):
+    # Las filas del snapshot que siguen igual se conservan en su orden; las nuevas o
+    # modificadas se agregan al final y las que ya no están en la hoja se quitan
+    if existing is None:
+        report.update(added=len(incoming), changed=0, removed=0, unchanged=0)
+        return incoming
+    incoming_rows = occurrence_index(row_hashes(incoming))
+    existing_rows = occurrence_index(row_hashes(existing))
+    kept = incoming_rows.get_indexer(existing_rows) >= 0
+    appended = existing_rows.get_indexer(incoming_rows) < 0
+    # Modificada: una fila nueva con la llave de una quitada (emparejadas una a una por llave)
+    removed_keys = pd.Series(row_hashes(existing[~kept], LOAN_KEY_COLUMNS)).value_counts()
+    appended_keys = pd.Series(row_hashes(incoming[appended], LOAN_KEY_COLUMNS)).value_counts()
+    changed = int(appended_keys.combine(removed_keys, min, fill_value=0).sum())
+    report.update(added=int(appended.sum()) - changed, changed=changed,
+                  removed=int((~kept).sum()) - changed, unchanged=int(kept.sum()))
+    if kept.all() and not appended.any():
+        return None
+    return pd.concat([existing[kept], incoming[appended]], ignore_index=True)
+
+
+def content_digest(df):
+    # Versión del contenido de la hoja (cambia solo si cambian sus filas)
+    return hashlib.sha256(row_hashes(df).tobytes()).hexdigest()
+
+
+def workbook_parts(archive):
+    # Rutas dentro del .xlsx de cada hoja y de las cadenas compartidas
+    def relationships(path):
+        folder, name = posixpath.split(path)
+        rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+        root = ElementTree.fromstring(archive.read(rels_path))
+        return [(rel.get('Id'), rel.get('Type'),
+                 rel.get('Target').lstrip("/") if rel.get('Target').startswith("/")
+                 else posixpath.normpath(posixpath.join(folder, rel.get('Target'))))
+                for rel in root.iter(f"{REL_NS}Relationship")]
+
+    workbook_path = next(target for _, kind, target in relationships("") if kind.endswith("/officeDocument"))
+    targets = {rel_id: target for rel_id, _, target in relationships(workbook_path)}
+    shared = next((target for _, kind, target in relationships(workbook_path) if kind.endswith("/sharedStrings")),
+                  None)
+    root = ElementTree.fromstring(archive.read(workbook_path))
+    sheets = {sheet.get('name'): targets[sheet.get(f"{DOC_REL_NS}id")] for sheet in root.iter(f"{MAIN_NS}sheet")}
+    return sheets, shared
+
+
+def shared_strings_digest(archive, path, count=None):
+    # (cantidad, digest) de las primeras count cadenas compartidas (todas con count=None). Una hoja
+    # solo referencia las cadenas que existían al ingerirla, así que si ese prefijo y el XML de la
+    # hoja no cambiaron, su contenido tampoco
+    digest = hashlib.sha256()
+    seen = 0
+    if path is not None and path in archive.namelist() and count != 0:
+        with archive.open(path) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag == f"{MAIN_NS}si":
+                    digest.update(ElementTree.tostring(element))
+                    element.clear()
+                    seen += 1
+                    if seen == count:
+                        break
+    return seen, digest.hexdigest()
+
+
+def sheet_fingerprint(excel_path, sheet_name, strings_count=None):
+    # Huella de una hoja sin leer sus filas: CRC y tamaño de su XML en el .xlsx más el prefijo de
+    # cadenas compartidas que puede referenciar
+    with zipfile.ZipFile(excel_path) as archive:
+        sheets, shared = workbook_parts(archive)
+        if sheet_name not in sheets:
+            raise IngestError(f"{excel_path} no tiene la hoja {sheet_name}")
+        info = archive.getinfo(sheets[sheet_name])
+        count, digest = shared_strings_digest(archive, shared, strings_count)
+    return {'crc': info.CRC, 'size': info.file_size, 'shared_strings': count, 'shared_strings_sha256': digest}
+
+
+def snapshot_is_fresh(excel_path, sheet_name, meta):
+    # El snapshot sirve si el libro no cambió (mtime y tamaño) o si cambió pero no esta hoja
+    if meta is None or meta.get('format') != SNAPSHOT_FORMAT:
+        return False
+    stat = os.stat(excel_path)
+    if meta.get('mtime') == stat.st_mtime and meta.get('size') == stat.st_size:
+        return True
+    stored = meta.get('sheet', {})
+    try:
+        current = sheet_fingerprint(excel_path, sheet_name, stored.get('shared_strings'))
+    except (IngestError, KeyError, zipfile.BadZipFile):
+        return False
+    return current == stored
+
+
+def new_report(sheet_name):
+    return {
+        'sheet_name': sheet_name, 'status': None, 'rows_read': 0, 'blank_rows': 0, 'accepted': 0,
+        'rejects': {'count': 0, 'by_reason': {}, 'samples': []}, 'ignored_columns': [], 'duplicates': 0,
+        'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0, 'rows': 0, 'data_version': None,
+        'seconds': {},
+    }
+
+
+def ingest_sheet(excel_path=EXCEL_PATH, sheet_name=SHEET_NAME, snapshot_dir=SNAPSHOT_DIR, force=False):
+    # Actualiza el snapshot de una hoja y devuelve el informe. Debe llamarse con el bloqueo de la
+    # hoja tomado (ver sheet_lock)
+    report = new_report(sheet_name)
+    start = time.perf_counter()
+    snapshot_path, meta_path = snapshot_paths(sheet_name, snapshot_dir)
+    meta = read_meta(meta_path)
+    if not force and snapshot_is_fresh(excel_path, sheet_name, meta):
+        report.update(status='unchanged', rows=meta.get('rows', 0), data_version=meta.get('data_version'))
+        report['seconds']['total'] = time.perf_counter() - start
+        return report
+
+    # El prefijo de cadenas compartidas se toma antes de leer: si el libro cambia durante la
+    # lectura, la próxima revisión vuelve a leer la hoja
+    fingerprint = sheet_fingerprint(excel_path, sheet_name)
+    incoming = read_sheet(excel_path, sheet_name, report)
+    report['duplicates'] = count_duplicates(incoming)
+    report['seconds']['read'] = time.perf_counter() - start
+
+    step = time.perf_counter()
+    existing = None
+    if meta and meta.get('format') == SNAPSHOT_FORMAT and os.path.exists(snapshot_path):
+        existing = expand_frame(load_snapshot(snapshot_path))
+    merged = merge_rows(existing, incoming, report)
+    report['seconds']['merge'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    stat = os.stat(excel_path)
+    if merged is None:
+        # Mismas filas (p.ej. se guardó el libro sin cambios en esta hoja): no se reescribe
+        report['status'] = 'unchanged'
+        meta.update(mtime=stat.st_mtime, size=stat.st_size, sheet=fingerprint)
+    else:
+        report['status'] = 'created' if existing is None else 'updated'
+        df = compact_frame(merged)
+        # Escribir en un archivo temporal y reemplazar de forma atómica para no romper a otros workers
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, snapshot_path)
+        meta = {
+            'format': SNAPSHOT_FORMAT, 'sheet_name': sheet_name, 'mtime': stat.st_mtime, 'size': stat.st_size,
+            'sheet': fingerprint, 'rows': len(df), 'columns': list(df.columns),
+            'data_version': f"{sheet_name}_{content_digest(merged)[:12]}",
+            'memory_report': memory_report(merged, df),
+        }
+    report['seconds']['write'] = time.perf_counter() - step
+    report['seconds']['total'] = time.perf_counter() - start
+    report.update(rows=meta['rows'], data_version=meta['data_version'])
+    meta['ingest'] = {key: report[key] for key in ('status', 'rows_read', 'accepted', 'duplicates', 'added',
+                                                   'changed', 'removed', 'seconds')}
+    meta['ingest'].update(rejected=report['rejects']['count'], at=time.time())
+    write_json_atomic(meta_path, meta)
+    return report
+
+
+@contextmanager
+def sheet_lock(sheet_name, snapshot_dir=SNAPSHOT_DIR):
+    # Bloqueo entre procesos por hoja: si varios workers (o la ingesta por línea de comandos)
+    # llegan a la vez, solo uno actualiza el snapshot
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(snapshot_paths(sheet_name, snapshot_dir)[0] + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_dataframe(excel_path=EXCEL_PATH, sheet_name=SHEET_NAME, snapshot_dir=SNAPSHOT_DIR):
+    # Cargar los datos desde el snapshot, ingiriendo antes la hoja si cambió en el Excel
+    start = time.perf_counter()
+    with sheet_lock(sheet_name, snapshot_dir):
+        report = ingest_sheet(excel_path, sheet_name, snapshot_dir)
+
+    snapshot_path, meta_path = snapshot_paths(sheet_name, snapshot_dir)
+    df = load_snapshot(snapshot_path)
+    # Versión de los datos: identifica la hoja y su contenido para invalidar cachés
+    meta = read_meta(meta_path) or {}
+    df.attrs['data_version'] = meta.get('data_version', sheet_name)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    memory = meta.get('memory_report', {})
+    logger.info(
+        "Datos cargados (%s filas, hoja %s) en %.1f ms%s; memoria %.1f KB -> %.1f KB",
+        len(df), sheet_name, elapsed_ms,
+        "" if report['status'] == 'unchanged' else
+        f" - ingesta {report['status']}: +{report['added']} ~{report['changed']} -{report['removed']}, "
+        f"{report['rejects']['count']} rechazadas",
+        sum(item['before'] for item in memory.values()) / 1024,
+        sum(item['after'] for item in memory.values()) / 1024,
+    )
+    return df
+
+
+def ingest(excel_path=EXCEL_PATH, sheets=None, snapshot_dir=SNAPSHOT_DIR, force=False):
+    # Ingesta de varias hojas (por defecto todas las de período); una hoja con errores de
+    # esquema queda en el informe sin detener las demás
+    start = time.perf_counter()
+    sheets = sheets or read_manifest(excel_path, snapshot_dir)['periods']
+    reports = []
+    for sheet_name in sheets:
+        try:
+            with sheet_lock(sheet_name, snapshot_dir):
+                reports.append(ingest_sheet(excel_path, sheet_name, snapshot_dir, force=force))
+        except IngestError as exc:
+            report = new_report(sheet_name)
+            report.update(status='error', error=str(exc))
+            reports.append(report)
+    return {'excel_path': excel_path, 'sheets': reports, 'seconds': time.perf_counter() - start}
+
+
+def print_report(result):
+    print(f"{'hoja':<14}{'estado':<11}{'leídas':>9}{'rechaz.':>9}{'duplic.':>9}{'nuevas':>9}{'modif.':>9}"
+          f"{'quitadas':>9}{'filas':>9}{'seg.':>8}")
+    for report in result['sheets']:
+        print(f"{report['sheet_name']:<14}{report['status']:<11}{report['rows_read']:>9,}"
+              f"{report['rejects']['count']:>9,}{report['duplicates']:>9,}{report['added']:>9,}"
+              f"{report['changed']:>9,}{report['removed']:>9,}{report['rows']:>9,}"
+              f"{report['seconds'].get('total', 0):>8.2f}")
+        if report.get('error'):
+            print(f"  error: {report['error']}")
+        for reason, count in report['rejects']['by_reason'].items():
+            print(f"  rechazadas {reason}: {count}")
+        for sample in report['rejects']['samples'][:5]:
+            print(f"    fila {sample['row']}, {sample['column']} = {sample['value']} ({sample['reason']})")
+    print(f"Total: {result['seconds']:.2f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta de las hojas bd_* del Excel a los snapshots columnares")
+    parser.add_argument("--excel", default=EXCEL_PATH, help="libro de Excel con las hojas de período")
+    parser.add_argument("--sheet", action="append", help=f"hoja a ingerir (por defecto todas las {PERIOD_PREFIX}*)")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR, help="carpeta de los snapshots")
+    parser.add_argument("--report", help="guardar el informe completo en este archivo JSON")
+    parser.add_argument("--force", action="store_true", help="releer las hojas aunque no hayan cambiado")
+    args = parser.parse_args(argv)
+
+    result = ingest(args.excel, args.sheet, args.snapshot_dir, force=args.force)
+    print_report(result)
+    if args.report:
+        write_json_atomic(args.report, result)
+    return 1 if any(report['status'] == 'error' for report in result['sheets']) else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Límites de los buckets (segundos para tiempos, filas y bytes para tamaños)
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Perfilado por petición (cabecera X-Profile: 1 o ?profile=1), solo si ENABLE_PROFILING=1
+PROFILING_ENABLED = os.environ.get("ENABLE_PROFILING") == "1"
+PROFILE_DIR = "data/cache/profiles"
+
+_context = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    # Métricas del proceso (cada worker de gunicorn expone las suyas, con la etiqueta worker)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = defaultdict(float)
+        self._help = {}
+        self._gauge_sources = []
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def gauges(self, source):
+        # source() devuelve [(nombre, etiquetas, valor)] al momento de exportar
+        self._gauge_sources.append(source)
+        return source
+
+    def render(self):
+        # Formato de texto de Prometheus
+        worker = str(os.getpid())
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, worker, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels, worker)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels, worker)} {histogram.count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels, worker)} {value}")
+        for source in self._gauge_sources:
+            for name, labels, value in source():
+                header(name, "gauge")
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())), worker)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, worker, **extra):
+    items = list(labels) + [('worker', worker)] + [(key, value) for key, value in extra.items()]
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+registry.describe("tasas_stage_seconds", "Duración de cada etapa (filter, aggregate, figure, serialize) por callback")
+registry.describe("tasas_callback_seconds", "Duración total de cada callback de Dash")
+registry.describe("tasas_rows", "Filas resultantes del filtrado por callback")
+registry.describe("tasas_http_request_seconds", "Duración de las peticiones HTTP por ruta")
+registry.describe("tasas_http_response_bytes", "Tamaño de las respuestas HTTP por ruta y callback")
+registry.describe("tasas_http_requests_total", "Peticiones HTTP por ruta y código de estado")
+
+
+def current_callback():
+    return getattr(_context, 'callback', None) or 'none'
+
+
+@contextmanager
+def stage(name):
+    # Medir una etapa dentro del callback en curso. Las etapas anidadas (p.ej. filter dentro de
+    # figure) se descuentan de la etapa que las contiene, así los tiempos por etapa suman el total
+    stack = getattr(_context, 'stages', None)
+    if stack is None:
+        stack = _context.stages = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        registry.observe("tasas_stage_seconds", elapsed - nested, callback=current_callback(), stage=name)
+
+
+def observe_rows(rows):
+    registry.observe("tasas_rows", rows, buckets=SIZE_BUCKETS, callback=current_callback())
+
+
+def instrument_callback(name):
+    # Decorador para callbacks de Dash: fija el nombre del callback para las etapas y mide el total
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = getattr(_context, 'callback', None)
+            _context.callback = name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.observe("tasas_callback_seconds", time.perf_counter() - start, callback=name)
+                _context.callback = previous
+        return wrapper
+    return decorator
+
+
+def bind_callback(func):
+    # Para ejecutar parte de un callback en otro hilo (p.ej. un pool) sin perder el nombre del
+    # callback en las etapas que se miden allí
+    name = getattr(_context, 'callback', None)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_context, 'callback', None)
+        _context.callback = name
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _context.callback = previous
+    return wrapper
+
+
+def _dash_callback_name():
+    # Para /_dash-update-component la salida del callback identifica cuál se ejecutó
+    if request.path.endswith("/_dash-update-component") and request.is_json:
+        body = request.get_json(silent=True) or {}
+        return str(body.get('output', '')).strip('.')[:120]
+    return ''
+
+
+def init_app(server):
+    # Registrar los hooks de Flask: tiempos y tamaños por ruta y perfilado opcional
+    @server.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.profiler = None
+        if PROFILING_ENABLED and (request.headers.get("X-Profile") == "1" or request.args.get("profile") == "1"):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @server.after_request
+    def _record(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        callback = _dash_callback_name()
+        elapsed = time.perf_counter() - getattr(g, 'metrics_start', time.perf_counter())
+        registry.observe("tasas_http_request_seconds", elapsed, route=route)
+        registry.inc("tasas_http_requests_total", route=route, status=response.status_code)
+        if not response.is_streamed:
+            registry.observe("tasas_http_response_bytes", response.calculate_content_length() or 0,
+                             buckets=SIZE_BUCKETS, route=route, callback=callback)
+        profiler = getattr(g, 'profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(profiler, callback or route, elapsed)
+        return response
+
+    return server
+
+
+def _dump_profile(profiler, label, elapsed):
+    # Resumen de cProfile (25 funciones con más tiempo acumulado) al log y a un archivo
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(25)
+    summary = out.getvalue()
+    logger.info("Perfil de %s (%.1f ms):\n%s", label, elapsed * 1000, summary)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in label)[:80]
+    path = os.path.join(PROFILE_DIR, f"{int(time.time())}_{safe_label}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({'label': label, 'elapsed_ms': elapsed * 1000}) + "\n" + summary)
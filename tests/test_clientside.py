@@ -0,0 +1,10 @@
+import shutil
+
+import pytest
+
+from benchmarks.check_clientside import check_all
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="requiere node")
+def test_clientside_matches_server():
+    assert check_all() == 0
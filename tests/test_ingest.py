@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from ingest import COLUMNS, count_duplicates, merge_rows, parse_money, parse_number, parse_rate
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1.234,5", 1234.5),
+    ("1,234.5", 1234.5),
+    ("1.500", 1500.0),
+    ("12.345.678", 12345678.0),
+    ("1,234,567.89", 1234567.89),
+    ("(1.234,50)", -1234.5),
+    ("0,065", 0.065),
+    ("0.065", 0.065),
+    ("1,5", 1.5),
+])
+def test_parse_number_grouped(text, expected):
+    assert parse_number(text, grouped=True) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text", ["1.23.4", "0.065.000", "01.234,5", "1.2345,6", "abc"])
+def test_parse_number_invalid(text):
+    with pytest.raises(ValueError):
+        parse_number(text, grouped=True)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$ 1.000", 1000.0),
+    ("$ 1.234.567", 1234567.0),
+    ("US$ 1,234,567.89", 1234567.89),
+    ("0,065", 0.065),
+    (1500, 1500.0),
+])
+def test_parse_money(value, expected):
+    assert parse_money(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("6,5%", 0.065),
+    ("6.5 %", 0.065),
+    ("0,065", 0.065),
+    ("0.065", 0.065),
+    (0.065, 0.065),
+])
+def test_parse_rate(value, expected):
+    assert parse_rate(value) == pytest.approx(expected)
+
+
+def test_parse_money_rejects_bool():
+    with pytest.raises(ValueError):
+        parse_money(True)
+
+
+def loans(*rows):
+    # Filas (acreedor, empresa, tasa, monto) con el resto de las columnas fijas
+    base = {column: "x" for column in COLUMNS}
+    return pd.DataFrame([{**base, 'Nombre Entidad Acreedora': bank, 'Empresa': company, 'Tasa Nominal': rate,
+                          'Total': amount} for bank, company, rate, amount in rows], columns=COLUMNS)
+
+
+def test_repeated_rows_are_kept():
+    df = loans(("A", "E1", 0.05, 100.0), ("A", "E1", 0.05, 100.0), ("B", "E2", 0.06, 50.0))
+    assert count_duplicates(df) == 1
+    report = {}
+    assert len(merge_rows(None, df, report)) == 3
+
+
+def test_merge_rows_classifies_changes():
+    existing = loans(("A", "E1", 0.05, 100.0), ("A", "E1", 0.05, 100.0), ("B", "E2", 0.06, 50.0),
+                     ("C", "E3", 0.07, 10.0))
+    incoming = loans(("A", "E1", 0.05, 100.0), ("A", "E1", 0.05, 100.0), ("B", "E2", 0.065, 50.0),
+                     ("D", "E4", 0.08, 20.0), ("D", "E4", 0.08, 20.0))
+    report = {}
+    merged = merge_rows(existing, incoming, report)
+    assert report == {'added': 2, 'changed': 1, 'removed': 1, 'unchanged': 2}
+    assert len(merged) == 5
+    assert merge_rows(existing, existing.copy(), {}) is None
@@ -0,0 +1,182 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import normalize_selection
+
+logger = logging.getLogger(__name__)
+
+# Registro de las selecciones de los dropdowns (una línea JSON por cambio), del que se sacan las
+# combinaciones más usadas para precalcular
+SELECTION_LOG_PATH = "data/cache/selections.log"
+SELECTION_LOG_MAX_BYTES = 2 * 1024 * 1024
+# Cada cuánto se escriben al archivo las selecciones acumuladas en memoria, y cuántas se guardan
+# como máximo entre escrituras (las más antiguas se descartan)
+SELECTION_LOG_FLUSH_SECONDS = 10
+SELECTION_LOG_MAX_PENDING = 10000
+
+
+class SelectionLog:
+    # record solo agrega la línea a un buffer en memoria (se llama en cada cambio de los dropdowns,
+    # dentro de la petición); un hilo la escribe cada flush_interval segundos. Las escrituras usan
+    # O_APPEND, por lo que varios workers pueden escribir en el mismo archivo sin mezclarse. Al
+    # superar max_bytes se rota a .1
+
+    def __init__(self, path=SELECTION_LOG_PATH, max_bytes=SELECTION_LOG_MAX_BYTES,
+                 flush_interval=SELECTION_LOG_FLUSH_SECONDS, max_pending=SELECTION_LOG_MAX_PENDING):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def record(self, selection, period):
+        empresas, sectores, bancos, plazos = normalize_selection(*selection)
+        line = json.dumps({'periodo': period, 'empresa': empresas, 'sector': sectores,
+                           'banco': bancos, 'plazo': plazos}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._pending.append(line)
+
+    def flush(self):
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+        if not lines:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+        except OSError:
+            logger.debug("No se pudieron registrar %d selecciones en %s", len(lines), self.path, exc_info=True)
+
+    def start(self):
+        # Como los demás hilos, se inicia en cada worker y no en el maestro de gunicorn --preload
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run, name="selection-log", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def popular(self, period, limit):
+        # Las selecciones más frecuentes del período (las del archivo rotado cuentan también)
+        self.flush()
+        counts = Counter()
+        for path in (f"{self.path}.1", self.path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if entry.get('periodo') == period:
+                            counts[normalize_selection(entry['empresa'], entry['sector'],
+                                                       entry['banco'], entry['plazo'])] += 1
+            except OSError:
+                continue
+        return [selection for selection, _ in counts.most_common(limit)]
+
+
+def load_selections(path):
+    # Lista fija de selecciones en JSON: [{"empresa": [...], "sector": [...], ...}, ...]
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [normalize_selection(entry.get('empresa'), entry.get('sector'), entry.get('banco'), entry.get('plazo'))
+            for entry in entries]
+
+
+def selections_for(dataset, extra=()):
+    # Selección vacía, cada empresa, cada sector y cada banco chileno por separado, más las
+    # combinaciones adicionales (sin repetir)
+    selections = [normalize_selection(None, None, None, None)]
+    selections += [normalize_selection([option['value']], None, None, None) for option in dataset.empresa_options]
+    selections += [normalize_selection(None, [option['value']], None, None) for option in dataset.sector_options]
+    selections += [normalize_selection(None, None, [option['value']], None) for option in dataset.banco_options]
+    selections += list(extra)
+    return list(dict.fromkeys(selections))
+
+
+class Warmer:
+    # Precalcula en segundo plano (pool de hilos) las salidas de los callbacks para las
+    # selecciones más probables, de modo que las primeras visitas tras un deploy, un reinicio o
+    # una recarga de datos encuentren las cachés llenas. tasks es {tipo: función(dataset, selección)}
+
+    def __init__(self, tasks, extra_selections=lambda dataset: [], max_workers=2):
+        self.tasks = dict(tasks)
+        self.extra_selections = extra_selections
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._thread = None
+        self._version = None
+        self._progress = {'state': 'idle'}
+
+    def start(self, dataset):
+        # No bloquea: lanza un hilo que reparte el trabajo en el pool. Si ya hay una pasada
+        # completa (o en curso) para esta versión no hace nada
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            if self._version == dataset.version and (running or self._progress.get('state') == 'done'):
+                return
+            self._version = dataset.version
+            self._thread = threading.Thread(target=self._run, args=(dataset,), name="cache-warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self, dataset):
+        selections = selections_for(dataset, self.extra_selections(dataset))
+        jobs = [(kind, selection) for selection in selections for kind in self.tasks]
+        progress = {
+            'state': 'running', 'data_version': dataset.version, 'selections': len(selections),
+            'total': len(jobs), 'done': 0, 'failed': 0, 'started_at': time.time(), 'elapsed_s': 0.0,
+            'seconds_by_kind': dict.fromkeys(self.tasks, 0.0),
+        }
+        with self._lock:
+            self._progress = progress
+        logger.info("Precalculando %d salidas (%d selecciones) de la versión %s",
+                    len(jobs), len(selections), dataset.version)
+
+        def run_job(job):
+            kind, selection = job
+            start = time.perf_counter()
+            try:
+                self.tasks[kind](dataset, selection)
+                failed = False
+            except Exception:  # Selecciones sin datos (p.ej. KPIs sin bancos) no detienen el resto
+                logger.debug("Precálculo de %s %s falló", kind, selection, exc_info=True)
+                failed = True
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                progress['done'] += 1
+                progress['failed'] += failed
+                progress['seconds_by_kind'][kind] += elapsed
+                progress['elapsed_s'] = time.time() - progress['started_at']
+                done = progress['done']
+            if done % max(1, len(jobs) // 10) == 0:
+                logger.info("Precálculo %d/%d (%.1f s)", done, len(jobs), progress['elapsed_s'])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cache-warmup") as pool:
+            list(pool.map(run_job, jobs))
+
+        with self._lock:
+            progress['state'] = 'done'
+            progress['elapsed_s'] = time.time() - progress['started_at']
+        logger.info("Precálculo terminado: %d salidas en %.1f s (%d fallidas)",
+                    progress['done'], progress['elapsed_s'], progress['failed'])
+
+    def status(self):
+        with self._lock:
+            return json.loads(json.dumps(self._progress))